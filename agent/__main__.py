@@ -0,0 +1,6 @@
+import sys
+
+from agent import cli
+
+
+sys.exit(cli.main())
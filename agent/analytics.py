@@ -0,0 +1,99 @@
+"""Online traffic & lifespan analytics, without keeping agent histories.
+
+A TrafficAnalytics counts the visits to every cell (one scatter add of the
+agent positions per round) & the birth & death round of every agent slot,
+with a running histogram of the lifespans of dead agents. Counts can be
+exported as arrays or images (see viz) every N rounds.
+"""
+import os
+
+import numpy as np
+
+
+TRAFFIC_NAME = 'traffic_{:06d}'  # numbered by round, .npy & .png
+LIFESPANS_NAME = 'lifespans_{:06d}'
+
+ALIVE = -1  # death round of live agents
+UNTRACKED = -2  # death round of agents which died before tracking started
+
+
+class TrafficAnalytics(object):
+    """Cell visit counts & agent lifespans for a grid shape, accumulated as
+    the simulation runs."""
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        self.visits = np.zeros(self.shape, dtype=np.int32)
+        self.birth = np.zeros(0, dtype=np.int64)  # round by slot
+        self.death = np.zeros(0, dtype=np.int64)  # round by slot, or ALIVE/UNTRACKED
+        self._lifespans = np.zeros(1, dtype=np.int64)  # dead agents per lifespan
+
+    def add_agents(self, _round, count):
+        """Start tracking count new agent slots, born in _round."""
+        self.birth = np.concatenate((self.birth, np.full(count, _round, dtype=np.int64)))
+        self.death = np.concatenate((self.death, np.full(count, ALIVE, dtype=np.int64)))
+
+    def untrack(self, slots):
+        """Leave slots of agents which died before tracking started out of
+        the lifespans."""
+        self.death[slots] = UNTRACKED
+
+    def record_round(self, ys, xs):
+        """Count a visit to the cells at coord arrays ys & xs."""
+        flat = ys * self.shape[1] + xs
+        # the typed scalar keeps add.at on its fast path
+        np.add.at(self.visits.reshape(-1), flat, np.int32(1))
+
+    def record_deaths(self, _round, slots):
+        # agents dead on arrival live for 0 rounds
+        slots = np.asarray(slots, dtype=np.intp)
+        self.death[slots] = np.maximum(_round, self.birth[slots])
+        lifespans = self.death[slots] - self.birth[slots]
+        top = int(lifespans.max(initial=0)) + 1
+        if top > len(self._lifespans):
+            grown = np.zeros(max(top, 2 * len(self._lifespans)), dtype=np.int64)
+            grown[:len(self._lifespans)] = self._lifespans
+            self._lifespans = grown
+        np.add.at(self._lifespans, lifespans, 1)
+
+    @property
+    def num_dead(self):
+        return int(self._lifespans.sum())
+
+    def lifespans(self):
+        """Returns the lifespans of dead agents, in slot order."""
+        dead = self.death >= 0
+        return self.death[dead] - self.birth[dead]
+
+    def lifespan_histogram(self):
+        """Returns the number of dead agents by lifespan in rounds, up to the
+        longest lifespan."""
+        used = np.flatnonzero(self._lifespans)
+        return self._lifespans[:used[-1] + 1 if len(used) else 1].copy()
+
+    def ages(self, _round):
+        """Returns the ages of live agents at _round, in slot order."""
+        return _round - self.birth[self.death == ALIVE]
+
+    def export(self, _dir, _round, scale=1):
+        """Save the visit counts & lifespan histogram as .npy arrays & .png
+        images in _dir, named by round."""
+        from agent import viz  # PIL is only needed for exports
+        for name, counts, image in ((TRAFFIC_NAME, self.visits, viz.heatmap),
+                                    (LIFESPANS_NAME, self.lifespan_histogram(), viz.bar_chart)):
+            path = os.path.join(_dir, name.format(_round))
+            np.save(path + '.npy', counts)
+            viz.save_image(image(counts), path + '.png', scale)
+
+    def state(self):
+        return {'visits': self.visits, 'birth': self.birth, 'death': self.death,
+                'lifespans': self._lifespans}
+
+    @classmethod
+    def from_state(cls, state):
+        analytics = cls(state['visits'].shape)
+        analytics.visits = np.array(state['visits'])
+        analytics.birth = np.array(state['birth'])
+        analytics.death = np.array(state['death'])
+        analytics._lifespans = np.array(state['lifespans'])
+        return analytics
@@ -1,14 +1,26 @@
 import os
 import sys
 import copy
+import json
+import time
 import random
 from datetime import datetime
 
 import numpy as np
 
-from agent import viz
-from agent.components import Grid, adjacent_coords
+from agent import profiling
+from agent import stats
+from agent import navigation
+from agent.components import Grid, LayeredGrid, OccupancyGrid, SummedAreaTable, adjacent_coords
+from agent.components import view_wedge_sums
 from agent.components import NODATA, Y_OFFSETS, X_OFFSETS
+from agent.history import TrajectoryStore, FULL, parse_level
+from agent.population import AgentPopulation, NOWHERE, visible_targets, resolve_conflicts
+from agent.population import move_directions, STEP_YS, STEP_XS
+
+# modules for optional features (analytics, checkpoint, recording, runlog,
+# tiled & viz, which pulls in PIL) are imported when first used, so headless
+# runs start quickly
 
 # Start with simple rules
 # agents move one cell at a time
@@ -29,53 +41,311 @@ from agent.components import NODATA, Y_OFFSETS, X_OFFSETS
 # TODO: allow agents to go uphill to spot food/water, then search for it
 #       (have them retain memory for N locations of interest)
 # TODO: could also have agents start/return to home base (daily simulation)
-# TODO: vision: build a 2-3 cell radius algorithm (check PCTL?)
 
 class BasicWorld(object):
 
-    def __init__(self, food_grid):
-        # grids for current food state & original state (for energy respawn)
-        self.food_grid = food_grid
-        self.orig_food_grid = copy.deepcopy(food_grid)
+    def __init__(self, food_grid, recovery_rate=1, recovery_delay=0,
+                 food_dtype=None, layers=()):
+        # current food state, original state (for energy respawn) & any extra
+        # (name, dtype) layers share one LayeredGrid, the food grids are views
+        food_dtype = food_dtype if food_dtype else food_grid.dtype
+        layers = (('food', food_dtype), ('orig_food', food_dtype)) + tuple(layers)
+        self.layers = LayeredGrid(*food_grid.shape, layers=layers,
+                                  border=food_grid.border_size)
+
+        self.food_grid = self.layers['food']
+        self.orig_food_grid = self.layers['orig_food']
+        self.food_grid[:, :] = food_grid[:, :]
+        self.orig_food_grid[:, :] = food_grid[:, :]
+
+        # recovery settings are a scalar or an array/grid of per cell values
+        # rate = energy regained per round, delay = rounds before regrowth starts
+        self.recovery_rate = recovery_rate
+        self.recovery_delay = recovery_delay
+
+        # dirty tracking: only cells harvested since the last round, or still
+        # recovering, are visited in on_end_round()
+        self._harvested = []
+        self._harvested_many = []  # (ys, xs) arrays from harvest_many()
+        self._ys = np.zeros(0, dtype=np.intp)
+        self._xs = np.zeros(0, dtype=np.intp)
+        self._wait = np.zeros(0, dtype=np.intp)  # rounds left before regrowth
+        self._synced = False
+
+        # optional log of changed cells, for run logs & recordings
+        self.track_changes = False
+        self._changes = []
+
+        self.food_sums = None  # see track_sums()
+
+    def set_border(self, border):
+        """Widen the grid borders to fit agent views of size border."""
+        if border <= self.layers.border_size:
+            return
+
+        self.layers = self.layers.with_border(border)
+        self.food_grid = self.layers['food']
+        self.orig_food_grid = self.layers['orig_food']
+        if self.food_sums is not None:
+            self.track_sums(self.food_sums.tile_size)
+
+    def track_sums(self, tile_size=64):
+        """Keep summed area tables of the food grid in food_sums, for O(1)
+        sums of food in view. The cells harvested & regrown each round are
+        patched in by on_end_round() & refresh_sums().
+
+        Edits made to food_grid directly need a food_sums.rebuild().
+        """
+        self.food_sums = SummedAreaTable(self.food_grid, tile_size=tile_size)
+
+    def refresh_sums(self):
+        """Bring food_sums up to date with any harvests since the last round,
+        returns the number of tables redone."""
+        if self._harvested or self._harvested_many:
+            self.food_sums.mark(*self._harvested_cells())
+        return self.food_sums.refresh()
+
+    def state(self):
+        """Returns a dict of arrays holding the world, for checkpoints."""
+        harvested = np.array(self._harvested_cells()).T
+        return {'cells': self.layers._cells, 'border': np.array(self.layers.border_size),
+                'ys': self._ys, 'xs': self._xs, 'wait': self._wait, 'harvested': harvested,
+                'synced': np.array(self._synced), 'track_changes': np.array(self.track_changes),
+                'recovery_rate': _setting_array(self.recovery_rate),
+                'recovery_delay': _setting_array(self.recovery_delay)}
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a world from state() arrays, the grids aren't copied."""
+        world = cls.__new__(cls)
+        world.layers = LayeredGrid.wrap(state['cells'], int(state['border']))
+        world.food_grid = world.layers['food']
+        world.orig_food_grid = world.layers['orig_food']
+        world.recovery_rate = _setting_value(state['recovery_rate'])
+        world.recovery_delay = _setting_value(state['recovery_delay'])
+
+        world._harvested = []
+        world._harvested_many = [tuple(np.array(state['harvested']).T)]
+        world._ys, world._xs = np.array(state['ys']), np.array(state['xs'])
+        world._wait = np.array(state['wait'])
+        world._synced = bool(state['synced'])
+        world.track_changes = bool(state['track_changes'])
+        world._changes = []
+        world.food_sums = None
+        return world
 
     def harvest(self, coords, post_harvest=-1):
         """Harvests and returns the energy from a cell."""
-        energy = self.food_grid[coords]
+        energy = int(self.food_grid[coords])
 
         if energy > 0:
             self.food_grid[coords] = post_harvest
+            self._harvested.append(coords)
             return energy
 
         return 0  # harvest nothing
 
-    # TODO: figure out the coord problems with testing grids with where()
-    def on_end_round(self, recovery_rate=1):
-        # allow energy cells to recover slowly
-        # TODO: row by row until the grid based where() bug is solved
-        for r0, r1 in zip(self.food_grid, self.orig_food_grid):
-            changed = np.where(r0 != r1)
-            r0[changed] += recovery_rate
+    def harvest_many(self, ys, xs, post_harvest=-1):
+        """Vectorised harvest() of the cells at coord arrays ys & xs, returns
+        the energy taken for each. Where a cell is listed more than once, the
+        first takes all the energy."""
+        ys, xs = np.asarray(ys, dtype=np.intp), np.asarray(xs, dtype=np.intp)
+        energy = harvest_cells(self.food_grid, ys, xs, post_harvest)
+        taken = np.flatnonzero(energy)
+        self._harvested_many.append((ys[taken], xs[taken]))
+        return energy
+
+    def _harvested_cells(self):
+        """Returns (ys, xs) of the cells harvested since the last round."""
+        parts = list(self._harvested_many)
+        if self._harvested:
+            parts.append(np.array(self._harvested, dtype=np.intp).reshape(-1, 2).T)
+        if not parts:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        return np.concatenate([ys for ys, _ in parts]), np.concatenate([xs for _, xs in parts])
+
+    @property
+    def num_recovering(self):
+        """Number of cells currently tracked for regrowth."""
+        return (len(self._ys) + len(self._harvested) +
+                sum(len(ys) for ys, _ in self._harvested_many))
+
+    def rescan(self):
+        """Track every cell differing from the original grid for regrowth.
+
+        A full grid pass, needed only when food_grid is edited directly rather
+        than through harvest(). Runs automatically before the first regrowth.
+        """
+        ys, xs = np.nonzero(self.food_grid[:, :] != self.orig_food_grid[:, :])
+        self._track(ys, xs, delay=0)
+        self._synced = True
+
+    def _track(self, ys, xs, delay):
+        """Add cells to the recovery queue, replacing any existing entries."""
+        if not len(ys):
+            return
+
+        nrows, ncols = self.food_grid.shape
+        flat = ys * ncols + xs
+        tracked = self._ys * ncols + self._xs
+        if 64 * (len(flat) + len(tracked)) > nrows * ncols:
+            # with much of the grid queued, marking cells beats sorting them
+            marked = np.zeros(nrows * ncols, dtype=bool)
+            marked[flat] = True
+            keep = ~marked[tracked]
+            flat = np.flatnonzero(marked)
+        else:
+            flat = np.unique(flat)
+            keep = ~np.isin(tracked, flat)
+        ys, xs = np.divmod(flat, ncols)
+        wait = self._per_cell(delay, ys, xs)
+
+        self._ys = np.concatenate((self._ys[keep], ys))
+        self._xs = np.concatenate((self._xs[keep], xs))
+        self._wait = np.concatenate((self._wait[keep], np.broadcast_to(wait, ys.shape)))
+
+    @staticmethod
+    def _per_cell(setting, ys, xs):
+        if isinstance(setting, Grid):
+            return setting.get_many(ys, xs)
+        if np.ndim(setting):
+            return np.asarray(setting)[ys, xs]
+        return setting
+
+    def pop_changes(self):
+        """Returns (ys, xs) of cells changed since the last call, when
+        track_changes is set."""
+        changes = self._changes
+        if self._harvested or self._harvested_many:
+            changes.append(self._harvested_cells())
+        self._changes = []
+
+        if not changes:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+
+        ncols = self.food_grid.ncols
+        flat = np.unique(np.concatenate([ys * ncols + xs for ys, xs in changes]))
+        return np.divmod(flat, ncols)
+
+    def on_end_round(self, recovery_rate=None):
+        """Allow harvested energy cells to recover slowly.
+
+        Cost is proportional to the number of recovering cells, not the grid.
+        """
+        if not self._synced:
+            self.rescan()
+
+        if self._harvested or self._harvested_many:
+            ys, xs = self._harvested_cells()
+            self._harvested, self._harvested_many = [], []
+            self._track(ys, xs, self.recovery_delay)
+            if self.track_changes:
+                self._changes.append((ys, xs))
+            if self.food_sums is not None:
+                self.food_sums.mark(ys, xs)
+
+        if not len(self._ys):
+            return
+
+        if recovery_rate is None:
+            recovery_rate = self.recovery_rate
+
+        waiting = self._wait > 0
+        self._wait[waiting] -= 1
+        ys, xs = self._ys[~waiting], self._xs[~waiting]
+
+        growing, recovered = regrow_cells(self.food_grid, self.orig_food_grid, ys, xs,
+                                          self._per_cell(recovery_rate, ys, xs))
+        if self.track_changes:
+            self._changes.append((ys[growing], xs[growing]))
+        if self.food_sums is not None:
+            self.food_sums.mark(ys[growing], xs[growing])
+
+        # drop cells which have fully recovered
+        done = np.zeros(len(self._ys), dtype=bool)
+        done[~waiting] = recovered
+        self._ys, self._xs, self._wait = self._ys[~done], self._xs[~done], self._wait[~done]
+
+
+def harvest_cells(food_grid, ys, xs, post_harvest=-1):
+    """Take the energy of the cells at coord arrays ys & xs, returns the
+    energy taken for each. Where a cell is listed more than once, the first
+    takes all the energy."""
+    energy = food_grid.get_many(ys, xs).astype(np.int64)
+
+    first = np.zeros(len(ys), dtype=bool)
+    first[np.unique(ys * food_grid.ncols + xs, return_index=True)[1]] = True
+    energy[~first | (energy < 0)] = 0
+
+    taken = np.flatnonzero(energy)
+    food_grid.set_many(ys[taken], xs[taken], post_harvest)
+    return energy
+
+
+def regrow_cells(food_grid, orig_grid, ys, xs, rate):
+    """Regrow the cells at coord arrays ys & xs by rate, up to their original
+    food. Returns bool arrays of the cells growing & those fully recovered."""
+    current = food_grid.get_many(ys, xs).astype(np.int64)
+    orig = orig_grid.get_many(ys, xs).astype(np.int64)
+    growing = current < orig
+    food_grid.set_many(ys, xs, np.where(growing, np.minimum(current + rate, orig), current))
+    return growing, food_grid.get_many(ys, xs) >= orig
+
+
+def _setting_array(setting):
+    # recovery settings are scalars, arrays or grids of per cell values
+    return np.asarray(setting[:, :] if isinstance(setting, Grid) else setting)
+
+
+def _setting_value(array):
+    return array if array.ndim else array.item()
+
+
+def _population_field(name):
+    """Property reading/writing one field of the agent's population slot."""
+    def fget(self):
+        return self._population.get(name, self._slot)
+
+    def fset(self, value):
+        self._population.set(name, self._slot, value)
+
+    return property(fget, fset)
+
+
+def _stats_series(name):
+    """Property reading the values of one stats metric kept so far."""
+    def fget(self):
+        return self.stats.series.get(name, [])
+
+    return property(fget)
 
 
 class BasicAgent(object):
-    """Simple agent with basic stats."""
+    """Simple agent with basic stats.
+
+    The agent state lives in one slot of an AgentPopulation, this object is a
+    thin view onto it. Standalone agents get a private single slot population,
+    a Simulation rebinds its agents to one shared population.
+    """
+
+    # vision = number of cells the agent can see in all dirs
+    # metabolism = rate at which energy is used per turn
+    # init_* = historical record
+    id = _population_field('id')
+    vision = _population_field('vision')
+    metabolism = _population_field('metabolism')
+    init_metabolism = _population_field('init_metabolism')
+    init_energy = _population_field('init_energy')
 
     # TODO: add death after x number of turns?
     def __init__(self, _id, vision, metabolism, energy, coords=None):
-        # vision = number of cells the agent can see in all dirs
-        # metabolism = rate at which energy is used per turn
         # energy = current stock of food
+        population = AgentPopulation(capacity=1)
+        slot = population.append(_id, vision, metabolism, energy, coords)
+        self._bind(population, slot)
 
-        self.id = _id
-        self.vision = vision
-        self.metabolism = metabolism
-        self.init_metabolism = metabolism  # historical record
-        self._energy = energy
-        self.init_energy = energy  # historical record
-        self._coords = coords
-
-        self.move_history = [coords] if coords else []
-        self.harvest_history = []
+        if coords:
+            population.history.record_move(slot, coords)
         self.last_view = None  # snapshot of area at final turn
 
     def __str__(self):
@@ -94,45 +364,90 @@ class BasicAgent(object):
 
     @property
     def energy(self):
-        return self._energy
+        return self._population.get('energy', self._slot)
 
     @energy.setter
     def energy(self, value):
-        prev = self._energy
-        self._energy = value
-        self.harvest_history.append(value - prev)
+        prev = self.energy
+        self._population.set('energy', self._slot, value)
+        self._population.history.record_harvest(self._slot, value - prev)
+        self._check_death(prev)
+
+    def _check_death(self, prev):
+        # tell the simulation (if any) straight away, so the agent leaves the
+        # live agents & its cell
+        if prev > 0 >= self.energy and self._population.on_death is not None:
+            self._population.on_death(self._slot)
+
+    @property
+    def move_history(self):
+        return self._population.history.moves(self._slot)
+
+    @property
+    def harvest_history(self):
+        return self._population.history.harvests(self._slot)
 
     @property
     def coords(self):
-        return self._coords
+        return self._population.coords(self._slot)
 
     @coords.setter
     def coords(self, coords):
-        if self._coords:
-            self.move_history.append(coords)
-        self._coords = coords
+        prev = self.coords
+        if prev:
+            self._population.history.record_move(self._slot, coords)
+        if self._occupancy is not None and self.is_alive():
+            self._occupancy.move(self._slot, prev, coords)
+        self._population.set_coords(self._slot, coords)
+
+    @classmethod
+    def view(cls, population, slot, occupancy=None):
+        """Returns an agent object for a population slot, without adding it
+        to the spatial index (unlike _bind())."""
+        agent = cls.__new__(cls)
+        agent._population = population
+        agent._slot = slot
+        agent._occupancy = occupancy
+        agent.last_view = None
+        return agent
+
+    def _bind(self, population, slot, occupancy=None):
+        """Make the agent a view of a population slot, registering it in a
+        simulation's spatial index (if given) under the same slot id."""
+        self._population = population
+        self._slot = slot
+        self._occupancy = occupancy
+
+        coords = self.coords
+        if occupancy is not None and coords and self.is_alive():
+            occupancy.add(slot, coords)
 
     def on_end_turn(self):
         """Callback to handle changes to the agent at the end of each turn."""
-        self._energy -= self.metabolism
-
-    def next_move(self, view, adj_agents=None):
-        """Simulates simple searching behaviour by an agent, simply looking for
-        the most productive cell in the adjacent cells."""
+        prev = self.energy
+        self._population.set('energy', self._slot, prev - self.metabolism)
+        self._check_death(prev)
+
+    def next_move(self, view, adj_agents=None, flow=None, wedges=False):
+        """Simulates simple searching behaviour by an agent, looking for the
+        most productive adjacent cell, then for food further out in the view
+        (the best cell, or with wedges the wedge of the view holding the most
+        food), then following the flow field (a navigation.FlowField) if
+        given."""
         best = NODATA
         best_coord = None
         y, x = self.coords
+        c = view.shape[0] // 2  # agent is at the centre of the view
         adj_energy = {}  # cache energy data for possible later search
 
         # scan around the *local* view looking for energy and agents
         # TODO: loop approach is clockwise, which biases agent search & move to
         #       same default every time. Can tweak/make search patterns different
-        #       by agent. ALT: add proximity/vision search to automatically go
-        #       for the weighted best looking area
+        #       by agent.
         #
         # TODO: look at pushing decision process out to a navigation module?
         #       Could add pluggable nav behaviour/different for each agent
-        for d, adj_coord in enumerate(adjacent_coords((1,1))):
+        for d, adj_coord in enumerate(adjacent_coords((c, c))):
             if adj_agents:
                 if adj_agents.get(d):
                     continue  # skip cells occupied by other agents
@@ -148,9 +463,31 @@ class BasicAgent(object):
                 # cache NODATA cells to prevent illegal agent moves
                 adj_energy[d] = NODATA
 
-        return best_coord if best_coord else self._search_direction(adj_energy)
+        if best_coord:
+            return best_coord
+
+        if c > 1:
+            if wedges:
+                # head into the wedge with the most food, the first clockwise on ties
+                sums = view_wedge_sums(view)
+                d = int(sums.argmax())
+                found = sums[d] > 0
+            else:
+                # head for the best food cell visible beyond the adjacent cells
+                found, direction = visible_targets(view[np.newaxis])
+                found, d = found[0], int(direction[0])
+            if found and adj_energy.get(d) != NODATA and not (adj_agents and adj_agents.get(d)):
+                return (y + Y_OFFSETS[d], x + X_OFFSETS[d])
+
+        if flow is not None:
+            blocked = [d for d in range(8) if adj_agents and adj_agents.get(d)]
+            d = flow.direction((y, x), blocked)
+            if d is not None:
+                return (y + Y_OFFSETS[d], x + X_OFFSETS[d])
 
-    def _search_direction(self, adj_energy):
+        return self._search_direction(adj_energy, wait=flow is not None)
+
+    def _search_direction(self, adj_energy, wait=False):
         # no energy nearby, so move in first possible direction using id as seed
         # won't always work well as some agents will run around borders
         # TODO: better deterministic search algorithm
@@ -164,110 +501,623 @@ class BasicAgent(object):
             else:
                 direction += 1
 
-        # HACK: as final option, have agent not move/wait for energy respawn?
-        # return self.coords
+        # boxed in by NODATA, flow field navigation waits for regrowth
+        if wait:
+            return self.coords
         raise NotImplementedError('Add better search algorithm')
 
 
-# TODO: supply dict to allow runtime settings to be tweaked
-# eg. post harvest cell recovery time
-class Simulation(object):
+# UPDATE modes, agents move one by one or all at once
+SEQUENTIAL = 'sequential'
+SYNCHRONOUS = 'synchronous'
 
-    def __init__(self, food_grid, agents, config=None):
-        self.world = BasicWorld(food_grid)
-        self.agents = agents
-        self.config = config if config else {}
+# CONFLICT rules for synchronous moves to the same cell
+CONFLICT_RULES = ('order', 'energy', 'random')
 
-        # stats
-        self.final_round = None
-        self.average_energy = []
-        self.average_metabolism = []
-        self.num_dead_agents = []
+# NAVIGATION modes for agents with no food in sight
+NAVIGATION_MODES = ('search', 'flow', 'wedge')
 
-        # viz coroutine
-        # TODO: coroutine decorator?
-        _dir = self.config.get('VIZ_OUTPUT_DIR')
-        if _dir:
-            self.take_snapshot = viz.snapshot_image(self.world.food_grid, _dir, scale=10)
-            self.take_snapshot.__next__()
+# output settings which forks don't inherit
+FORK_DROPPED = ('VIZ_OUTPUT_DIR', 'VIZ_RECORDING', 'ANALYTICS_DIR', 'STATS_SINK')
 
-    def run(self, num_rounds):
-        for n in range(num_rounds):
-            if not(self.do_round()):
-                self.final_round = n+1
-                return
 
-        self.final_round = num_rounds
-        return
+class AgentViews(object):
+    """Sequence of BasicAgent views of a population, made on first access.
 
-    def do_round(self):
-        """Run a single round or timestep of the simulation."""
-        living_agents = self.live_agents
+    Lets simulations of millions of agents skip building agent objects.
+    """
 
-        for a in living_agents:
-            view = self.world.food_grid.view(*a.coords, size=1)
-            adj_agents = self.adjacent_agents(a)
-            next_coord = a.next_move(view, adj_agents)
+    def __init__(self, population, occupancy=None):
+        self._population = population
+        self._occupancy = occupancy
+        self._views = {}
 
-            if next_coord == a.coords:  # agent is stuck/waiting
-                assert self.world.food_grid[next_coord] == 0
+    def __len__(self):
+        return len(self._population)
 
-            a.coords = next_coord
-            a.energy += self.world.harvest(next_coord)  # TODO: add recovery time setting
-            a.on_end_turn()
+    def __getitem__(self, slot):
+        if isinstance(slot, slice):
+            return [self[i] for i in range(*slot.indices(len(self)))]
 
-            if a.is_dead():
-                # cache view where the agent died for reference
-                data = copy.copy(self.world.food_grid.view(*a.coords, size=1))
-                a.last_view = data
+        if slot < 0:
+            slot += len(self)
+        if not 0 <= slot < len(self):
+            raise IndexError('Agent index out of range')
+
+        agent = self._views.get(slot)
+        if agent is None:
+            agent = BasicAgent.view(self._population, slot, self._occupancy)
+            self._views[slot] = agent
+        return agent
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+
+class Simulation(object):
 
-        if hasattr(self, 'take_snapshot'):
+    def __init__(self, food_grid, agents, config=None):
+        # config allows runtime settings to be tweaked, eg. post harvest cell
+        # recovery with RECOVERY_RATE & RECOVERY_DELAY, HISTORY recording level
+        self.config = config if config else {}
+        rate = config_value(self.config.get('RECOVERY_RATE', 1))
+        delay = config_value(self.config.get('RECOVERY_DELAY', 0))
+        food_dtype = self.config.get('FOOD_DTYPE')  # eg. int16 for food > 127
+        self.world = BasicWorld(food_grid, recovery_rate=rate, recovery_delay=delay,
+                                food_dtype=np.dtype(food_dtype) if food_dtype else None)
+        self.round = 0  # number of rounds started
+        self.agents = agents  # also builds the population & spatial index
+
+        self.final_round = None
+        self._init_stats()
+        self._init_stepping()
+        self._init_outputs()
+
+    def _init_stats(self, append=False):
+        # stats are sampled every STATS_INTERVAL rounds, STATS_METRICS picks
+        # stats.STANDARD_METRICS by name (comma separated) & STATS_SINK streams
+        # each sample to a .csv or .ndjson file, in place of keeping them in
+        # memory unless STATS_KEEP is set. The file is started afresh, unless
+        # appending to it for a restored run
+        names = self.config.get('STATS_METRICS', stats.DEFAULT_METRICS)
+        if isinstance(names, str):
+            names = [n.strip() for n in names.split(',') if n.strip()]
+        path = self.config.get('STATS_SINK')
+        keep = config_value(self.config.get('STATS_KEEP', 0 if path else 1))
+        self.stats = stats.StatsEngine.standard(
+            names, interval=config_value(self.config.get('STATS_INTERVAL', 1)),
+            sink=stats.open_sink(path, append) if path else None, keep=bool(keep))
+
+    def _init_stepping(self):
+        # UPDATE=synchronous has every agent decide from the state at the start
+        # of the round, with CONFLICT (order, energy or random, seeded by
+        # CONFLICT_SEED) settling agents moving to the same cell. TILES (eg. 4
+        # or 2x2) also spreads the moves, harvests & regrowth of each tile over
+        # TILE_WORKERS processes (see tiled), it implies UPDATE=synchronous &
+        # can't be used with sequential updates.
+        # NAVIGATION=flow has agents with no food in sight follow a shared
+        # flow field to the nearest food, rather than an id seeded search.
+        # NAVIGATION=wedge has agents head into the wedge of their view with
+        # the most food, summed from the world's summed area tables.
+        tiles = self.config.get('TILES')
+        update = self.config.get('UPDATE', SYNCHRONOUS if tiles else SEQUENTIAL)
+        if update not in (SEQUENTIAL, SYNCHRONOUS):
+            raise ValueError('Unknown UPDATE mode: {}'.format(update))
+        if tiles and update != SYNCHRONOUS:
+            raise ValueError('TILES needs UPDATE={}, got {}'.format(SYNCHRONOUS, update))
+        conflict = self.config.get('CONFLICT', 'order')
+        if conflict not in CONFLICT_RULES:
+            raise ValueError('Unknown CONFLICT rule: {}'.format(conflict))
+
+        nav = self.config.get('NAVIGATION', 'search')
+        if nav not in NAVIGATION_MODES:
+            raise ValueError('Unknown NAVIGATION mode: {}'.format(nav))
+        self.flow = navigation.FlowField() if nav == 'flow' else None
+        self.wedges = nav == 'wedge'
+        if self.wedges and not tiles:
+            self.world.track_sums()  # tiles sum their own windows
+
+        self.stepper = None
+        if tiles:
+            from agent import tiled
+            workers = self.config.get('TILE_WORKERS')
+            self.stepper = tiled.TiledStepper(tiled.parse_tiles(tiles),
+                                              None if workers is None else config_value(workers))
+
+        self.synchronous = update == SYNCHRONOUS
+        self.conflict = conflict
+        seed = config_value(self.config.get('CONFLICT_SEED', 0))
+        self._conflict_rng = np.random.default_rng(seed)
+
+    def close(self):
+        """Stop any worker processes, free shared memory & close the stats
+        sink & snapshot writer. Memory tracing of PROFILE=memory stops."""
+        if self.stepper:
+            self.stepper.close()
+        if self.snapshots:
+            self.snapshots.close()
+        self.stats.close()
+        self.profiler.close()
+
+    def _init_outputs(self):
+        # viz, images are saved in the background, VIZ_STRIDE keeps every Nth
+        # frame & VIZ_MAX_IN_FLIGHT caps the frames waiting to be saved
+        self.snapshots = None
+        _dir = self.config.get('VIZ_OUTPUT_DIR')
+        if _dir:
+            from agent import viz
+            stride = config_value(self.config.get('VIZ_STRIDE', 1))
+            workers = config_value(self.config.get('VIZ_WORKERS', 2))
+            max_in_flight = config_value(self.config.get('VIZ_MAX_IN_FLIGHT', 8))
+            self.snapshots = viz.SnapshotWriter(_dir, scale=10, stride=stride, workers=workers,
+                                                max_in_flight=max_in_flight)
+
+        # PROFILE times each phase of do_round(), PROFILE=memory also traces
+        # memory growth, see sim.profiler.report()
+        mode = self.config.get('PROFILE')
+        if mode and mode not in ('0', 'off'):
+            self.profiler = profiling.PhaseProfiler(trace_memory=(mode == 'memory'))
+        else:
+            self.profiler = profiling.NULL_PROFILER
+
+        # VIZ_RECORDING saves a compact recording to replay as images later
+        path = self.config.get('VIZ_RECORDING')
+        self.recorder = None
+        if path:
+            from agent import recording
+            self.recorder = recording.FrameRecorder(path)
+        self._changes_round = None
+
+        # ANALYTICS_DIR saves the traffic & lifespan analytics every
+        # ANALYTICS_STRIDE rounds
+        self.analytics_dir = self.config.get('ANALYTICS_DIR')
+        self.analytics_stride = config_value(self.config.get('ANALYTICS_STRIDE', 100))
+
+    def run(self, num_rounds, log=None):
+        """Run the simulation, optionally writing each round to a run log
+        (see runlog.RunLogWriter)."""
+        if log is not None and not log.started:
+            log.write_header(self)
+        if self.recorder and not self.recorder.started:
+            self.recorder.start(self)
+
+        try:
+            for n in range(num_rounds):
+                alive = self.do_round()
+                if log is not None:
+                    log.write_round(self)
+
+                if not alive:
+                    self.final_round = n+1
+                    return
+
+            self.final_round = num_rounds
+        finally:
+            if self.snapshots:
+                self.snapshots.flush()  # images are all saved when run returns
+            if self.recorder:
+                self.recorder.save()
+
+    def do_round(self):
+        """Run a single round or timestep of the simulation."""
+        self.round += 1
+        pop = self.population
+        history = pop.history
+        history.round = self.round
+        food_grid = self.world.food_grid
+        slots = self._live_slots
+
+        prof = self.profiler
+        prof.start_round()
+
+        if self.flow is not None:
+            with prof.phase('navigate'):
+                self.flow.update(food_grid)
+        if self.world.food_sums is not None:
+            with prof.phase('navigate'):
+                self.world.refresh_sums()
+
+        if self.synchronous:
+            harvests, died = self._step_synchronous(slots)
+        else:
+            harvests, died = self._step_sequential(slots)
+
+        with prof.phase('history'):
+            history.record_moves(slots, pop.y[slots], pop.x[slots])
+            history.record_harvests(slots, harvests)
+
+        if self.analytics is not None:
+            with prof.phase('analytics'):
+                self.analytics.record_round(pop.y[slots], pop.x[slots])
+
+        if died:
+            self._record_deaths(died)
+
+        if self.snapshots:
             # snapshots here show agents that just died
             # TODO: sometimes can't see fully respawned cells as agents move onto them
-            self.take_snapshot.send(living_agents)
-
-        if self.live_agents:
-            self.collect_stats()
-            self.world.on_end_round()
+            with prof.phase('snapshot'):
+                self.snapshots.submit(food_grid, (pop.y[slots], pop.x[slots]))
+
+        if self.num_live:
+            with prof.phase('stats'):
+                self.collect_stats()
+            with prof.phase('regrowth'):
+                if self.stepper:
+                    self.stepper.regrow(self.world)
+                else:
+                    self.world.on_end_round()
 
         # TODO: can snapshot here to display respawns before next round of moves
-        return len(self.live_agents)
+        if self.recorder and self.recorder.started:
+            with prof.phase('record'):
+                self.recorder.record(self)
+
+        if self.analytics_dir and self.round % self.analytics_stride == 0:
+            with prof.phase('analytics'):
+                self.analytics.export(self.analytics_dir, self.round)
+
+        prof.end_round()
+        return self.num_live
+
+    def _step_sequential(self, slots):
+        """Move agents one at a time in slot order, each seeing the moves &
+        harvests of those before it. Returns (harvests, died slots)."""
+        pop = self.population
+        energy, metabolism = pop.energy, pop.metabolism
+        food_grid = self.world.food_grid
+        harvests = []
+        died = []
+
+        # per phase timing, only checked when profiling is on
+        prof = self.profiler
+        timing = prof.enabled
+
+        # decide all moves in one pass, from the state at the start of round
+        with prof.phase('decide'):
+            next_ys, next_xs = pop.next_moves(food_grid, self.occupancy, slots, self.flow,
+                                              self.world.food_sums if self.wedges else None)
+        moves = zip(slots.tolist(), zip(pop.y[slots].tolist(), pop.x[slots].tolist()),
+                    zip(next_ys.tolist(), next_xs.tolist()))
+        # cells changed by agents which have already moved, in grid coords
+        touched = self._touched
+        b = food_grid.border_size
+        any_touched = False
+
+        for slot, coords, next_coord in moves:
+            if timing:
+                t = time.perf_counter()
+
+            if any_touched:
+                y, x = coords
+                r = max(self._vision[slot], 1)
+                if touched[y + b - r:y + b + r + 1, x + b - r:x + b + r + 1].any():
+                    # earlier moves changed the agent's surroundings, decide again
+                    a = self._agents[slot]
+                    view = food_grid.view(*coords, size=r)
+                    if timing:
+                        t = prof.lap('view', t)
+                    adj_agents = self.adjacent_agents(a)
+                    if timing:
+                        t = prof.lap('adjacent', t)
+                    next_coord = a.next_move(view, adj_agents, self.flow, self.wedges)
+                    if timing:
+                        t = prof.lap('next_move', t)
+
+            touched[coords[0] + b, coords[1] + b] = True
+            touched[next_coord[0] + b, next_coord[1] + b] = True
+            any_touched = True
+            if timing:
+                t = prof.lap('stale_check', t)
+
+            # same updates as the BasicAgent coords & energy setters, and
+            # on_end_turn(), applied to the population directly
+            self.occupancy.move(slot, coords, next_coord)
+            pop.set_coords(slot, next_coord)
+            if timing:
+                t = prof.lap('move', t)
+            harvest = self.world.harvest(next_coord)
+            harvests.append(harvest)
+            energy[slot] += harvest - metabolism[slot]
+            if timing:
+                t = prof.lap('harvest', t)
+
+            if energy[slot] <= 0:
+                # cache view where the agent died for reference
+                data = copy.copy(food_grid.view(*next_coord, size=1))
+                self._agents[slot].last_view = data
+                self.occupancy.remove(slot, next_coord)
+                died.append(slot)
+                if timing:
+                    prof.lap('deaths', t)
+
+        touched[:] = False
+        return harvests, died
+
+    def _step_synchronous(self, slots):
+        """Move all agents at once, every agent deciding from the state at the
+        start of the round. Agents moving to the same cell are settled by the
+        conflict rule, the losers wait where they are. Harvests are taken in
+        the same order. Returns (harvests, died slots)."""
+        pop = self.population
+        energy, metabolism = pop.energy, pop.metabolism
+        food_grid = self.world.food_grid
+        prof = self.profiler
+
+        if self.stepper:
+            # moves, harvests & the spatial index are all done tile by tile
+            harvests = self.stepper.step(self, slots, self._conflict_priority(slots))
+            return harvests, self._synchronous_deaths(slots)
+
+        ys, xs = pop.y[slots], pop.x[slots]
+        with prof.phase('decide'):
+            direction = move_directions(food_grid, self.occupancy, ys, xs, pop.vision[slots],
+                                        pop.id[slots], self.flow,
+                                        self.world.food_sums if self.wedges else None)
+
+        with prof.phase('move'):
+            priority = self._conflict_priority(slots)
+            next_ys, next_xs = ys + STEP_YS[direction], xs + STEP_XS[direction]
+            wins = resolve_conflicts(next_ys, next_xs, food_grid.ncols, priority)
+            next_ys, next_xs = np.where(wins, next_ys, ys), np.where(wins, next_xs, xs)
+            pop.y[slots], pop.x[slots] = next_ys, next_xs
+
+        with prof.phase('harvest'):
+            rank = np.lexsort((np.arange(len(slots)), priority))
+            harvests = np.empty(len(slots), dtype=np.int64)
+            harvests[rank] = self.world.harvest_many(next_ys[rank], next_xs[rank])
+            energy[slots] += harvests - metabolism[slots]
+
+        with prof.phase('deaths'):
+            # rebuilding the spatial index beats moving agents one by one
+            live = slots[energy[slots] > 0]
+            self.occupancy.clear()
+            self.occupancy.add_many(live, pop.y[live], pop.x[live])
+
+        return harvests, self._synchronous_deaths(slots)
+
+    def _synchronous_deaths(self, slots):
+        pop = self.population
+        with self.profiler.phase('deaths'):
+            died = slots[pop.energy[slots] <= 0].tolist()
+            for slot in died:
+                # cache view where the agent died for reference
+                self._agents[slot].last_view = copy.copy(
+                    self.world.food_grid.view(*pop.coords(slot), size=1))
+        return died
+
+    def _conflict_priority(self, slots):
+        # lower values win, ties go to the lower slot
+        if self.conflict == 'energy':
+            return -self.population.energy[slots]
+        if self.conflict == 'random':
+            return self._conflict_rng.permutation(len(slots))
+        return np.arange(len(slots))
+
+    def changed_cells(self):
+        """Returns (ys, xs) of food cells changed in the last round, needs
+        world.track_changes. Shared by the run log & recorder."""
+        if self._changes_round != self.round:
+            self._changes = self.world.pop_changes()
+            self._changes_round = self.round
+        return self._changes
 
     def adjacent_agents(self, agent):
         """Scan around given agent for any adjacent agents."""
+        adj = self.occupancy.adjacent(agent.coords)
+        return {d: self._agents[slot] for d, slot in adj.items()}
 
-        def close_range(i):
-            return range(i-1, i+2)
-
-        y, x = agent.coords
-        first_pass = [a for a in self.live_agents if a.coords[0] in close_range(y)]
-        second_pass = [a for a in first_pass if a.coords[1] in close_range(x)]
+    @property
+    def agents(self):
+        return self._agents
+
+    @agents.setter
+    def agents(self, agents):
+        # (re)build the population & spatial index when agents are assigned,
+        # NB: this includes in place changes like sim.agents += [...]
+        if isinstance(agents, AgentPopulation):
+            # used as is, agent objects are only made when asked for
+            self.population = agents
+            if 'HISTORY' in self.config:
+                agents.history.level = parse_level(self.config['HISTORY'])
+        else:
+            history = TrajectoryStore(self.config.get('HISTORY', FULL))
+            self.population = AgentPopulation.from_agents(agents, history)
+
+        self._index_population(agents if not isinstance(agents, AgentPopulation) else None)
+
+        # live slots are kept in agent order & only updated as agents die,
+        # agents already dead when assigned are filed under round 0
+        self._live_slots = self.population.live_slots()
+        self.dead_by_round = {}
+        self.num_dead = 0
+        self.analytics = self._new_analytics()
+        dead = np.flatnonzero(self.population.energy <= 0)
+        if len(dead):
+            self._record_deaths(dead.tolist(), _round=0)
+
+    def _new_analytics(self):
+        # ANALYTICS (or ANALYTICS_DIR) counts cell visits & agent lifespans as
+        # the run goes, see analytics.TrafficAnalytics
+        mode = self.config.get('ANALYTICS')
+        if not (mode and mode not in ('0', 'off')) and not self.config.get('ANALYTICS_DIR'):
+            return None
+        from agent import analytics
+        tracker = analytics.TrafficAnalytics(self.world.food_grid.shape)
+        tracker.add_agents(self.round, len(self.population))
+        return tracker
+
+    def _index_population(self, agents=None):
+        """Size the world border, & build the spatial index & agent objects
+        (views of the population unless agents are given) for the population."""
+        # borders must be wide enough for the furthest seeing agent's view
+        vision = self.population.vision
+        self.world.set_border(max(int(vision.max()) if len(vision) else 1, 1))
+        grid = self.world.food_grid
+        self._touched = np.zeros((grid.nrows + 2 * grid.border_size,
+                                  grid.ncols + 2 * grid.border_size), dtype=bool)
+        self._vision = vision.tolist()
+        self.occupancy = OccupancyGrid(grid.nrows, grid.ncols, grid.border_size)
+        self.population.on_death = self._agent_died
+
+        if agents is None:
+            pop = self.population
+            placed = np.flatnonzero((pop.energy > 0) & (pop.y != NOWHERE))
+            self.occupancy.add_many(placed, pop.y[placed], pop.x[placed])
+            self._agents = AgentViews(pop, self.occupancy)
+        else:
+            self._agents = agents
+            for slot, a in enumerate(agents):
+                a._bind(self.population, slot, self.occupancy)
+
+    def checkpoint(self, path):
+        """Save the full simulation state (world, agents, history & stats) as
+        raw arrays in one file, see restore()."""
+        from agent import checkpoint
+        checkpoint.save(path, self._state())
+
+    @classmethod
+    def restore(cls, path, config=None, mmap=False):
+        """Load a simulation saved by checkpoint(), using the saved config
+        unless one is given. With mmap set the arrays are memory mapped
+        copy-on-write, so restoring is quick & the file is never changed.
+        Stats samples are appended to an existing STATS_SINK file."""
+        from agent import checkpoint
+        return cls._from_state(checkpoint.load(path, 'c' if mmap else None), config,
+                               append_stats=True)
+
+    def fork(self, config=None, checkpoint=None):
+        """Returns a copy-on-write branch of the simulation, to run what-if
+        branches from the current round, or from the round saved in a
+        checkpoint() file if one is given. Snapshot & recording outputs are
+        dropped from this simulation's config unless a config is given.
+
+        The state is saved as a checkpoint (to a temporary file, removed once
+        mapped, unless one is given) & memory mapped copy-on-write, so pages
+        are only copied when a branch changes them. Forking many times from
+        one round is cheapest with one checkpoint() & fork(checkpoint=path).
+        """
+        from agent import checkpoint as checkpoints
+        if config is None:
+            config = {k: v for k, v in self.config.items() if k not in FORK_DROPPED}
+        if checkpoint is not None:
+            return self._from_state(checkpoints.load(checkpoint, 'c'), config)
+
+        import tempfile
+        fd, path = tempfile.mkstemp(suffix='.npz')
+        os.close(fd)
+        try:
+            self.checkpoint(path)
+            return self._from_state(checkpoints.load(path, 'c'), config)
+        finally:
+            os.remove(path)  # the maps keep the data
+
+    def _state(self):
+        dead = sorted(self.dead_by_round.items())
+        dead_slots = [slot for _, slots in dead for slot in slots]
+        views = [(slot, self._agents[slot].last_view) for slot in dead_slots]
+        views = [(slot, view) for slot, view in views if view is not None]
+        sim = {'config': np.array(json.dumps(self.config, default=str)),
+               'round': np.array(self.round),
+               'final_round': np.array(-1 if self.final_round is None else self.final_round),
+               'conflict_rng': np.array(json.dumps(self._conflict_rng.bit_generator.state)),
+               'live_slots': self._live_slots,
+               'dead_rounds': np.repeat(np.array([r for r, _ in dead], dtype=np.int64),
+                                        [len(s) for _, s in dead]),
+               'dead_slots': np.array(dead_slots, dtype=np.int64),
+               'last_view_slots': np.array([slot for slot, _ in views], dtype=np.int64),
+               'last_views': np.array([view for _, view in views]).reshape(-1, 3, 3)}
+
+        world = self.stepper.world_state(self.world) if self.stepper else self.world.state()
+        state = {'sim': sim, 'world': world, 'population': self.population.state(),
+                 'history': self.population.history.state(), 'stats': self.stats.state()}
+        if self.analytics is not None:
+            state['analytics'] = self.analytics.state()
+        return state
+
+    @classmethod
+    def _from_state(cls, state, config=None, append_stats=False):
+        s = state['sim']
+        sim = cls.__new__(cls)
+        sim.config = config if config is not None else json.loads(str(s['config']))
+        sim.world = BasicWorld.from_state(state['world'])
+        sim.round = int(s['round'])
+
+        history = TrajectoryStore.from_state(state['history'])
+        sim.population = AgentPopulation.from_state(state['population'], history)
+        sim._index_population()
+        for slot, view in zip(s['last_view_slots'].tolist(), s['last_views']):
+            sim._agents[slot].last_view = np.array(view)
+
+        sim._live_slots = np.array(s['live_slots'])
+        sim.dead_by_round = {}
+        for _round, slot in zip(s['dead_rounds'].tolist(), s['dead_slots'].tolist()):
+            sim.dead_by_round.setdefault(_round, []).append(slot)
+        sim.num_dead = len(s['dead_slots'])
+
+        if 'analytics' in state:
+            from agent import analytics
+            sim.analytics = analytics.TrafficAnalytics.from_state(state['analytics'])
+        else:
+            sim.analytics = sim._new_analytics()
+            if sim.analytics is not None:
+                # agents dead before the analytics started have no lifespan
+                sim.analytics.untrack(s['dead_slots'])
+
+        final_round = int(s['final_round'])
+        sim.final_round = None if final_round < 0 else final_round
+        sim._init_stats(append_stats)
+        sim.stats.load_state(state.get('stats', {}))
+        sim._init_stepping()
+        sim._conflict_rng.bit_generator.state = json.loads(str(s['conflict_rng']))
+        sim._init_outputs()
+        return sim
+
+    def _agent_died(self, slot):
+        """File an agent whose energy was run down through the agent API,
+        between rounds, as dead in the current round."""
+        if slot not in self._live_slots:
+            return
+        coords = self.population.coords(slot)
+        if coords is not None:
+            self._agents[slot].last_view = copy.copy(self.world.food_grid.view(*coords, size=1))
+            self.occupancy.remove(slot, coords)
+        self._record_deaths([slot])
+
+    def _record_deaths(self, slots, _round=None):
+        _round = self.round if _round is None else _round
+        self.dead_by_round.setdefault(_round, []).extend(slots)
+        self.num_dead += len(slots)
+        if self.analytics is not None:
+            self.analytics.record_deaths(_round, slots)
+        self._live_slots = self._live_slots[~np.isin(self._live_slots, slots)]
 
-        adj_agents = {}
-        if second_pass:
-            for i, adj_coord in enumerate(adjacent_coords(agent.coords)):
-                for a in second_pass:
-                    if a.coords == adj_coord:
-                        adj_agents[i] = a
+    @property
+    def live_agents(self):
+        return [self._agents[slot] for slot in self._live_slots.tolist()]
 
-        return adj_agents
+    @property
+    def num_live(self):
+        return len(self._live_slots)
 
     @property
-    def live_agents(self):
-        # TODO: could cache previous live agents
-        return [a for a in self.agents if a.is_alive()]
+    def dead_agents(self):
+        """Dead agents in order of death."""
+        return [self._agents[slot] for _round in sorted(self.dead_by_round)
+                for slot in self.dead_by_round[_round]]
 
     def collect_stats(self):
-        n_agents = len(self.live_agents)
+        """Sample the stats engine, when there are live agents & a sample is
+        due this round."""
+        if self.num_live and self.stats.due(self.round):
+            self.stats.collect(self)
 
-        if not n_agents:
-            return
-
-        avg_energy = float(sum(a.energy for a in self.live_agents)) / n_agents
-        self.average_energy.append(round(avg_energy, 2))
-        avg_metabolism = float(sum(a.metabolism for a in self.live_agents)) / n_agents
-        self.average_metabolism.append(round(avg_metabolism, 2))
-        self.num_dead_agents.append(sum(a.is_dead() for a in self.agents))
+    average_energy = _stats_series('average_energy')
+    average_metabolism = _stats_series('average_metabolism')
+    num_dead_agents = _stats_series('num_dead_agents')
 
     def report(self, out):
         """Prints rough report of simulation details."""
@@ -285,7 +1135,7 @@ class Simulation(object):
         print('Average energy: ', self.average_energy, file=out)
         print('Average metabolism: ', self.average_metabolism, file=out)
 
-        live_agents = [a for a in self.agents if a.is_alive()]
+        live_agents = self.live_agents
         live_agents.sort(key=lambda x: x.energy, reverse=True)
 
         print('\nLive Agents - Stats', file=out)
@@ -323,6 +1173,47 @@ def generate_agents_deterministic():
                 enumerate(zip(vision, metabolism, energy, coords))]
 
 
+def generate_agents_random(grid, num_agents, seed=None, vision=(1, 2), metabolism=(1, 3),
+                           energy=(10, 30), occupied=None, population=False, history=None):
+    """Create agents with random attributes on distinct, random grid cells.
+
+    Attributes are drawn from a (low, high) inclusive range, a fixed value or
+    a callable f(rng, size). Agents are never placed on NODATA cells or cells
+    set in the optional occupied mask. seed is an int or numpy Generator.
+
+    Returns a list of BasicAgents, or an AgentPopulation if population is set
+    (much faster for large counts).
+    """
+    rng = np.random.default_rng(seed)
+    free = grid[:, :] != NODATA
+    if occupied is not None:
+        free &= ~np.asarray(occupied, dtype=bool)
+
+    cells = np.flatnonzero(free)
+    if num_agents > len(cells):
+        raise ValueError('Only {} free cells for {} agents'.format(len(cells), num_agents))
+
+    cells = rng.choice(cells, size=num_agents, replace=False)
+    ys, xs = np.divmod(cells, grid.ncols)
+    values = [_draw(rng, dist, num_agents) for dist in (vision, metabolism, energy)]
+    ids = np.arange(num_agents)
+
+    if population:
+        return AgentPopulation.from_arrays(ids, *values, ys, xs, history=history)
+
+    return [BasicAgent(_id, v, m, e, c) for _id, v, m, e, c in
+            zip(ids.tolist(), *[a.tolist() for a in values], zip(ys.tolist(), xs.tolist()))]
+
+
+def _draw(rng, dist, size):
+    if callable(dist):
+        return np.asarray(dist(rng, size))
+    if np.ndim(dist):
+        low, high = dist
+        return rng.integers(low, high, size=size, endpoint=True)
+    return np.full(size, dist)
+
+
 def default_filename(_dir):
     n = datetime.now()
     attrs = [getattr(n, a) for a in ('year', 'month', 'day', 'hour', 'minute')]
@@ -330,6 +1221,11 @@ def default_filename(_dir):
     return os.path.join(_dir, name)
 
 
+def config_value(value):
+    """Convert rc file settings (strings) to ints, pass other values through."""
+    return int(value) if isinstance(value, str) else value
+
+
 def get_config(path):
     # TODO: use ConfigParser?
     with open(path) as fd:
@@ -339,19 +1235,6 @@ def get_config(path):
 
 
 if __name__ == '__main__':
-    # run the default simulation
-    # TODO: cmd line option for skipping viz
-    food_grid_path = sys.argv[1] or './data/basic_grid.txt'
-    settings_path = os.path.join(os.environ['HOME'], '.agentsim.rc')
-    config = get_config(settings_path)
-
-    with open(food_grid_path) as fd:
-        food_grid = Grid.from_file(fd)
-        agents = generate_agents_deterministic()
-        simulation = Simulation(food_grid, agents, config)
-        simulation.run(200)
-
-        path = default_filename(config['REPORT_OUTPUT_DIR'])
-        with open(path, 'w') as f:
-            simulation.report(f)
-            print(path, 'saved')
+    # run the default simulation, see agent.cli for the options
+    from agent import cli
+    sys.exit(cli.main())
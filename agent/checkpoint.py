@@ -0,0 +1,71 @@
+"""Checkpoint files: simulation state as raw arrays in one uncompressed .npz.
+
+State is a dict of {section: {name: array}} (see Simulation.checkpoint()),
+saved with 'section.name' keys. As the archive is uncompressed, each array
+sits in the file as a plain .npy member, so load() can memory map arrays in
+place by finding the member offsets in the zip directory, with mode 'c' for
+private copy-on-write pages.
+"""
+import struct
+import zipfile
+
+import numpy as np
+
+
+LOCAL_HEADER = struct.Struct('<4s5H3L2H')  # zip local file header, 30 bytes
+
+
+def save(path, state):
+    """Write a {section: {name: array}} dict to path."""
+    arrays = {}
+    for section, values in state.items():
+        for name, value in values.items():
+            arrays['{}.{}'.format(section, name)] = value
+
+    with open(path, 'wb') as fd:
+        np.savez(fd, **arrays)
+
+
+def load(path, mmap_mode=None):
+    """Read a checkpoint, memory mapping the arrays if mmap_mode is given
+    ('r' read only, 'c' copy-on-write or 'r+' write through)."""
+    if mmap_mode is None:
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files}
+    else:
+        arrays = _map_members(path, mmap_mode)
+
+    state = {}
+    for key, value in arrays.items():
+        section, _, name = key.partition('.')
+        state.setdefault(section, {})[name] = value
+    return state
+
+
+def _map_members(path, mmap_mode):
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as fd:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('Compressed checkpoints cannot be memory mapped')
+
+            # the member data follows its local header, name & extra field
+            fd.seek(info.header_offset)
+            header = LOCAL_HEADER.unpack(fd.read(LOCAL_HEADER.size))
+            fd.seek(info.header_offset + LOCAL_HEADER.size + header[-2] + header[-1])
+
+            version = np.lib.format.read_magic(fd)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(fd)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(fd)
+
+            key = info.filename[:-len('.npy')]
+            size = int(np.prod(shape))
+            if not shape or not size:
+                # scalars & empty arrays are read, can't map zero bytes
+                arrays[key] = np.fromfile(fd, dtype=dtype, count=size).reshape(shape)
+            else:
+                arrays[key] = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=fd.tell(),
+                                        shape=shape, order='F' if fortran else 'C')
+    return arrays
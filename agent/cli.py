@@ -0,0 +1,145 @@
+"""Command line runs of a simulation, as python -m agent.
+
+    python -m agent data/basic_grid.txt --rounds 500 --agents 1000 --seed 3 \\
+        --stats stats.csv --no-viz
+
+Settings are read from an rc file (--config, or ~/.agentsim.rc if there is
+one) & --set KEY=VALUE options, the other options override them. Only the
+argument parsing is done before a run starts, numpy & the simulation are
+imported afterwards & optional outputs import what they need (PIL for images
+etc.) when turned on, so headless runs start quickly.
+"""
+import os
+import sys
+import argparse
+
+
+DEFAULT_GRID = './data/basic_grid.txt'
+DEFAULT_RC = os.path.join('~', '.agentsim.rc')
+
+# settings of outputs turned off by --no-viz, analytics exports include
+# images so they go too (with their .npy arrays)
+VIZ_SETTINGS = ('VIZ_OUTPUT_DIR', 'VIZ_RECORDING', 'ANALYTICS_DIR')
+
+# (low, high) attributes of random agents
+AGENT_RANGES = {'vision': (1, 2), 'metabolism': (1, 3), 'energy': (10, 30)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m agent', description='Run a simulation')
+    parser.add_argument('grid', nargs='?', default=DEFAULT_GRID,
+                        help='food grid file (.txt, .csv, .npy or .npz)')
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--agents', type=int,
+                        help='number of random agents, defaults to the 25 built in agents')
+    parser.add_argument('--seed', type=int, help='seed for random agents')
+    for name, (low, high) in AGENT_RANGES.items():
+        parser.add_argument('--' + name, type=int, nargs=2, metavar=('LOW', 'HIGH'),
+                            help='{} range of random agents, defaults to {} {}'.format(
+                                name, low, high))
+
+    parser.add_argument('--config', help='rc file of KEY=VALUE settings, defaults to '
+                                         '{} if there is one'.format(DEFAULT_RC))
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='simulation setting, can be repeated')
+
+    parser.add_argument('--report-dir', help='save a run log & text report here, defaults '
+                                             'to the REPORT_OUTPUT_DIR setting')
+    parser.add_argument('--stats', help='stream stats samples to a .csv or .ndjson file')
+    parser.add_argument('--checkpoint', help='save the final state to this .npz file')
+    parser.add_argument('--viz', metavar='DIR', help='save snapshot images to DIR')
+    parser.add_argument('--no-viz', action='store_true',
+                        help='no images, recordings or ANALYTICS_DIR exports (arrays as '
+                             'well as images), whatever the settings say')
+    parser.add_argument('--quiet', action='store_true', help='no summary line')
+
+    args = parser.parse_args(argv)
+    if args.agents is None:
+        given = [name for name in ('seed',) + tuple(AGENT_RANGES)
+                 if getattr(args, name) is not None]
+        if given:
+            parser.error('random agent options need --agents: --{}'.format(
+                ', --'.join(given)))
+    for setting in args.set:
+        if '=' not in setting:
+            parser.error('settings are KEY=VALUE, got {!r}'.format(setting))
+    return args
+
+
+def read_config(args):
+    """Returns the settings dict for parsed args."""
+    from agent.basicsim import get_config
+
+    path = args.config
+    if path is None and os.path.exists(os.path.expanduser(DEFAULT_RC)):
+        path = DEFAULT_RC
+    config = get_config(os.path.expanduser(path)) if path else {}
+
+    for setting in args.set:
+        key, _, value = setting.partition('=')
+        config[key.strip()] = value.strip()
+
+    if args.stats:
+        config['STATS_SINK'] = args.stats
+    if args.viz:
+        config['VIZ_OUTPUT_DIR'] = args.viz
+    if args.no_viz:
+        for key in VIZ_SETTINGS:
+            config.pop(key, None)
+    if args.report_dir:
+        config['REPORT_OUTPUT_DIR'] = args.report_dir
+    return config
+
+
+def make_agents(args, grid):
+    from agent import basicsim
+
+    if args.agents is None:
+        return basicsim.generate_agents_deterministic()
+    ranges = {name: tuple(getattr(args, name) or default)
+              for name, default in AGENT_RANGES.items()}
+    return basicsim.generate_agents_random(grid, args.agents, args.seed, population=True,
+                                           **ranges)
+
+
+def run(args, out=None):
+    """Run the simulation for parsed args, returns it."""
+    from agent import basicsim
+    from agent.components import Grid
+
+    out = out or sys.stdout
+    config = read_config(args)
+    grid = Grid.load(args.grid)
+    sim = basicsim.Simulation(grid, make_agents(args, grid), config)
+
+    try:
+        report_dir = config.get('REPORT_OUTPUT_DIR')
+        if report_dir:
+            from agent import runlog
+
+            path = basicsim.default_filename(report_dir)
+            log_path = os.path.splitext(path)[0] + '.runlog'
+            with runlog.RunLogWriter(log_path) as log:
+                sim.run(args.rounds, log)
+
+            # text report is rendered from the binary run log
+            with open(path, 'w') as fd:
+                runlog.render_report(runlog.RunLogReader(log_path), fd)
+            print(path, 'saved', file=out)
+        else:
+            sim.run(args.rounds)
+
+        if args.checkpoint:
+            sim.checkpoint(args.checkpoint)
+    finally:
+        sim.close()
+
+    if not args.quiet:
+        print('rounds={} live={} dead={}'.format(sim.final_round, sim.num_live, sim.num_dead),
+              file=out)
+    return sim
+
+
+def main(argv=None):
+    run(parse_args(argv))
+    return 0
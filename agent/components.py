@@ -1,9 +1,14 @@
-import csv
+import os
+
 import numpy as np
 
 
 DEFAULT_BORDER = 1
+DEFAULT_DTYPE = np.int8
 NODATA = -128
+EMPTY = -1  # occupancy value for cells without agents
+
+_INTS = (int, np.integer)  # scalar coord types
 
 Y_OFFSETS = (-1, -1, 0, 1, 1, 1, 0, -1)
 X_OFFSETS = (0, 1, 1, 1, 0, -1, -1, -1)
@@ -16,72 +21,202 @@ def adjacent_coords(coord):
         yield adj_coord
 
 
+def wedge_rects(radius):
+    """Returns the rectangles making up the 8 wedges of a view, an (8, k, 4)
+    array of inclusive (dy0, dx0, dy1, dx1) offsets, in Y_OFFSETS order.
+
+    The view (less the centre) is cut into square rings of widths 2, 4, 8...
+    Each ring's edges are split into the straight on part & the corners, a
+    rough 45 degree sector per direction with one rectangle per ring. The
+    wedges don't overlap & cover every cell in the view.
+    """
+    rects = []
+    near = 1
+    while near <= radius:
+        far = min(2 * near, radius)
+        rects.append([(-far, 1 - near, -near, near - 1),  # north
+                      (-far, near, -near, far)])  # north east
+        near = far + 1
+
+    north = np.array(rects).transpose(1, 0, 2)  # (2, rings, 4)
+    wedges = [north[0], north[1]]
+    for _ in range(3):
+        # a quarter turn clockwise: y, x -> x, -y
+        y0, x0, y1, x1 = wedges[-2].T
+        wedges.append(np.stack((x0, -y1, x1, -y0), axis=1))
+        y0, x0, y1, x1 = wedges[-2].T
+        wedges.append(np.stack((x0, -y1, x1, -y0), axis=1))
+    return np.array(wedges)
+
+
+def view_wedge_sums(view):
+    """Sums of the positive values in each of the 8 wedges of a square view
+    (see wedge_rects()), as an array."""
+    r = view.shape[0] // 2
+    view = np.maximum(view, 0)
+    sums = np.zeros(8, dtype=np.int64)
+    for d, rects in enumerate(wedge_rects(r)):
+        for y0, x0, y1, x1 in rects:
+            sums[d] += view[r + y0:r + y1 + 1, r + x0:r + x1 + 1].sum()
+    return sums
+
+
+def _dilate(mask):
+    # grow a bool mask by one cell in all 8 directions (the 3x3 box is separable)
+    grown = mask.copy()
+    grown[:, 1:] |= mask[:, :-1]
+    grown[:, :-1] |= mask[:, 1:]
+    rows = grown.copy()
+    grown[1:] |= rows[:-1]
+    grown[:-1] |= rows[1:]
+    return grown
+
+
+def _check_border(border):
+    # borders are sized to the widest agent vision, so views stay in the array
+    if border < 1:
+        raise ValueError('Border must be at least 1 cell: {}'.format(border))
+
+
+def _check_range(values, dtype):
+    if not np.issubdtype(dtype, np.integer) or not values.size:
+        return
+    info = np.iinfo(dtype)
+    low, high = values.min(), values.max()
+    if low < info.min or high > info.max:
+        raise ValueError('Grid values {}..{} out of range for {}'.format(
+            low, high, np.dtype(dtype).name))
+
+
+def _fill_border(array, border):
+    # make borders NODATA to prevent inclusion in calcs
+    array[:border] = NODATA
+    array[-border:] = NODATA
+    array[:, :border] = NODATA
+    array[:, -border:] = NODATA
+
+
 class Grid(object):
     """Generic grid for storing data in 2D space."""
 
-    def __init__(self, nrows, ncols, border=DEFAULT_BORDER):
-        if border !=1:
-            raise NotImplementedError
+    def __init__(self, nrows, ncols, border=DEFAULT_BORDER, dtype=DEFAULT_DTYPE):
+        _check_border(border)
 
         self._border_size = border
 
         # make grid with border cells
         x_size = ncols + (2 * self._border_size)
         y_size = nrows + (2 * self._border_size)
-        self._grid = np.zeros((y_size, x_size), dtype=np.int8)
+        self._grid = np.zeros((y_size, x_size), dtype=dtype)
+        _fill_border(self._grid, border)
 
-        # make borders NODATA to prevent inclusion in calcs
-        self._grid[0] = NODATA
-        self._grid[-1] = NODATA
-        self._grid[:,0] = NODATA
-        self._grid[:,-1] = NODATA
+    @classmethod
+    def wrap(cls, array, border=DEFAULT_BORDER):
+        """Create a grid over an existing bordered array, without copying."""
+        grid = cls.__new__(cls)
+        grid._border_size = border
+        grid._grid = array
+        return grid
 
     @classmethod
-    def from_csv_file(cls, fd, border=DEFAULT_BORDER):
-        """ TODO """
-        grid_values = []
-        for row in csv.reader(fd, delimiter=','):
-            values = [int(i) for i in row]
-            grid_values.append(values)
+    def from_array(cls, values, border=DEFAULT_BORDER, dtype=DEFAULT_DTYPE):
+        """Create a grid from a 2D array, copied straight into the bordered grid.
+
+        Raises ValueError if values don't fit in dtype, rather than wrapping.
+        """
+        values = np.asarray(values)
+        if values.ndim != 2:
+            raise ValueError('Need a 2D array, got shape {}'.format(values.shape))
+        _check_range(values, dtype)
+
+        grid = cls(*values.shape, border=border, dtype=dtype)
+        grid._grid[border:-border, border:-border] = values
+        return grid
 
-        raise NotImplementedError
+    @classmethod
+    def from_csv_file(cls, fd, border=DEFAULT_BORDER, dtype=DEFAULT_DTYPE):
+        """Create a grid from comma separated rows of integers."""
+        values = np.loadtxt(fd, delimiter=',', dtype=np.int64, ndmin=2)
+        return cls.from_array(values, border, dtype)
 
     @classmethod
-    def from_file(cls, fd, border=DEFAULT_BORDER):
-        """ TODO """
-        grid_values = []
-        for line in fd.readlines():
-            if line:
-                values = [int(c) for c in line.strip()]
-                grid_values.append(values)
+    def from_file(cls, fd, border=DEFAULT_BORDER, dtype=DEFAULT_DTYPE):
+        """Create a grid from rows of single digit cell values.
 
-        nrows, ncols = len(grid_values), len(grid_values[0])
-        grid = Grid(nrows, ncols, border)
+        Spaces are read as 0. The whole file is parsed in one vectorised pass
+        over the digit bytes.
+        """
+        data = fd.read()
+        if isinstance(data, str):
+            data = data.encode('ascii')
 
-        for i, values in enumerate(grid_values):
-            grid[i,:] = values
+        lines = [line for line in data.replace(b'\r', b'').split(b'\n') if line]
+        if not lines:
+            raise ValueError('No grid data')
 
-        return grid
+        ncols = max(len(line) for line in lines)
+        if any(len(line) != ncols for line in lines):
+            # rows with trailing spaces stripped (eg. by an editor)
+            lines = [line.ljust(ncols) for line in lines]
+
+        raw = np.frombuffer(b''.join(lines), dtype=np.uint8).reshape(len(lines), ncols)
+        values = raw - ord('0')
+        values[raw == ord(' ')] = 0
+
+        if (values > 9).any():
+            raise ValueError('Grid files need digits or spaces only')
+        return cls.from_array(values, border, dtype)
+
+    @classmethod
+    def from_numpy_file(cls, path, border=DEFAULT_BORDER, dtype=DEFAULT_DTYPE, key=None):
+        """Create a grid from a .npy file, or one array of a .npz file (the
+        first unless key is given)."""
+        data = np.load(path)
+        if isinstance(data, np.lib.npyio.NpzFile):
+            with data:
+                return cls.from_array(data[key if key else data.files[0]], border, dtype)
+        return cls.from_array(data, border, dtype)
+
+    @classmethod
+    def load(cls, path, border=DEFAULT_BORDER, dtype=DEFAULT_DTYPE):
+        """Create a grid from a file, picking the loader by file extension."""
+        ext = os.path.splitext(path)[1].lower()
+        if ext in ('.npy', '.npz'):
+            return cls.from_numpy_file(path, border, dtype)
+
+        loader = cls.from_csv_file if ext == '.csv' else cls.from_file
+        with open(path) as fd:
+            return loader(fd, border, dtype)
+
+    def save(self, path):
+        """Save the grid data (without borders) to a .npy or .npz file."""
+        if path.lower().endswith('.npz'):
+            np.savez(path, self[:, :])
+        else:
+            np.save(path, self[:, :])
+
+    def _index_offset(self, i):
+        # negative slice bounds count back from the end of the data cells
+        return i + self._border_size if i >= 0 else i - self._border_size
 
     def _slice_offset(self, _slice, values=None):
         start = self._border_size
-        if _slice.start:
-            start += self._border_size
+        if _slice.start is not None:
+            start = self._index_offset(_slice.start)
 
-        if _slice.stop:
-            raise NotImplementedError
-        else:
+        if _slice.stop is not None:
+            stop = self._index_offset(_slice.stop)
+        elif values is not None and np.ndim(values):
             # coords are likely to be [start:]
-            if values:
-                stop = start + len(values)
-            else:
-                # no slice stop implies continuing to the end
-                stop = -self._border_size
+            stop = start + len(values)
+        else:
+            # no slice stop implies continuing to the end
+            stop = -self._border_size
 
         return slice(start, stop, _slice.step)
 
     def _offset_coord(self, coords, values=None):
-        """TODO: coord can be a slice or a cell"""
+        """Convert data coords (cells, slices or index arrays) to _grid coords."""
         if hasattr(coords, '__len__'):  # TODO: test is a container
             # treat as a tuple of coordinates
             # TODO: replace isinstance
@@ -105,16 +240,37 @@ class Grid(object):
 
     def __iter__(self):
         """Yield all data rows without border cells."""
-        row_slice = slice(self._border_size, -self._border_size)
-        for i in range(len(self)):
-            yield self._grid[self._offset_coord(i), row_slice]
+        b = self._border_size
+        yield from self._grid[b:-b, b:-b]
 
     def __getitem__(self, coords):
+        # fast path for single cells, the most common access by far
+        if type(coords) is tuple and len(coords) == 2:
+            y, x = coords
+            if isinstance(y, _INTS) and isinstance(x, _INTS):
+                b = self._border_size
+                return self._grid[y + b, x + b]
         return self._grid[self._offset_coord(coords)]
 
     def __setitem__(self, coords, value):
+        if type(coords) is tuple and len(coords) == 2:
+            y, x = coords
+            if isinstance(y, _INTS) and isinstance(x, _INTS):
+                b = self._border_size
+                self._grid[y + b, x + b] = value
+                return
         self._grid[self._offset_coord(coords, value)] = value
 
+    def get_many(self, ys, xs):
+        """Returns the values of the cells at coord arrays ys & xs."""
+        b = self._border_size
+        return self._grid[np.asarray(ys) + b, np.asarray(xs) + b]
+
+    def set_many(self, ys, xs, values):
+        """Set the cells at coord arrays ys & xs to values."""
+        b = self._border_size
+        self._grid[np.asarray(ys) + b, np.asarray(xs) + b] = values
+
     @property
     def border_size(self):
         return self._border_size
@@ -135,7 +291,378 @@ class Grid(object):
     def dtype(self):
         return self._grid.dtype
 
+    def with_border(self, border):
+        """Returns a copy of the grid with a different border size."""
+        return Grid.from_array(self[:, :], border, self.dtype)
+
     def view(self, y, x, size):
-        """TODO: coords needs to be tuple of ints??"""
-        y, x = [self._offset_coord(i) for i in (y,x)]
+        """Returns a (2*size + 1) square view centred on a cell."""
+        if size > self._border_size:
+            raise ValueError('View size {} exceeds the border'.format(size))
+
+        y, x = y + self._border_size, x + self._border_size
         return self._grid[y - size:y + size + 1, x - size:x + size + 1]
+
+    def views(self, ys, xs, size):
+        """Returns (N, 2*size + 1, 2*size + 1) views centred on many cells.
+
+        The windows are gathered in one fancy indexing pass over a strided
+        sliding window view of the grid, rather than a slice per cell.
+        """
+        if size > self._border_size:
+            raise ValueError('View size {} exceeds the border'.format(size))
+
+        width = 2 * size + 1
+        windows = np.lib.stride_tricks.sliding_window_view(self._grid, (width, width))
+        offset = self._border_size - size
+        return windows[np.asarray(ys) + offset, np.asarray(xs) + offset]
+
+
+class LayeredGrid(object):
+    """Named grid layers stored together in one contiguous array.
+
+    Every cell is a record holding a value for each layer (eg. food, water,
+    topo), each layer with its own dtype & a shared NODATA border. Reading a
+    cell or neighbourhood fetches all layers in one access, and each layer is
+    available as a zero-copy Grid view.
+    """
+
+    def __init__(self, nrows, ncols, layers, border=DEFAULT_BORDER):
+        # layers is a sequence of (name, dtype) pairs
+        _check_border(border)
+
+        self._border_size = border
+        dtype = np.dtype([(name, dtype) for name, dtype in layers])
+        shape = (nrows + (2 * border), ncols + (2 * border))
+        self._cells = np.zeros(shape, dtype=dtype)
+
+        self._layers = {}
+        for name in dtype.names:
+            _fill_border(self._cells[name], border)
+            self._layers[name] = Grid.wrap(self._cells[name], border)
+
+    @classmethod
+    def wrap(cls, cells, border=DEFAULT_BORDER):
+        """Create layers over an existing bordered record array, without
+        copying (eg. a memory mapped checkpoint)."""
+        grid = cls.__new__(cls)
+        grid._border_size = border
+        grid._cells = cells
+        grid._layers = {name: Grid.wrap(cells[name], border) for name in cells.dtype.names}
+        return grid
+
+    def move_to(self, cells):
+        """Copy the layers into cells, a bordered record array of the same
+        shape & dtype (eg. in shared memory), & keep them there. The layer
+        Grids stay the same objects."""
+        cells[...] = self._cells
+        self._cells = cells
+        for name, grid in self._layers.items():
+            grid._grid = cells[name]
+
+    def __getitem__(self, name):
+        return self._layers[name]
+
+    def __contains__(self, name):
+        return name in self._layers
+
+    def layer(self, name):
+        """Returns a zero-copy Grid view of one layer."""
+        return self._layers[name]
+
+    @property
+    def names(self):
+        return self._cells.dtype.names
+
+    @property
+    def border_size(self):
+        return self._border_size
+
+    @property
+    def shape(self):
+        b = self._border_size
+        return (self._cells.shape[0] - (2 * b), self._cells.shape[1] - (2 * b))
+
+    @property
+    def dtype(self):
+        return self._cells.dtype
+
+    def with_border(self, border):
+        """Returns a copy of the layers with a different border size."""
+        layers = [(name, self.dtype[name]) for name in self.names]
+        grid = LayeredGrid(*self.shape, layers=layers, border=border)
+        for name in self.names:
+            grid[name][:, :] = self[name][:, :]
+        return grid
+
+    def cells(self, ys, xs):
+        """Returns the records of all layers for the given coords."""
+        b = self._border_size
+        return self._cells[np.asarray(ys) + b, np.asarray(xs) + b]
+
+    def view(self, y, x, size):
+        """Returns a square of records (all layers) around a cell."""
+        y, x = y + self._border_size, x + self._border_size
+        return self._cells[y - size:y + size + 1, x - size:x + size + 1]
+
+
+class OccupancyGrid(object):
+    """Spatial index of agent ids by cell, for O(1) neighbour lookups.
+
+    Each cell holds the id of one agent. Any other agents sharing the cell are
+    chained through a per agent 'next' array (a cell linked list).
+    """
+
+    def __init__(self, nrows, ncols, border=DEFAULT_BORDER):
+        self._border_size = border
+        shape = (nrows + (2 * border), ncols + (2 * border))
+        self._head = np.full(shape, EMPTY, dtype=np.int32)
+        self._next = np.full(0, EMPTY, dtype=np.int32)
+        self._yoffs = np.array(Y_OFFSETS)
+        self._xoffs = np.array(X_OFFSETS)
+
+    @classmethod
+    def wrap(cls, head, _next, border=DEFAULT_BORDER):
+        """Create an index over existing head (bordered grid) & next arrays,
+        without copying."""
+        grid = cls.__new__(cls)
+        grid._border_size = border
+        grid._head = head
+        grid._next = _next
+        grid._yoffs = np.array(Y_OFFSETS)
+        grid._xoffs = np.array(X_OFFSETS)
+        return grid
+
+    def move_to(self, head, _next):
+        """Copy the index into other head & next arrays (eg. in shared
+        memory), & keep it there. _next can be longer, to fit more ids."""
+        head[...] = self._head
+        _next[:] = EMPTY
+        _next[:len(self._next)] = self._next
+        self._head, self._next = head, _next
+
+    def _cell(self, coords):
+        y, x = coords
+        return y + self._border_size, x + self._border_size
+
+    def add(self, _id, coords):
+        if _id >= len(self._next):
+            grown = np.full(max(_id + 1, 2 * len(self._next)), EMPTY, dtype=np.int32)
+            grown[:len(self._next)] = self._next
+            self._next = grown
+
+        cell = self._cell(coords)
+        self._next[_id] = self._head[cell]
+        self._head[cell] = _id
+
+    def add_many(self, ids, ys, xs):
+        """Vectorised add() for arrays of ids & coords."""
+        ids = np.asarray(ids, dtype=np.int32)
+        if not len(ids):
+            return
+
+        size = int(ids.max()) + 1
+        if size > len(self._next):
+            grown = np.full(max(size, 2 * len(self._next)), EMPTY, dtype=np.int32)
+            grown[:len(self._next)] = self._next
+            self._next = grown
+
+        # chain ids sharing a cell in order, the last one links to the old head
+        b = self._border_size
+        cells = np.ravel_multi_index((np.asarray(ys) + b, np.asarray(xs) + b), self._head.shape)
+        order = np.argsort(cells, kind='stable')
+        cells, ids = cells[order], ids[order]
+        first = np.r_[True, cells[1:] != cells[:-1]]
+        last = np.r_[first[1:], True]
+
+        head = self._head.reshape(-1)
+        self._next[ids[:-1]] = ids[1:]
+        self._next[ids[last]] = head[cells[last]]
+        head[cells[first]] = ids[first]
+
+    def clear(self):
+        """Remove every agent."""
+        self._head.fill(EMPTY)
+        self._next.fill(EMPTY)
+
+    def remove(self, _id, coords):
+        cell = self._cell(coords)
+        prev, cur = EMPTY, self._head[cell]
+
+        while cur != EMPTY:
+            if cur == _id:
+                if prev == EMPTY:
+                    self._head[cell] = self._next[cur]
+                else:
+                    self._next[prev] = self._next[cur]
+                self._next[cur] = EMPTY
+                return
+            prev, cur = cur, self._next[cur]
+
+    def move(self, _id, old_coords, new_coords):
+        if old_coords is not None:
+            self.remove(_id, old_coords)
+        self.add(_id, new_coords)
+
+    def __getitem__(self, coords):
+        """Returns the id of an agent in the cell, or EMPTY."""
+        return int(self._head[self._cell(coords)])
+
+    def is_occupied(self, coords):
+        return self._head[self._cell(coords)] != EMPTY
+
+    def occupied(self, ys, xs):
+        """Vectorised is_occupied() for arrays of coords."""
+        b = self._border_size
+        return self._head[ys + b, xs + b] != EMPTY
+
+    def mask(self, out=None):
+        """Returns a bool array of occupied cells, including the border."""
+        return np.not_equal(self._head, EMPTY, out=out)
+
+    def occupants(self, coords):
+        """Returns ids of all agents in the cell."""
+        ids = []
+        cur = self._head[self._cell(coords)]
+        while cur != EMPTY:
+            ids.append(int(cur))
+            cur = self._next[cur]
+        return ids
+
+    def adjacent(self, coords):
+        """Returns {direction: id} for occupied cells around the coords."""
+        y, x = self._cell(coords)
+        ids = self._head[y + self._yoffs, x + self._xoffs]
+        return {d: int(i) for d, i in enumerate(ids) if i != EMPTY}
+
+    def within(self, coords, radius):
+        """Returns ids of all agents within a square radius of the coords."""
+        y, x = self._cell(coords)
+        y0, x0 = max(y - radius, 0), max(x - radius, 0)
+        window = self._head[y0:y + radius + 1, x0:x + radius + 1]
+
+        ids = []
+        for cur in window[window != EMPTY]:
+            while cur != EMPTY:
+                ids.append(int(cur))
+                cur = self._next[cur]
+        return ids
+
+
+class SummedAreaTable(object):
+    """Summed area tables (integral images) of a grid's positive values, one
+    table per square tile of the grid.
+
+    Each tile's table also covers a halo of cells around the tile, so the sum
+    of a rectangle within halo cells of any cell is 4 lookups in the table of
+    that cell's tile. Negative values (harvested & NODATA cells) count as 0.
+
+    Changed cells are passed to mark(), which dirties the tiles whose tables
+    include them, & refresh() redoes only the dirty tables. Edits to the grid
+    made without mark() need a rebuild().
+    """
+
+    def __init__(self, grid, halo=None, tile_size=64):
+        self.grid = grid
+        self.halo = grid.border_size if halo is None else halo
+        self.tile_size = tile_size
+        nrows, ncols = grid.shape
+        self.tiles = (-(-nrows // tile_size), -(-ncols // tile_size))
+
+        # positive values of the bordered grid, padded so every tile's table
+        # (tile plus halo) is a window of the same size
+        b, h = grid.border_size, self.halo
+        self._pad = max(h - b, 0)
+        self._origin = b + self._pad  # row & col of cell (0, 0)
+        span = tile_size + 2 * h
+        shape = [max(t * tile_size + self._origin + h, n + 2 * (b + self._pad))
+                 for t, n in zip(self.tiles, grid.shape)]
+        self._values = np.zeros(shape, dtype=np.int32)
+        self._tables = np.zeros(self.tiles + (span + 1, span + 1), dtype=np.int32)
+        self._dirty = np.ones(self.tiles, dtype=bool)
+        self.rebuild()
+
+    def rebuild(self):
+        """Re-read every cell of the grid & redo all the tables."""
+        p = self._pad
+        rows, cols = self.grid._grid.shape
+        self._values[p:p + rows, p:p + cols] = np.maximum(self.grid._grid, 0)
+        self._dirty[:] = True
+        self.refresh()
+
+    def mark(self, ys, xs):
+        """Re-read changed cells at coord arrays ys & xs, dirtying the tiles
+        they're in (refresh() also redoes the tiles whose halos reach them)."""
+        ys, xs = np.asarray(ys), np.asarray(xs)
+        o = self._origin
+        self._values[ys + o, xs + o] = np.maximum(self.grid.get_many(ys, xs), 0)
+        self._dirty[ys // self.tile_size, xs // self.tile_size] = True
+
+    @property
+    def num_dirty(self):
+        return int(self._dirty.sum())
+
+    def refresh(self):
+        """Redo the tables of dirty tiles & their neighbours within a halo,
+        returns how many were redone."""
+        if not self._dirty.any():
+            return 0
+
+        dirty = self._dirty
+        for _ in range(-(-self.halo // self.tile_size)):
+            dirty = _dilate(dirty)
+        ty, tx = np.nonzero(dirty)
+
+        span = self.tile_size + 2 * self.halo
+        start = self._origin - self.halo
+        windows = np.lib.stride_tricks.sliding_window_view(self._values, (span, span))
+        windows = windows[start::self.tile_size, start::self.tile_size]
+        self._tables[ty, tx, 1:, 1:] = windows[ty, tx].cumsum(axis=1).cumsum(axis=2)
+        self._dirty[:] = False
+        return len(ty)
+
+    def rect_sums(self, ys, xs, rects):
+        """Sums of rectangles around cells at coord arrays ys & xs.
+
+        rects is a (K, 4) array of inclusive (dy0, dx0, dy1, dx1) offsets from
+        each cell, at most halo cells away. Rectangles with dy1 < dy0 or
+        dx1 < dx0 are empty. Returns an (N, K) array.
+        """
+        rects = np.asarray(rects).reshape(-1, 4)
+        return self._sums(ys, xs, rects, np.eye(len(rects)))
+
+    def _sums(self, ys, xs, rects, totals):
+        # sums of rectangles, added up into groups by the (K, M) totals matrix
+        if np.abs(rects).max(initial=0) > self.halo:
+            raise ValueError('Rectangles reach beyond the halo of {}'.format(self.halo))
+
+        # rectangles share corners, so each distinct corner (as an offset
+        # in the tables) is looked up once & the sums are signed totals,
+        # table[i, j] being the sum of the values above & left of (i, j)
+        width = self._tables.shape[-1]
+        top, left = rects[:, 0], rects[:, 1]
+        bottom = np.maximum(rects[:, 2] + 1, top)
+        right = np.maximum(rects[:, 3] + 1, left)
+        corners = np.stack((bottom * width + right, top * width + right,
+                            bottom * width + left, top * width + left), axis=1)
+        offsets, index = np.unique(corners, return_inverse=True)
+        signs = np.zeros((len(offsets), len(rects)))
+        np.add.at(signs, (index.reshape(corners.shape), np.arange(len(rects))[:, np.newaxis]),
+                  [1, -1, -1, 1])
+
+        # offset of each cell in its tile's table
+        ty, ly = np.divmod(np.asarray(ys, dtype=np.intp), self.tile_size)
+        tx, lx = np.divmod(np.asarray(xs, dtype=np.intp), self.tile_size)
+        base = ((ty * self.tiles[1] + tx) * width + ly + self.halo) * width + lx + self.halo
+        values = self._tables.reshape(-1)[base[:, np.newaxis] + offsets]
+        return np.rint(values @ (signs @ totals)).astype(np.int64)  # exact, below 2 ** 53
+
+    def wedge_sums(self, ys, xs, radius):
+        """Sums of the 8 wedges of the view of the given radius (see
+        wedge_rects()) around cells at coord arrays ys & xs, an (N, 8) array.
+
+        Costs one lookup per distinct rectangle corner, 28 for radii up to 6.
+        """
+        rects = wedge_rects(radius)
+        totals = np.repeat(np.eye(8), rects.shape[1], axis=0)  # rectangles per wedge
+        return self._sums(ys, xs, rects.reshape(-1, 4), totals)
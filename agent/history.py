@@ -0,0 +1,205 @@
+import numpy as np
+
+
+# recording levels, an int N records every N rounds
+FULL = 'full'
+NONE = 'none'
+
+DEFAULT_CHUNK_ROWS = 256
+
+
+def parse_level(level):
+    """Convert a recording level setting (eg. from an rc file) to FULL, NONE or
+    an int interval."""
+    if level in (FULL, NONE):
+        return level
+
+    every = int(level)
+    if every < 1:
+        raise ValueError('Invalid recording interval: {}'.format(level))
+    return FULL if every == 1 else every
+
+
+class _Track(object):
+    """Chunked (row, agent) arrays with a write cursor per agent.
+
+    Rows are allocated a chunk at a time, so growing the track never copies
+    the rows already recorded.
+    """
+
+    def __init__(self, nfields, chunk_rows, dtype):
+        self._nfields = nfields
+        self._chunk_rows = chunk_rows
+        self._dtype = dtype
+        self._chunks = []  # each is (nfields, chunk_rows, capacity)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.size = 0  # number of agent slots in use
+
+    def _reserve(self, nagents, nrows):
+        self.size = max(self.size, nagents)
+        if nagents > len(self.counts):
+            capacity = max(nagents, 2 * len(self.counts))
+            counts = np.zeros(capacity, dtype=np.int64)
+            counts[:len(self.counts)] = self.counts
+            self.counts = counts
+
+            for i, chunk in enumerate(self._chunks):
+                grown = np.zeros(chunk.shape[:2] + (capacity,), dtype=self._dtype)
+                grown[..., :chunk.shape[2]] = chunk
+                self._chunks[i] = grown
+
+        while len(self._chunks) * self._chunk_rows < nrows:
+            shape = (self._nfields, self._chunk_rows, len(self.counts))
+            self._chunks.append(np.zeros(shape, dtype=self._dtype))
+
+    def append_one(self, slot, values):
+        row = int(self.counts[slot]) if slot < len(self.counts) else 0
+        if slot >= self.size or row >= len(self._chunks) * self._chunk_rows:
+            self._reserve(slot + 1, row + 1)
+
+        chunk, offset = divmod(row, self._chunk_rows)
+        self._chunks[chunk][:, offset, slot] = values
+        self.counts[slot] += 1
+
+    def append(self, slots, values):
+        """Record one row of values, shape (nfields, len(slots)), for slots."""
+        if not len(slots):
+            return
+
+        self._reserve(slots.max() + 1, 0)
+        rows = self.counts[slots]
+        self._reserve(0, rows.max() + 1)
+        chunks, offsets = np.divmod(rows, self._chunk_rows)
+
+        for chunk in np.unique(chunks):  # usually a single chunk
+            m = chunks == chunk
+            self._chunks[chunk][:, offsets[m], slots[m]] = values[:, m]
+
+        self.counts[slots] += 1
+
+    def read(self, slot):
+        """Returns (nfields, count) array of the values recorded for a slot."""
+        count = int(self.counts[slot]) if slot < len(self.counts) else 0
+        if not count:
+            return np.zeros((self._nfields, 0), dtype=self._dtype)
+
+        parts = [chunk[:, :, slot] for chunk in self._chunks]
+        return np.concatenate(parts, axis=1)[:, :count]
+
+    def as_array(self):
+        """Returns (nfields, rows, agents) array of all rows recorded so far."""
+        rows = int(self.counts.max()) if len(self.counts) else 0
+        if not self._chunks:
+            return np.zeros((self._nfields, 0, 0), dtype=self._dtype)
+
+        # only copy the rows in use, chunks are mostly empty space
+        parts = [chunk[:, :rows - start, :self.size] for chunk, start in
+                 zip(self._chunks, range(0, rows, self._chunk_rows))]
+        if not parts:
+            return np.zeros((self._nfields, 0, self.size), dtype=self._dtype)
+        return np.concatenate(parts, axis=1)
+
+    @classmethod
+    def from_array(cls, values, counts, chunk_rows, dtype):
+        """Rebuild a track from as_array() values & per agent counts. Full
+        chunks are views of values, so a memory mapped array isn't copied."""
+        nfields, rows, size = values.shape
+        track = cls(nfields, chunk_rows, dtype)
+        track.size = size
+        track.counts = np.array(counts, dtype=np.int64)
+
+        for start in range(0, rows, chunk_rows):
+            chunk = values[:, start:start + chunk_rows]
+            if chunk.shape[1] < chunk_rows:
+                # the partial last chunk is copied into a full sized one
+                full = np.zeros((nfields, chunk_rows, size), dtype=dtype)
+                full[:, :chunk.shape[1]] = chunk
+                chunk = full
+            track._chunks.append(chunk)
+        return track
+
+
+class TrajectoryStore(object):
+    """Shared NumPy storage of agent moves & energy changes.
+
+    Row k of an agent holds its k-th recorded move (or harvest). Inside a
+    Simulation every live agent records once per round, so rows line up with
+    rounds and the arrays are indexed by (round, agent). The level sets how
+    often rows are recorded: FULL, NONE or every N rounds.
+    """
+
+    def __init__(self, level=FULL, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 coord_dtype=np.int32, delta_dtype=np.int32):
+        self.level = parse_level(level)
+        self.round = 0  # set by the simulation for interval recording
+        self._moves = _Track(2, chunk_rows, coord_dtype)
+        self._harvests = _Track(1, chunk_rows, delta_dtype)
+
+    @property
+    def recording(self):
+        if self.level == FULL:
+            return True
+        if self.level == NONE:
+            return False
+        return self.round % self.level == 0
+
+    def record_move(self, slot, coords):
+        if self.recording:
+            self._moves.append_one(slot, coords)
+
+    def record_moves(self, slots, ys, xs):
+        if self.recording:
+            self._moves.append(np.asarray(slots), np.array((ys, xs)))
+
+    def record_harvest(self, slot, delta):
+        if self.recording:
+            self._harvests.append_one(slot, delta)
+
+    def record_harvests(self, slots, deltas):
+        if self.recording:
+            self._harvests.append(np.asarray(slots), np.asarray(deltas)[np.newaxis])
+
+    def load(self, slot, moves, harvests):
+        """Copy existing history for a slot, regardless of the interval."""
+        if self.level == NONE:
+            return
+
+        for coords in moves:
+            self._moves.append_one(slot, coords)
+        for delta in harvests:
+            self._harvests.append_one(slot, delta)
+
+    def moves(self, slot):
+        ys, xs = self._moves.read(slot).tolist()
+        return list(zip(ys, xs))
+
+    def harvests(self, slot):
+        return self._harvests.read(slot)[0].tolist()
+
+    def state(self):
+        """Returns a dict of arrays holding the store, for checkpoints."""
+        moves, harvests = self._moves.as_array(), self._harvests.as_array()
+        return {'level': np.array(str(self.level)), 'round': np.array(self.round),
+                'chunk_rows': np.array(self._moves._chunk_rows),
+                'moves': moves, 'move_counts': self._moves.counts[:moves.shape[2]],
+                'harvests': harvests, 'harvest_counts': self._harvests.counts[:harvests.shape[2]]}
+
+    @classmethod
+    def from_state(cls, state):
+        chunk_rows = int(state['chunk_rows'])
+        moves, harvests = state['moves'], state['harvests']
+        store = cls(str(state['level']), chunk_rows, moves.dtype, harvests.dtype)
+        store.round = int(state['round'])
+        store._moves = _Track.from_array(moves, state['move_counts'], chunk_rows, moves.dtype)
+        store._harvests = _Track.from_array(harvests, state['harvest_counts'], chunk_rows,
+                                            harvests.dtype)
+        return store
+
+    def positions(self):
+        """Returns (ys, xs) arrays of shape (rows, agents)."""
+        ys, xs = self._moves.as_array()
+        return ys, xs
+
+    def energy_deltas(self):
+        """Returns an array of shape (rows, agents)."""
+        return self._harvests.as_array()[0]
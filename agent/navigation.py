@@ -0,0 +1,195 @@
+"""Shared navigation fields, so foraging agents don't each search the world.
+
+A FlowField holds the distance (in king's moves, around NODATA cells) from
+every cell to the nearest food cell, from one multi source BFS. Agents with
+no food in sight step to the neighbour nearest to food, an O(1) lookup.
+
+The field is brought up to date once a round with update(). Only cells
+whose distances can have changed, around food cells harvested or regrown
+since the last update, are visited, unless much of the food has changed.
+"""
+import numpy as np
+
+from agent.components import NODATA, Y_OFFSETS, X_OFFSETS, _dilate
+
+
+UNREACHABLE = np.iinfo(np.int32).max  # distance of cells with no path to food
+
+Y_OFFS = np.array(Y_OFFSETS)
+X_OFFS = np.array(X_OFFSETS)
+
+# the distances around each changed food cell are redone, so when more than
+# this fraction of the food cells change a full pass is quicker
+FULL_UPDATE_FRACTION = 0.05
+
+
+class FlowField(object):
+    """Distances to the nearest food cell for every cell of a food grid.
+
+    Distances are kept in a bordered array matching the grid, the border &
+    NODATA cells are UNREACHABLE.
+    """
+
+    def __init__(self):
+        self._dist = None
+        self._border_size = None
+        self._state = None  # per cell: 0 empty, 1 food, 2 NODATA, as last seen
+        self._stamp = None  # scratch space for _distinct()
+        self._num_food = 0
+        self.num_full = 0  # full & incremental update counts, for tuning
+        self.num_incremental = 0
+
+    @classmethod
+    def wrap(cls, dist, border):
+        """Create a read only field over an existing bordered distance array."""
+        field = cls()
+        field._dist = dist
+        field._border_size = border
+        return field
+
+    def move_to(self, dist):
+        """Copy the distances into dist, an array of the same shape (eg. in
+        shared memory), & keep them there until the next full update."""
+        dist[...] = self._dist
+        self._dist = dist
+
+    @property
+    def distances(self):
+        """Bordered array of distances, see Grid for the layout."""
+        return self._dist
+
+    def distance(self, coords):
+        b = self._border_size
+        return int(self._dist[coords[0] + b, coords[1] + b])
+
+    def update(self, grid):
+        """Bring the distances up to date with the food in grid."""
+        values = grid._grid
+        state = np.where(values == NODATA, 2, values > 0).astype(np.int8)
+
+        if self._state is None or state.shape != self._state.shape \
+                or grid.border_size != self._border_size:
+            self._border_size = grid.border_size
+            self._full(state)
+            return
+
+        changed = np.flatnonzero(state != self._state)
+        if not len(changed):
+            return
+
+        old = self._state.ravel()[changed]
+        new = state.ravel()[changed]
+        if (old == 2).any() or (new == 2).any() or \
+                len(changed) > FULL_UPDATE_FRACTION * self._num_food:
+            self._full(state)  # NODATA edits change the paths themselves
+            return
+
+        self._state = state
+        self._incremental(added=changed[new == 1], removed=changed[old == 1])
+
+    def _full(self, state):
+        self._state = state
+        self.num_full += 1
+        passable = state != 2
+        reached = state == 1
+        self._num_food = int(reached.sum())
+        dist = np.full(state.shape, UNREACHABLE, dtype=np.int32)
+        dist[reached] = 0
+
+        frontier = reached
+        level = 0
+        while frontier.any():
+            level += 1
+            frontier = _dilate(frontier) & passable & ~reached
+            dist[frontier] = level
+            reached |= frontier
+        self._dist = dist
+        self._stamp = np.zeros(state.size, dtype=np.intp)
+
+    def _neighbours(self, cells):
+        # flat indexes of the 8 neighbours of flat bordered cells, (N, 8)
+        ncols = self._dist.shape[1]
+        return cells[:, np.newaxis] + (Y_OFFS * ncols + X_OFFS)
+
+    def _distinct(self, cells):
+        # drop repeated cells without sorting, only one of the writes to each
+        # cell's stamp survives, whichever it is
+        index = np.arange(len(cells))
+        self._stamp[cells] = index
+        return cells[self._stamp[cells] == index]
+
+    def _incremental(self, added, removed):
+        self.num_incremental += 1
+        self._num_food += len(added) - len(removed)
+        dist = self._dist.reshape(-1)
+        passable = self._state.reshape(-1) != 2
+
+        # cells whose shortest paths may all lead to removed food: the cells
+        # one step further out from them, recursively, are cleared
+        cleared = [removed]
+        queue = removed
+        while len(queue):
+            old = dist[queue]
+            dist[queue] = UNREACHABLE
+            nbrs = self._neighbours(queue)
+            children = nbrs[dist[nbrs] == (old[:, np.newaxis] + 1)]
+            queue = self._distinct(children)
+            cleared.append(queue)
+        cleared = np.concatenate(cleared)
+
+        # refill from the reachable cells bordering the cleared area & new food
+        dist[added] = 0
+        nbrs = self._neighbours(cleared).ravel()
+        seeds = np.concatenate((nbrs[dist[nbrs] < UNREACHABLE], added))
+        self._relax(self._distinct(seeds), dist, passable)
+
+    def _relax(self, seeds, dist, passable):
+        # BFS out from seed cells of differing distances, a level at a time,
+        # lowering the distance of any cell with a shorter path
+        if not len(seeds):
+            return
+
+        seeds = seeds[np.argsort(dist[seeds], kind='stable')]
+        seed_dist = dist[seeds]
+        start = 0
+        frontier = seeds[:0]
+        level = 0
+
+        while len(frontier) or start < len(seeds):
+            if not len(frontier):
+                level = int(seed_dist[start])
+            stop = np.searchsorted(seed_dist, level, side='right')
+            frontier = np.concatenate((frontier, seeds[start:stop]))
+            start = stop
+
+            nbrs = self._neighbours(frontier[dist[frontier] == level]).ravel()
+            nbrs = self._distinct(nbrs[passable[nbrs] & (dist[nbrs] > level + 1)])
+            dist[nbrs] = level + 1
+            frontier = nbrs
+            level += 1
+
+    def directions(self, ys, xs, occupied=None):
+        """Returns (found, direction) arrays for agents at coords ys & xs,
+        the step to the reachable neighbour nearest to food (first clockwise
+        on ties). occupied is an optional (N, 8) bool array of neighbours to
+        avoid."""
+        b = self._border_size
+        dist = self._dist[ys[:, np.newaxis] + b + Y_OFFS, xs[:, np.newaxis] + b + X_OFFS]
+        if occupied is not None:
+            dist = np.where(occupied, UNREACHABLE, dist)
+
+        direction = dist.argmin(axis=1)
+        found = dist[np.arange(len(ys)), direction] < UNREACHABLE
+        return found, direction
+
+    def direction(self, coords, blocked=()):
+        """Scalar directions() for one agent, avoiding the blocked directions.
+        Returns None when no food can be reached."""
+        y, x = coords
+        b = self._border_size
+        best, best_dist = None, UNREACHABLE
+        for d in range(8):
+            dist = self._dist[y + b + Y_OFFSETS[d], x + b + X_OFFSETS[d]]
+            if dist < best_dist and d not in blocked:
+                best, best_dist = d, dist
+        return best
@@ -0,0 +1,286 @@
+import numpy as np
+
+from agent.components import NODATA, Y_OFFSETS, X_OFFSETS
+from agent.history import TrajectoryStore
+
+
+NOWHERE = -1  # coordinate value for agents without a position
+
+Y_OFFS = np.array(Y_OFFSETS)
+X_OFFS = np.array(X_OFFSETS)
+
+# WAIT is the direction of agents staying put, STEP_YS & STEP_XS give the
+# offsets of all 9 directions
+WAIT = 8
+STEP_YS = np.append(Y_OFFS, 0)
+STEP_XS = np.append(X_OFFS, 0)
+
+# direction index of a single cell step, indexed by [dy + 1, dx + 1]
+STEP_DIRECTIONS = np.full((3, 3), -1)
+STEP_DIRECTIONS[Y_OFFS + 1, X_OFFS + 1] = np.arange(8)
+
+
+def visible_targets(windows):
+    """Find the best food cell beyond the adjacent cells in square views.
+
+    windows is an (N, w, w) array with each agent at the centre. The cell with
+    the most energy wins, ties go to the nearest cell, then the first in row
+    order. Returns (found, direction) arrays, where direction is the first
+    step towards the target.
+    """
+    n, width = windows.shape[:2]
+    r = width // 2
+    yy, xx = [i.ravel() for i in np.mgrid[-r:r + 1, -r:r + 1]]
+    dist = np.maximum(abs(yy), abs(xx))
+    area = width * width
+
+    energy = windows.reshape(n, area).astype(np.int64)
+    valid = (energy > 0) & (dist > 1)
+    key = energy * ((r + 1) * area) - dist * area - np.arange(area)
+    best = np.where(valid, key, np.iinfo(np.int64).min).argmax(axis=1)
+
+    found = valid[np.arange(n), best]
+    direction = STEP_DIRECTIONS[np.sign(yy[best]) + 1, np.sign(xx[best]) + 1]
+    return found, direction
+
+
+def resolve_conflicts(ys, xs, ncols, priority):
+    """Settle agents moving to the same cell, the one with the lowest priority
+    value wins (ties go to the first). Returns a bool array of the winners."""
+    cells = np.asarray(ys, dtype=np.int64) * ncols + xs
+    order = np.lexsort((np.arange(len(cells)), priority, cells))
+    cells = cells[order]
+
+    wins = np.zeros(len(cells), dtype=bool)
+    wins[order[np.r_[True, cells[1:] != cells[:-1]]]] = True
+    return wins
+
+
+class AgentPopulation(object):
+    """Struct of arrays storage for agent state, one slot per agent.
+
+    Each field is a contiguous NumPy array, so whole population operations
+    (eg. choosing the next move for every agent) run as vectorised passes.
+    Move & harvest histories are kept in a shared TrajectoryStore.
+    """
+
+    FIELDS = (('id', np.int64),
+              ('vision', np.int32),
+              ('metabolism', np.int32),
+              ('energy', np.int64),
+              ('init_metabolism', np.int32),
+              ('init_energy', np.int64),
+              ('y', np.int32),
+              ('x', np.int32))
+
+    def __init__(self, capacity=0, history=None):
+        self._size = 0
+        self._data = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.FIELDS}
+        self.history = history if history is not None else TrajectoryStore()
+        self.on_death = None  # called with the slot of agents set dead by agent objects
+
+    @classmethod
+    def from_agents(cls, agents, history=None):
+        """Copy the state & history of agent objects into a new population."""
+        population = cls(capacity=len(agents), history=history)
+        for a in agents:
+            slot = population.append(a.id, a.vision, a.metabolism, a.energy, a.coords,
+                                     init_metabolism=a.init_metabolism,
+                                     init_energy=a.init_energy)
+            population.history.load(slot, a.move_history, a.harvest_history)
+        return population
+
+    @classmethod
+    def from_arrays(cls, ids, vision, metabolism, energy, ys, xs, history=None):
+        """Build a population straight from field arrays, one element per agent.
+
+        Starting coords are recorded in the history, as for new BasicAgents.
+        """
+        size = len(ids)
+        population = cls(capacity=size, history=history)
+        values = dict(id=ids, vision=vision, metabolism=metabolism, energy=energy,
+                      init_metabolism=metabolism, init_energy=energy, y=ys, x=xs)
+        for name, value in values.items():
+            population._data[name][:] = value
+
+        population._size = size
+        slots = np.arange(size)
+        population.history.record_moves(slots, population.y, population.x)
+        return population
+
+    def state(self):
+        """Returns a dict of the field arrays, for checkpoints."""
+        if self._data['id'].dtype == object:
+            raise ValueError('Only populations with int ids can be saved')
+        return {name: self._data[name][:self._size] for name, _ in self.FIELDS}
+
+    @classmethod
+    def from_state(cls, state, history=None):
+        """Rebuild a population from state() arrays, used without copying."""
+        population = cls(history=history)
+        population._data = {name: state[name] for name, _ in cls.FIELDS}
+        population._size = len(state['id'])
+        return population
+
+    def move_to(self, arrays):
+        """Copy the fields into arrays, a dict of arrays of the same dtypes &
+        capacity (eg. in shared memory), & keep them there."""
+        for name, _ in self.FIELDS:
+            arrays[name][...] = self._data[name]
+            self._data[name] = arrays[name]
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, size):
+        capacity = len(self._data['energy'])
+        if size <= capacity:
+            return
+
+        capacity = max(size, 2 * capacity)
+        for name, array in self._data.items():
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            self._data[name] = grown
+
+    def append(self, _id, vision, metabolism, energy, coords=None,
+               init_metabolism=None, init_energy=None):
+        """Add an agent, returning its slot."""
+        slot = self._size
+        self._reserve(slot + 1)
+
+        if not isinstance(_id, (int, np.integer)) and self._data['id'].dtype != object:
+            # ids are normally ints, anything else falls back to an object array
+            self._data['id'] = self._data['id'].astype(object)
+
+        y, x = coords if coords is not None else (NOWHERE, NOWHERE)
+        values = dict(id=_id, vision=vision, metabolism=metabolism, energy=energy,
+                      init_metabolism=metabolism if init_metabolism is None else init_metabolism,
+                      init_energy=energy if init_energy is None else init_energy,
+                      y=y, x=x)
+
+        for name, value in values.items():
+            self._data[name][slot] = value
+
+        self._size += 1
+        return slot
+
+    def get(self, name, slot):
+        """Returns a single field value as a Python scalar."""
+        value = self._data[name][slot]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def set(self, name, slot, value):
+        self._data[name][slot] = value
+
+    def coords(self, slot):
+        y = self._data['y'][slot]
+        if y == NOWHERE:
+            return None
+        return int(y), int(self._data['x'][slot])
+
+    def set_coords(self, slot, coords):
+        y, x = coords if coords is not None else (NOWHERE, NOWHERE)
+        self._data['y'][slot] = y
+        self._data['x'][slot] = x
+
+    def live_slots(self):
+        return np.flatnonzero(self.energy > 0)
+
+    def next_moves(self, grid, occupancy=None, slots=None, flow=None, sums=None):
+        """Choose the next cell for many agents at once.
+
+        Vectorised form of BasicAgent.next_move(), see move_directions().
+        Returns (ys, xs) arrays of world grid coords, in the order of slots.
+        """
+        if slots is None:
+            slots = self.live_slots()
+
+        ys, xs = self.y[slots], self.x[slots]
+        direction = move_directions(grid, occupancy, ys, xs, self.vision[slots],
+                                    self.id[slots], flow, sums)
+        return ys + STEP_YS[direction], xs + STEP_XS[direction]
+
+
+def move_directions(grid, occupancy, ys, xs, vision, ids, flow=None, sums=None):
+    """Choose the direction of the next step for agents at coords ys & xs.
+
+    The view of each agent is gathered from the grid in one pass per vision
+    radius. The best adjacent food cell not taken by another agent wins (first
+    clockwise on ties), otherwise agents step towards the best food cell in
+    their vision, or with sums (a components.SummedAreaTable of grid) into
+    the wedge of their vision holding the most food. Failing that, agents
+    follow the flow field (a navigation.FlowField) to the nearest food if one
+    is given, or search in a direction seeded by their id. occupancy is
+    anything with an occupied(ys, xs) method, eg. an OccupancyGrid.
+
+    Returns an array of direction indexes (see Y_OFFSETS & X_OFFSETS), WAIT
+    for agents boxed in by NODATA cells when following a flow field.
+    """
+    vision = np.maximum(vision, 1)
+    direction = np.zeros(len(ys), dtype=np.intp)
+
+    for radius in np.unique(vision):
+        group = np.flatnonzero(vision == radius)
+        direction[group] = _directions(grid, occupancy, ys[group], xs[group],
+                                       ids[group], radius, flow, sums)
+    return direction
+
+
+def _directions(grid, occupancy, ys, xs, ids, radius, flow=None, sums=None):
+    windows = grid.views(ys, xs, radius)
+    energy = windows[:, radius + Y_OFFS, radius + X_OFFS]
+    rows = np.arange(len(ys))
+
+    if occupancy is not None:
+        occupied = occupancy.occupied(ys[:, np.newaxis] + Y_OFFS, xs[:, np.newaxis] + X_OFFS)
+    else:
+        occupied = np.zeros(energy.shape, dtype=bool)
+
+    # best food cell, argmax picks the first direction on ties
+    food = (energy > 0) & ~occupied
+    best = np.where(food, energy, 0).argmax(axis=1)
+    has_food = food.any(axis=1)
+
+    # otherwise step towards food further out in the agent's vision
+    if radius > 1:
+        if sums is not None:
+            wedges = sums.wedge_sums(ys, xs, radius)
+            step = wedges.argmax(axis=1)
+            found = wedges[rows, step] > 0
+        else:
+            found, step = visible_targets(windows)
+        blocked = (energy == NODATA) | occupied
+        has_step = found & ~blocked[rows, step]
+    else:
+        step = has_step = np.zeros(len(ys), dtype=bool)
+
+    # then the flow field towards the nearest food
+    if flow is not None:
+        has_flow, flow_step = flow.directions(ys, xs, occupied)
+        step = np.where(has_step, step, flow_step)
+        has_step = has_step | has_flow
+
+    # search from the id seeded direction for the first legal cell
+    blocked = (energy == NODATA) & ~occupied
+    order = (ids.astype(np.int64)[:, np.newaxis] + np.arange(8)) % 8
+    blocked = np.take_along_axis(blocked, order, axis=1)
+    search = order[rows, blocked.argmin(axis=1)]
+
+    stuck = blocked.all(axis=1) & ~has_food & ~has_step
+    if stuck.any():
+        if flow is None:
+            raise NotImplementedError('Add better search algorithm')
+        search[stuck] = WAIT
+
+    return np.where(has_food, best, np.where(has_step, step, search))
+
+
+def _field(name):
+    def fget(self):
+        return self._data[name][:self._size]
+    return property(fget, doc='Zero-copy view of the {} of each agent.'.format(name))
+
+
+for _name, _ in AgentPopulation.FIELDS:
+    setattr(AgentPopulation, _name, _field(_name))
@@ -0,0 +1,147 @@
+"""Per phase timing (& optional memory tracing) of simulation rounds.
+
+A Simulation always has a profiler, NULL_PROFILER unless profiling is turned
+on, so do_round() only pays for a few attribute checks when disabled.
+"""
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+_IGNORE = (tracemalloc.Filter(False, tracemalloc.__file__),
+           tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+           tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'))
+
+
+class PhaseProfiler(object):
+    """Collects wall time & call counts per named phase, in total & by round.
+
+    With trace_memory set, tracemalloc snapshots taken every memory_every
+    rounds attribute memory growth to source lines (eg. history recording).
+    """
+
+    enabled = True
+
+    def __init__(self, trace_memory=False, memory_every=10, frames=1):
+        self.totals = {}  # phase -> seconds
+        self.counts = {}  # phase -> calls
+        self.rounds = []  # phase -> seconds dict for each round
+        self._round = None
+
+        self.trace_memory = trace_memory
+        self.memory_every = memory_every
+        self._growth = {}  # traceback -> bytes
+        self._snapshot = None
+        self._started = False  # stop tracing on close only if started here
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self._started = True
+            self._snapshot = self._take_snapshot()
+
+    def start_round(self):
+        self._round = {}
+        self.rounds.append(self._round)
+
+    def end_round(self):
+        if self.trace_memory and len(self.rounds) % self.memory_every == 0:
+            self._sample_memory()
+
+    def add(self, name, seconds, calls=1):
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + calls
+        if self._round is not None:
+            self._round[name] = self._round.get(name, 0.0) + seconds
+
+    def lap(self, name, start):
+        """Add the time since start to a phase, returns the current time for
+        the next lap."""
+        now = time.perf_counter()
+        self.add(name, now - start)
+        return now
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    @staticmethod
+    def _take_snapshot():
+        # leave out the tracing & import machinery
+        return tracemalloc.take_snapshot().filter_traces(_IGNORE)
+
+    def _sample_memory(self):
+        snapshot = self._take_snapshot()
+        for stat in snapshot.compare_to(self._snapshot, 'lineno'):
+            key = str(stat.traceback)
+            self._growth[key] = self._growth.get(key, 0) + stat.size_diff
+        self._snapshot = snapshot
+
+    def memory_growth(self, top=10):
+        """Returns [(source line, bytes)] with the most memory growth."""
+        growth = sorted(self._growth.items(), key=lambda item: -item[1])
+        return growth[:top]
+
+    def per_round(self, name):
+        """Returns the seconds spent in a phase for each round."""
+        return [r.get(name, 0.0) for r in self.rounds]
+
+    def as_dict(self):
+        return dict(totals=dict(self.totals), counts=dict(self.counts),
+                    rounds=[dict(r) for r in self.rounds],
+                    memory_growth=self.memory_growth(top=None) if self.trace_memory else [])
+
+    def report(self, out, top=10):
+        """Prints a table of phases, slowest first."""
+        total = sum(self.totals.values()) or 1.0
+        nrounds = len(self.rounds) or 1
+
+        print('Phase timings over {} rounds:'.format(len(self.rounds)), file=out)
+        print('{:14} {:>10} {:>10} {:>12} {:>6}'.format('phase', 'calls', 'total s',
+                                                      'per round s', '%'), file=out)
+        for name in sorted(self.totals, key=lambda n: -self.totals[n]):
+            seconds = self.totals[name]
+            print('{:14} {:>10} {:>10.4f} {:>12.6f} {:>6.1f}'.format(
+                name, self.counts[name], seconds, seconds / nrounds,
+                100 * seconds / total), file=out)
+
+        if self.trace_memory:
+            print('\nMemory growth:', file=out)
+            for line, size in self.memory_growth(top):
+                print('{:>12,d} B  {}'.format(size, line), file=out)
+
+    def close(self):
+        if self._started and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started = False
+
+
+class NullProfiler(object):
+    """Profiler that records nothing."""
+
+    enabled = False
+
+    def start_round(self):
+        pass
+
+    def end_round(self):
+        pass
+
+    def add(self, name, seconds, calls=1):
+        pass
+
+    def lap(self, name, start):
+        return start
+
+    def phase(self, name):
+        return _NULL_CONTEXT
+
+    def close(self):
+        pass
+
+
+_NULL_CONTEXT = nullcontext()
+NULL_PROFILER = NullProfiler()
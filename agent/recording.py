@@ -0,0 +1,209 @@
+"""Compact recordings of a simulation for replay as images.
+
+A recording is a single compressed .npz container holding a keyframe (the
+food grid & agent positions at the start) plus sparse per round deltas:
+
+* cell_round, cell_y, cell_x, cell_value: food grid cells changed each round
+* move_round, move_slot, move_y, move_x: agents which changed cell
+* death_round, death_slot: agents which died
+
+Recording costs time & space in proportion to the changes in each round, any
+frame can be rebuilt later & exported as a GIF or PNG sequence.
+"""
+import os
+import argparse
+
+import numpy as np
+from PIL import Image
+
+from agent import viz
+
+
+class FrameRecorder(object):
+    """Records a keyframe & per round deltas of a simulation."""
+
+    def __init__(self, path):
+        self.path = path
+        self.keyframe = None
+        self._cells = []
+        self._moves = []
+        self._deaths = []
+        self.num_rounds = 0
+
+    @property
+    def started(self):
+        return self.keyframe is not None
+
+    def start(self, sim):
+        """Capture the keyframe, the state before the next round."""
+        pop = sim.population
+        sim.world.track_changes = True
+        self.keyframe = np.array(sim.world.food_grid[:, :])
+        self._first_round = sim.round
+        self._start = (np.array(pop.y), np.array(pop.x), pop.energy > 0)
+        self._ys, self._xs, self._alive = [np.array(a) for a in self._start]
+
+    def record(self, sim):
+        """Add the changes made by the round just run."""
+        pop = sim.population
+        _round = sim.round - self._first_round
+
+        ys, xs = sim.changed_cells()
+        if len(ys):
+            values = sim.world.food_grid.get_many(ys, xs)
+            self._cells.append(_stack(_round, ys, xs, values))
+
+        # only agents which changed cell, compared with the last round
+        ys, xs = pop.y, pop.x
+        moved = np.flatnonzero((ys != self._ys) | (xs != self._xs))
+        if len(moved):
+            self._moves.append(_stack(_round, moved, ys[moved], xs[moved]))
+            self._ys[moved], self._xs[moved] = ys[moved], xs[moved]
+
+        alive = pop.energy > 0
+        died = np.flatnonzero(self._alive & ~alive)
+        if len(died):
+            self._deaths.append(_stack(_round, died))
+            self._alive = alive
+
+        self.num_rounds = _round
+
+    def save(self):
+        """Write the recording so far, replacing any earlier save."""
+        cells = _concat(self._cells, 4)
+        moves = _concat(self._moves, 4)
+        deaths = _concat(self._deaths, 2)
+        ys, xs, alive = self._start
+
+        with open(self.path, 'wb') as fd:
+            np.savez_compressed(fd, keyframe=self.keyframe, num_rounds=self.num_rounds,
+                                agent_y=ys, agent_x=xs, agent_alive=alive,
+                                cell_round=cells[0], cell_y=cells[1],
+                                cell_x=cells[2], cell_value=cells[3],
+                                move_round=moves[0], move_slot=moves[1],
+                                move_y=moves[2], move_x=moves[3],
+                                death_round=deaths[0], death_slot=deaths[1])
+
+
+def _stack(_round, *arrays):
+    return np.array((np.full(len(arrays[0]), _round),) + arrays, dtype=np.int64)
+
+
+def _concat(parts, nfields):
+    if not parts:
+        return np.zeros((nfields, 0), dtype=np.int64)
+    return np.concatenate(parts, axis=1)
+
+
+class Replay(object):
+    """Rebuilds frames from a recording."""
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self._data = {name: data[name] for name in data.files}
+
+        self.keyframe = self._data['keyframe']
+        self.num_rounds = int(self._data['num_rounds'])
+
+    def __len__(self):
+        return self.num_rounds + 1  # includes the keyframe, round 0
+
+    def _upto(self, prefix, _round):
+        # records are in round order, returns the end of those up to _round
+        return np.searchsorted(self._data[prefix + '_round'], _round, side='right')
+
+    def frame(self, _round):
+        """Returns (grid, ys, xs) at the end of a round, ys & xs are the
+        coords of the agents alive then."""
+        if not 0 <= _round <= self.num_rounds:
+            raise IndexError('No round {} in the recording'.format(_round))
+
+        d = self._data
+        grid = np.array(self.keyframe)
+        stop = self._upto('cell', _round)
+        grid[d['cell_y'][:stop], d['cell_x'][:stop]] = d['cell_value'][:stop]  # later records win
+
+        ys, xs = np.array(d['agent_y']), np.array(d['agent_x'])
+        stop = self._upto('move', _round)
+        slots = d['move_slot'][:stop]
+        ys[slots], xs[slots] = d['move_y'][:stop], d['move_x'][:stop]
+
+        alive = np.array(d['agent_alive'])
+        alive[d['death_slot'][:self._upto('death', _round)]] = False
+        return grid, ys[alive], xs[alive]
+
+    def frames(self, stride=1):
+        """Yield (round, grid, ys, xs) for every stride-th round, applying
+        each round's deltas in turn rather than rebuilding from the keyframe."""
+        d = self._data
+        grid = np.array(self.keyframe)
+        ys, xs = np.array(d['agent_y']), np.array(d['agent_x'])
+        alive = np.array(d['agent_alive'])
+        bounds = [np.searchsorted(d[p + '_round'], np.arange(len(self) + 1))
+                  for p in ('cell', 'move', 'death')]
+
+        for r in range(len(self)):
+            cells, moves, deaths = [slice(b[r], b[r + 1]) for b in bounds]
+            grid[d['cell_y'][cells], d['cell_x'][cells]] = d['cell_value'][cells]
+            slots = d['move_slot'][moves]
+            ys[slots], xs[slots] = d['move_y'][moves], d['move_x'][moves]
+            alive[d['death_slot'][deaths]] = False
+
+            if r % stride == 0:
+                yield r, grid, ys[alive], xs[alive]
+
+    def render(self, _round, scale=1, palette=viz.MONOCHROME):
+        """Returns an image array of one frame."""
+        return _render(*self.frame(_round), scale, palette)
+
+    def export_pngs(self, _dir, scale=1, stride=1, palette=viz.MONOCHROME):
+        """Save frames as a numbered PNG sequence, returning the paths."""
+        paths = []
+        for r, grid, ys, xs in self.frames(stride):
+            path = os.path.join(_dir, viz.FRAME_NAME.format(r))
+            Image.fromarray(_render(grid, ys, xs, scale, palette)).save(path)
+            paths.append(path)
+        return paths
+
+    def export_gif(self, path, scale=1, stride=1, duration=100, palette=viz.MONOCHROME):
+        """Save frames as an animated GIF, duration is ms per frame."""
+        images = [Image.fromarray(_render(grid, ys, xs, scale, palette))
+                  for _, grid, ys, xs in self.frames(stride)]
+        images[0].save(path, save_all=True, append_images=images[1:],
+                       duration=duration, loop=0)
+
+
+def _render(grid, ys, xs, scale, palette):
+    data = palette(grid)
+    viz.draw_agents(data, ys, xs)
+    return viz.upscale(data, scale) if scale > 1 else data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a simulation recording')
+    parser.add_argument('recording')
+    parser.add_argument('--gif', help='save an animated GIF to this path')
+    parser.add_argument('--pngs', help='save a PNG sequence to this directory')
+    parser.add_argument('--frame', type=int, help='only save this round (with --pngs)')
+    parser.add_argument('--scale', type=int, default=10)
+    parser.add_argument('--stride', type=int, default=1)
+    parser.add_argument('--duration', type=int, default=100, help='ms per GIF frame')
+    args = parser.parse_args(argv)
+
+    replay = Replay(args.recording)
+    if args.gif:
+        replay.export_gif(args.gif, args.scale, args.stride, args.duration)
+        print(args.gif, 'saved')
+
+    if args.pngs:
+        if args.frame is not None:
+            path = os.path.join(args.pngs, viz.FRAME_NAME.format(args.frame))
+            Image.fromarray(replay.render(args.frame, args.scale)).save(path)
+            print(path, 'saved')
+        else:
+            paths = replay.export_pngs(args.pngs, args.scale, args.stride)
+            print(len(paths), 'frames saved to', args.pngs)
+
+
+if __name__ == '__main__':
+    main()
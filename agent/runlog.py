@@ -0,0 +1,245 @@
+"""Binary, append only log of a simulation run.
+
+A log is a pair of files:
+
+* <path>: a fixed header, a table of static agent data, the initial food grid
+  and then one fixed width record per round (round number, agent ys, xs and
+  energies). Round 0 holds the starting state.
+* <path>.cells: (round, y, x, value) records of food grid cells changed each
+  round.
+
+Both are written incrementally during Simulation.run() & read back through
+np.memmap, so nothing needs to be loaded into memory in full.
+"""
+import os
+
+import numpy as np
+
+from agent.components import NODATA
+
+
+MAGIC = b'AGRUNLOG'
+VERSION = 1
+CELLS_SUFFIX = '.cells'
+
+HEADER = np.dtype([('magic', 'S8'),
+                   ('version', '<u4'),
+                   ('nrows', '<u4'),
+                   ('ncols', '<u4'),
+                   ('nagents', '<u4'),
+                   ('grid_dtype', 'S8')])
+
+AGENT = np.dtype([('id', '<i8'),
+                  ('vision', '<i4'),
+                  ('metabolism', '<i4'),
+                  ('init_energy', '<i8')])
+
+CELL = np.dtype([('round', '<i4'),
+                 ('y', '<i4'),
+                 ('x', '<i4'),
+                 ('value', '<i4')])
+
+
+def round_dtype(nagents):
+    return np.dtype([('round', '<i4'),
+                     ('y', '<i4', (nagents,)),
+                     ('x', '<i4', (nagents,)),
+                     ('energy', '<i8', (nagents,))])
+
+
+class RunLogWriter(object):
+    """Writes a run log incrementally, one record per round."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._cells_fd = None
+        self._world = None  # changes of its cells are tracked until close()
+        self._tracked = False  # the world's track_changes before the log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def started(self):
+        return self._fd is not None
+
+    def write_header(self, sim):
+        """Write static data & the state at the start of the run."""
+        pop = sim.population
+        grid = sim.world.food_grid
+        nagents = len(pop)
+
+        header = np.zeros(1, dtype=HEADER)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['nrows'], header['ncols'] = grid.shape
+        header['nagents'] = nagents
+        header['grid_dtype'] = grid.dtype.str
+
+        agents = np.zeros(nagents, dtype=AGENT)
+        for name in AGENT.names:
+            agents[name] = getattr(pop, name)
+
+        self._fd = open(self.path, 'wb')
+        self._cells_fd = open(self.path + CELLS_SUFFIX, 'wb')
+        self._record_dtype = round_dtype(nagents)
+        self._world, self._tracked = sim.world, sim.world.track_changes
+        sim.world.track_changes = True
+
+        header.tofile(self._fd)
+        agents.tofile(self._fd)
+        np.ascontiguousarray(grid[:, :]).tofile(self._fd)
+        self._write_agents(sim, 0)
+
+    def _write_agents(self, sim, _round):
+        pop = sim.population
+        record = np.zeros(1, dtype=self._record_dtype)
+        record['round'] = _round
+        record['y'], record['x'], record['energy'] = pop.y, pop.x, pop.energy
+        record.tofile(self._fd)
+
+    def write_round(self, sim):
+        """Append the agent state & changed cells for the round just run."""
+        self._write_agents(sim, sim.round)
+
+        ys, xs = sim.changed_cells()
+        cells = np.zeros(len(ys), dtype=CELL)
+        cells['round'] = sim.round
+        cells['y'], cells['x'] = ys, xs
+        cells['value'] = sim.world.food_grid.get_many(ys, xs)
+        cells.tofile(self._cells_fd)
+
+    def close(self):
+        for fd in (self._fd, self._cells_fd):
+            if fd is not None:
+                fd.close()
+        self._fd = self._cells_fd = None
+
+        if self._world is not None:
+            self._world.track_changes = self._tracked
+            if not self._tracked:
+                self._world.pop_changes()  # no one else will read them
+            self._world = None
+
+
+class RunLogReader(object):
+    """Memory mapped access to a run log."""
+
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, dtype=HEADER, count=1)
+        if not len(header) or header['magic'][0] != MAGIC:
+            raise IOError('Not a run log: {}'.format(path))
+
+        header = header[0]
+        self.nrows, self.ncols = int(header['nrows']), int(header['ncols'])
+        self.nagents = int(header['nagents'])
+        grid_dtype = np.dtype(header['grid_dtype'].decode())
+
+        offset = HEADER.itemsize
+        self.agents = self._map(path, AGENT, offset, self.nagents)
+        offset += AGENT.itemsize * self.nagents
+        self.initial_grid = self._map(path, grid_dtype, offset, self.nrows * self.ncols)
+        self.initial_grid = self.initial_grid.reshape((self.nrows, self.ncols))
+        offset += grid_dtype.itemsize * self.nrows * self.ncols
+
+        record_dtype = round_dtype(self.nagents)
+        nrecords = (os.path.getsize(path) - offset) // record_dtype.itemsize
+        self.rounds = self._map(path, record_dtype, offset, nrecords)
+
+        cells_path = path + CELLS_SUFFIX
+        ncells = os.path.getsize(cells_path) // CELL.itemsize
+        self.cells = self._map(cells_path, CELL, 0, ncells)
+
+    @staticmethod
+    def _map(path, dtype, offset, count):
+        if not count:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+
+    @property
+    def final_round(self):
+        return int(self.rounds['round'][-1])
+
+    def cells_for(self, _round):
+        """Returns the cell records for a single round."""
+        rounds = self.cells['round']
+        start, stop = np.searchsorted(rounds, [_round, _round + 1])
+        return self.cells[start:stop]
+
+    def grid_at(self, _round):
+        """Rebuild the food grid as it was at the end of a round."""
+        grid = np.array(self.initial_grid)
+        stop = np.searchsorted(self.cells['round'], _round + 1)
+        cells = self.cells[:stop]
+        grid[cells['y'], cells['x']] = cells['value']  # later records win
+        return grid
+
+
+def render_report(reader, out):
+    """Prints rough report of simulation details from a run log.
+
+    Same layout as Simulation.report(). Harvests are derived from the energy
+    records and final views are taken at the end of the round of death.
+    """
+    energy = np.asarray(reader.rounds['energy'])
+    ys, xs = np.asarray(reader.rounds['y']), np.asarray(reader.rounds['x'])
+    metabolism = np.asarray(reader.agents['metabolism'])
+    alive = energy > 0
+
+    num_dead, avg_energy, avg_metabolism = [], [], []
+    for r in range(1, len(energy)):
+        n_agents = int(alive[r].sum())
+        if n_agents:
+            avg_energy.append(round(float(energy[r][alive[r]].sum()) / n_agents, 2))
+            avg_metabolism.append(round(float(metabolism[alive[r]].sum()) / n_agents, 2))
+            num_dead.append(int((~alive[r]).sum()))
+
+    def sub_report(i):
+        # agents act in every round they start alive
+        acted = np.flatnonzero(alive[:-1, i]) + 1
+        harvests = energy[acted, i] - energy[acted - 1, i] + metabolism[i]
+        moves = [(int(ys[0, i]), int(xs[0, i]))]
+        moves += list(zip(ys[acted, i].tolist(), xs[acted, i].tolist()))
+
+        a = reader.agents[i]
+        text = 'Agent {}: vis={} metabol={} energy={} coords={}'
+        print(text.format(a['id'], a['vision'], a['metabolism'], energy[-1, i], moves[-1]), file=out)
+        print('Energy harvests:', harvests.tolist(), file=out)
+        print('Moves:', moves, file=out)
+        print(file=out)
+        return acted
+
+    print('Per turn data:', file=out)
+    print('--------------', file=out)
+    print('Got to round:   ', reader.final_round, file=out)
+    print('Num dead agents:', num_dead, file=out)
+    print('Average energy: ', avg_energy, file=out)
+    print('Average metabolism: ', avg_metabolism, file=out)
+
+    live = np.flatnonzero(alive[-1])
+    live = live[np.argsort(-energy[-1, live], kind='stable')]
+
+    print('\nLive Agents - Stats', file=out)
+    print('---------------------', file=out)
+    for i in live:
+        sub_report(i)
+        print('--------------------', file=out)
+
+    print('\nDead Agents - Stats', file=out)
+    print('---------------------', file=out)
+
+    for i in np.flatnonzero(~alive[-1]):
+        acted = sub_report(i)
+        if len(acted):
+            death = acted[-1]
+            grid = np.pad(reader.grid_at(death), 1, constant_values=NODATA)
+            y, x = ys[death, i] + 1, xs[death, i] + 1
+            print('Final view:\n', grid[y - 1:y + 2, x - 1:x + 2], file=out)
+        else:
+            print('Final view:\n', None, file=out)
+        print('--------------------', file=out)
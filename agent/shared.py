@@ -0,0 +1,54 @@
+"""Named arrays in one shared memory block, for worker processes.
+
+The parent process creates the block & passes its spec to workers, which
+attach to it by name, so arrays are shared without copying or pickling.
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArrays(object):
+    """Named arrays packed into one shared memory block."""
+
+    def __init__(self, fields):
+        # fields is a sequence of (name, shape, dtype str, or descr of a
+        # record dtype)
+        fields = tuple((name, tuple(shape), dtype) for name, shape, dtype in fields)
+        _, size = self._layout(fields)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.spec = (self._shm.name, fields)
+        self.arrays = self._views(self._shm, fields)
+
+    @staticmethod
+    def _layout(fields):
+        offsets, size = [], 0
+        for _, shape, dtype in fields:
+            offsets.append(size)
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            size += -(-nbytes // 8) * 8  # keep each array aligned
+        return offsets, size
+
+    @classmethod
+    def _views(cls, shm, fields):
+        offsets, _ = cls._layout(fields)
+        return {name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+                for (name, shape, dtype), offset in zip(fields, offsets)}
+
+    @classmethod
+    def attach(cls, spec, readonly=False):
+        """Returns (arrays, SharedMemory) for a spec, keep the SharedMemory
+        referenced while the arrays are in use."""
+        name, fields = spec
+        shm = shared_memory.SharedMemory(name=name)
+        arrays = cls._views(shm, fields)
+        if readonly:
+            for array in arrays.values():
+                array.flags.writeable = False
+        return arrays, shm
+
+    def close(self):
+        """Close & unlink the block, no views of it can be left in use."""
+        self.arrays = {}
+        self._shm.close()
+        self._shm.unlink()
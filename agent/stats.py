@@ -0,0 +1,300 @@
+"""Per round statistics, as a pluggable set of named metrics.
+
+A StatsEngine samples a simulation every interval rounds. Each live agent
+field a metric asks for is gathered once per sample & shared, so every
+metric is a vectorised pass over the same arrays. Samples are kept in memory
+(as a series per metric) and/or streamed to a CSV or NDJSON sink, flushed
+as they're written, so long runs can keep constant memory:
+
+    engine = StatsEngine(interval=10, sink=open_sink('stats.csv'), keep=False)
+    engine.register('energy', Percentiles('energy', (10, 50, 90)))
+
+A metric is any callable taking a Sample & returning a number, or a dict of
+numbers which are saved as '<name>_<key>'.
+"""
+import os
+import csv
+import json
+
+import numpy as np
+
+
+class Sample(object):
+    """The state of a simulation at one round, as seen by metrics.
+
+    Fields of the live agents (energy, metabolism, vision, y, x...) are
+    gathered from the population on first access.
+    """
+
+    def __init__(self, sim):
+        self.round = sim.round
+        self.num_live = sim.num_live
+        self.num_dead = sim.num_dead
+        self._population = sim.population
+        self._live = sim._live_slots
+        self._fields = {}
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name not in self._fields:
+            self._fields[name] = getattr(self._population, name)[self._live]
+        return self._fields[name]
+
+
+class Mean(object):
+    """Mean of a live agent field, rounded to places."""
+
+    def __init__(self, field, places=2):
+        self.field = field
+        self.places = places
+
+    def __call__(self, sample):
+        values = getattr(sample, self.field)
+        return round(float(values.sum()) / len(values), self.places) if len(values) else 0.0
+
+
+class Percentiles(object):
+    """Percentiles of a live agent field this round, as {'p<q>': value}."""
+
+    def __init__(self, field, percentiles=(10, 50, 90)):
+        self.field = field
+        self.percentiles = tuple(percentiles)
+
+    def __call__(self, sample):
+        values = getattr(sample, self.field)
+        if not len(values):
+            return {'p{}'.format(q): 0.0 for q in self.percentiles}
+        found = np.percentile(values, self.percentiles)
+        return {'p{}'.format(q): float(v) for q, v in zip(self.percentiles, found)}
+
+
+class StreamingHistogram(object):
+    """Counts of values in bins of bin_width from 0, growing as larger values
+    turn up. Memory depends on the range of values, not on how many."""
+
+    def __init__(self, bin_width=1):
+        self.bin_width = bin_width
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, values):
+        bins = np.maximum(np.asarray(values), 0) // self.bin_width
+        counts = np.bincount(bins.astype(np.intp).ravel())
+        if len(counts) > len(self.counts):
+            counts[:len(self.counts)] += self.counts
+            self.counts = counts
+        else:
+            self.counts[:len(counts)] += counts
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    @property
+    def edges(self):
+        """Lower edges of the bins."""
+        return np.arange(len(self.counts)) * self.bin_width
+
+    def percentile(self, q):
+        """The lower edge of the bin holding the q-th percentile."""
+        if not self.total:
+            return 0
+        rank = q / 100 * (self.total - 1)
+        return int(np.searchsorted(self.counts.cumsum(), rank, side='right')) * self.bin_width
+
+
+class Histogram(object):
+    """Running histogram of a live agent field over every sample, reported as
+    {'p<q>': value} percentiles of all the values seen so far."""
+
+    def __init__(self, field, bin_width=1, percentiles=(50,)):
+        self.field = field
+        self.percentiles = tuple(percentiles)
+        self.histogram = StreamingHistogram(bin_width)
+
+    def __call__(self, sample):
+        self.histogram.add(getattr(sample, self.field))
+        return {'p{}'.format(q): self.histogram.percentile(q) for q in self.percentiles}
+
+    def state(self):
+        return {'counts': self.histogram.counts}
+
+    def load_state(self, state):
+        self.histogram.counts = np.array(state['counts'])
+
+
+def num_dead(sample):
+    return sample.num_dead
+
+
+def num_live(sample):
+    return sample.num_live
+
+
+# factories of metrics which can be picked by name, eg. with STATS_METRICS
+STANDARD_METRICS = {
+    'average_energy': lambda: Mean('energy'),
+    'average_metabolism': lambda: Mean('metabolism'),
+    'num_dead_agents': lambda: num_dead,
+    'num_live': lambda: num_live,
+    'energy': lambda: Percentiles('energy'),
+    'energy_histogram': lambda: Histogram('energy', percentiles=(10, 50, 90)),
+    'vision': lambda: Percentiles('vision'),
+}
+DEFAULT_METRICS = ('average_energy', 'average_metabolism', 'num_dead_agents')
+
+
+class StatsEngine(object):
+    """Samples registered metrics every interval rounds.
+
+    With keep set, each sample is added to series (a list of values per
+    column), sink is anything with write(row) & close(), eg. CsvSink.
+    """
+
+    def __init__(self, interval=1, sink=None, keep=True):
+        if interval < 1:
+            raise ValueError('Stats interval must be >= 1: {}'.format(interval))
+        self.interval = interval
+        self.sink = sink
+        self.keep = keep
+        self.metrics = {}  # name -> metric, in the order registered
+        self.series = {}  # column -> values
+        self.last = None  # the latest sample row
+
+    @classmethod
+    def standard(cls, names=DEFAULT_METRICS, **kwargs):
+        """An engine with STANDARD_METRICS picked by name."""
+        engine = cls(**kwargs)
+        for name in names:
+            if name not in STANDARD_METRICS:
+                raise ValueError('Unknown metric: {}'.format(name))
+            engine.register(name, STANDARD_METRICS[name]())
+        return engine
+
+    def register(self, name, metric):
+        if name in self.metrics:
+            raise ValueError('Metric already registered: {}'.format(name))
+        self.metrics[name] = metric
+
+    def due(self, _round):
+        return _round % self.interval == 0
+
+    def collect(self, sim):
+        """Sample the metrics for the current round of sim, returns the row
+        of values."""
+        sample = Sample(sim)
+        row = {'round': sample.round}
+        for name, metric in self.metrics.items():
+            value = metric(sample)
+            if isinstance(value, dict):
+                for key, v in value.items():
+                    row['{}_{}'.format(name, key)] = v
+            else:
+                row[name] = value
+
+        if self.keep:
+            for column, value in row.items():
+                self.series.setdefault(column, []).append(value)
+        if self.sink is not None:
+            self.sink.write(row)
+        self.last = row
+        return row
+
+    def state(self):
+        """Returns a dict of arrays, the kept series & metric state."""
+        state = {'series.' + column: np.array(values) for column, values in self.series.items()}
+        for name, metric in self.metrics.items():
+            if hasattr(metric, 'state'):
+                for key, value in metric.state().items():
+                    state['metric.{}.{}'.format(name, key)] = value
+        return state
+
+    def load_state(self, state):
+        for key, value in state.items():
+            kind, _, rest = key.partition('.')
+            if kind == 'series':
+                self.series[rest] = value.tolist()
+            elif kind == 'metric':
+                name, _, field = rest.rpartition('.')
+                if hasattr(self.metrics.get(name), 'load_state'):
+                    self.metrics[name].load_state({field: value})
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+
+
+class CsvSink(object):
+    """Writes sample rows to a CSV file, with a header. The columns are those
+    of the first row.
+
+    The file is truncated unless append is set (eg. to carry on a restored
+    run), appended rows need the same columns as the existing header.
+    """
+
+    def __init__(self, path, append=False):
+        self._columns = None  # of the existing header, when appending
+        if append and os.path.exists(path):
+            with open(path, newline='') as fd:
+                self._columns = next(csv.reader(fd), None)
+        self._fd = open(path, 'a' if append else 'w', newline='')
+        self._writer = None
+
+    def write(self, row):
+        if self._writer is None:
+            columns = list(row)
+            _check_columns(self._columns, columns, self._fd.name)
+            self._writer = csv.DictWriter(self._fd, columns)
+            if self._columns is None:
+                self._writer.writeheader()
+        self._writer.writerow(row)
+        self._fd.flush()
+
+    def close(self):
+        self._fd.close()
+
+
+class NdjsonSink(object):
+    """Writes sample rows to a file as JSON objects, one per line.
+
+    The file is truncated unless append is set, appended rows need the same
+    keys as the first row already in the file.
+    """
+
+    def __init__(self, path, append=False):
+        self._columns = None
+        if append and os.path.exists(path):
+            with open(path) as fd:
+                line = fd.readline()
+            self._columns = list(json.loads(line)) if line.strip() else None
+        self._fd = open(path, 'a' if append else 'w')
+
+    def write(self, row):
+        if self._columns is not None:
+            _check_columns(self._columns, list(row), self._fd.name)
+            self._columns = None  # only the first row needs checking
+        self._fd.write(json.dumps(row, default=_plain) + '\n')
+        self._fd.flush()
+
+    def close(self):
+        self._fd.close()
+
+
+def _check_columns(existing, columns, path):
+    if existing is not None and existing != columns:
+        raise ValueError('Stats columns {} differ from those already in {}: {}'.format(
+            columns, path, existing))
+
+
+def _plain(value):
+    # numpy scalars from custom metrics
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Not JSON serializable: {!r}'.format(value))
+
+
+def open_sink(path, append=False):
+    """Returns a CsvSink for .csv paths, otherwise an NdjsonSink."""
+    if path.lower().endswith('.csv'):
+        return CsvSink(path, append)
+    return NdjsonSink(path, append)
@@ -0,0 +1,171 @@
+"""Parameter sweeps: many simulation runs fanned out over a process pool.
+
+Each world file is parsed once, into shared memory, & every worker process
+maps the same read only block. Run summaries are streamed to a CSV table as
+runs finish, in completion order.
+"""
+import os
+import csv
+import sys
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from agent.basicsim import Simulation, generate_agents_random
+from agent.components import NODATA, Grid
+from agent.shared import SharedArrays
+
+
+SUMMARY_FIELDS = ('run', 'seed', 'final_round', 'num_live', 'num_dead', 'average_energy')
+
+# run settings which aren't Simulation config values
+RUN_PARAMS = ('grid', 'num_agents', 'vision', 'metabolism', 'energy')
+
+DEFAULT_PARAMS = dict(num_agents=25, vision=(1, 2), metabolism=(1, 3), energy=(10, 30))
+
+
+def parameter_grid(**options):
+    """Returns a list of dicts, one for each combination of option values.
+
+    eg. parameter_grid(num_agents=[10, 20], RECOVERY_RATE=[1]) gives 2 dicts.
+    """
+    names = sorted(options)
+    return [dict(zip(names, values)) for values in
+            itertools.product(*(options[n] for n in names))]
+
+
+class SharedGrid(object):
+    """A bordered grid in a named shared memory block.
+
+    Made by the parent process, workers attach to the block by name & wrap
+    it in a read only Grid, without copying or parsing.
+    """
+
+    def __init__(self, grid):
+        array = grid._grid
+        self._shared = SharedArrays([('grid', array.shape, array.dtype.str)])
+        self._shared.arrays['grid'][:] = array
+        self.spec = (self._shared.spec, grid.border_size)
+
+    @staticmethod
+    def attach(spec):
+        """Returns (Grid, SharedMemory) for a spec, see SharedArrays.attach()."""
+        shared_spec, border = spec
+        arrays, shm = SharedArrays.attach(shared_spec, readonly=True)
+        return Grid.wrap(arrays['grid'], border), shm
+
+    def close(self):
+        self._shared.close()
+
+
+_grids = {}  # per worker: grid path -> (Grid, SharedMemory)
+
+
+def _init_worker(specs):
+    for path, spec in specs.items():
+        _grids[path] = SharedGrid.attach(spec)
+
+
+def run_one(run, params, seed, num_rounds, grid=None):
+    """Run one simulation & return its summary row.
+
+    num_agents is capped at the grid cells with data, the row holds the
+    number of agents actually run.
+    """
+    settings = dict(DEFAULT_PARAMS, **params)
+    if grid is None:
+        grid = _grids[settings['grid']][0]
+
+    num_agents = min(settings['num_agents'], int(np.count_nonzero(grid[:, :] != NODATA)))
+    agents = generate_agents_random(grid, num_agents, seed, settings['vision'],
+                                    settings['metabolism'], settings['energy'],
+                                    population=True)
+    config = {k: v for k, v in settings.items() if k not in RUN_PARAMS}
+
+    sim = Simulation(grid, agents, config)
+    try:
+        sim.run(num_rounds)
+    finally:
+        sim.close()
+
+    row = dict(params, num_agents=num_agents, run=run, seed=seed, final_round=sim.final_round,
+               num_live=sim.num_live, num_dead=sim.num_dead,
+               average_energy=sim.average_energy[-1] if sim.average_energy else 0)
+    return row
+
+
+def run_sweep(params, seeds, num_rounds, out=None, processes=None):
+    """Run every params dict with every seed, across a process pool.
+
+    params dicts need a 'grid' path, other keys are RUN_PARAMS or Simulation
+    config values. Summary rows are written to the out file (CSV) as runs
+    finish & also returned, sorted by run number.
+    """
+    runs = [(p, s) for p in params for s in seeds]
+    paths = sorted({p['grid'] for p in params})
+    shared = {path: SharedGrid(Grid.load(path)) for path in paths}
+
+    columns = sorted({k for p in params for k in p} | {'num_agents'}) + list(SUMMARY_FIELDS)
+    writer = csv.DictWriter(out, columns) if out is not None else None
+    if writer:
+        writer.writeheader()
+
+    rows = []
+    try:
+        specs = {path: s.spec for path, s in shared.items()}
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count(),
+                                 initializer=_init_worker, initargs=(specs,)) as pool:
+            futures = [pool.submit(run_one, i, p, s, num_rounds) for i, (p, s) in enumerate(runs)]
+            for future in as_completed(futures):
+                row = future.result()
+                rows.append(row)
+                if writer:
+                    writer.writerow(_flatten(row))
+                    out.flush()
+    finally:
+        for s in shared.values():
+            s.close()
+
+    return sorted(rows, key=lambda r: r['run'])
+
+
+def _flatten(row):
+    # ranges like (1, 3) are written as "1-3"
+    return {k: '-'.join(map(str, v)) if isinstance(v, (tuple, list)) else v
+            for k, v in row.items()}
+
+
+def _range(text):
+    lo, _, hi = text.partition('-')
+    return (int(lo), int(hi or lo))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a simulation parameter sweep')
+    parser.add_argument('grids', nargs='+', help='world grid files')
+    parser.add_argument('--agents', type=int, nargs='+', default=[25])
+    parser.add_argument('--vision', type=_range, nargs='+', default=[(1, 2)], help='eg. 1-3')
+    parser.add_argument('--metabolism', type=_range, nargs='+', default=[(1, 3)])
+    parser.add_argument('--energy', type=_range, nargs='+', default=[(10, 30)])
+    parser.add_argument('--recovery-rate', type=int, nargs='+', default=[1])
+    parser.add_argument('--seeds', type=int, default=1, help='number of seeds per setting')
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--processes', type=int, help='defaults to all cores')
+    parser.add_argument('--out', help='CSV output path, defaults to stdout')
+    args = parser.parse_args(argv)
+
+    params = parameter_grid(grid=args.grids, num_agents=args.agents, vision=args.vision,
+                            metabolism=args.metabolism, energy=args.energy,
+                            RECOVERY_RATE=args.recovery_rate)
+
+    if args.out:
+        with open(args.out, 'w', newline='') as out:
+            run_sweep(params, range(args.seeds), args.rounds, out, args.processes)
+    else:
+        run_sweep(params, range(args.seeds), args.rounds, sys.stdout, args.processes)
+
+
+if __name__ == '__main__':
+    main()
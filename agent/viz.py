@@ -1,60 +1,246 @@
 import os
-import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from PIL import Image
 import numpy as np
 
+from agent.components import NODATA
 
-def snapshot_image(grid, _dir, scale=1):
-    """Coroutine to generate image snapshots of the simulation."""
-    if not os.path.isdir(_dir):
-        raise IOError('Need a directory: {}'.format(_dir))
+
+FRAME_NAME = '{:06d}.png'  # numbered by round
+
+
+def snapshot_image(grid, _dir, scale=1, stride=1, workers=2, max_in_flight=8):
+    """Coroutine to generate image snapshots of the simulation.
+
+    Frames are encoded in the background by a SnapshotWriter, closing the
+    coroutine waits for any frames still in flight.
+    """
+    writer = SnapshotWriter(_dir, scale, stride, workers, max_in_flight)
 
     try:
-        count = 0
         while True:
-            count += 1
             agents = (yield) # receive data
-            path = os.path.join(_dir, '{:03d}.png'.format(count))
-            image_dump(grid, agents, path, scale)
-    except GeneratorExit:
-        return
+            writer.submit(grid, agent_coords(agents))
+    finally:
+        writer.close()
+
+
+def agent_coords(agents):
+    """Returns (ys, xs) arrays of the positions of agent objects."""
+    coords = np.array([a.coords for a in agents], dtype=np.intp).reshape(-1, 2)
+    return coords[:, 0], coords[:, 1]
+
+
+class SnapshotWriter(object):
+    """Saves snapshot images without blocking the simulation loop.
+
+    submit() copies the grid & agent positions, the remap, upscale & PNG
+    encoding run in worker threads (PIL releases the GIL while compressing).
+    Only every stride-th frame is kept & at most max_in_flight frames are
+    queued or encoding at once, submit() blocks until a slot frees up.
+    """
+
+    def __init__(self, _dir, scale=1, stride=1, workers=2, max_in_flight=8):
+        if not os.path.isdir(_dir):
+            raise IOError('Need a directory: {}'.format(_dir))
+        if min(stride, workers, max_in_flight) < 1:
+            raise ValueError('stride, workers & max_in_flight must be >= 1')
+
+        self._dir = _dir
+        self.scale = scale
+        self.stride = stride
+        self.count = 0  # frames submitted, including skipped frames
+        self._pool = ThreadPoolExecutor(max_workers=workers,
+                                        thread_name_prefix='snapshot')
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._error = None
+
+    def submit(self, grid, coords):
+        """Queue a frame of a grid with agents at coords, a (ys, xs) pair."""
+        self.count += 1
+        if (self.count - 1) % self.stride:
+            return
+
+        self._check_error()
+        raw = np.array(grid[:, :])  # copy, the grid changes as the run goes on
+        ys, xs = [np.array(c, dtype=np.intp) for c in coords]
+        path = os.path.join(self._dir, FRAME_NAME.format(self.count))
+
+        self._slots.acquire()  # backpressure when too many frames are in flight
+        future = self._pool.submit(_save_frame, raw, ys, xs, path, self.scale)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            # errors of frames taken by flush() are raised there
+            if future in self._pending:
+                self._pending.discard(future)
+                if future.exception() is not None and self._error is None:
+                    self._error = future.exception()
+        self._slots.release()
+
+    def _check_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def flush(self):
+        """Wait for all queued frames to be saved."""
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        self._check_error()
+        for future in pending:
+            error = future.exception()  # waits
+            if error is not None:
+                raise error
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _save_frame(raw, ys, xs, path, scale):
+    mono = MONOCHROME(raw)
+    draw_agents(mono, ys, xs)
+    final = upscale(mono, scale) if scale > 1 else mono
+    Image.fromarray(final).save(path)
+
 
 def image_dump(grid, agents, path, scale=1):
     """"Dumps a single image of the simulation to a file."""
-    raw = grid._grid[1:-1, 1:-1]  # TODO: pass in without borders?
+    raw = grid[:, :]
     mono = monochrome_remap(raw, agents)
     final = upscale(mono, scale) if scale > 1 else mono
     image = Image.fromarray(final)
     image.save(path)
 
 
+class Palette(object):
+    """Colour lookup table for a range of integer cell values.
+
+    Colours are greyscale values or (R, G, B[, A]) tuples, values outside the
+    range take the colour of the nearest end. Remapping a grid is one table
+    lookup, however many colours there are.
+    """
+
+    def __init__(self, colours, lo=NODATA):
+        self.lut = np.asarray(colours, dtype=np.uint8)
+        self.lo = lo
+
+    @classmethod
+    def from_levels(cls, levels, below, above, lo=NODATA, hi=127):
+        """Build a palette from a {value: colour} dict, values under the lowest
+        level are coloured below & all other values above."""
+        values = np.arange(lo, hi + 1)
+        lut = np.empty(values.shape + np.shape(above), dtype=np.uint8)
+        lut[:] = above
+        lut[values < min(levels)] = below
+        for value, colour in levels.items():
+            lut[value - lo] = colour
+        return cls(lut, lo)
+
+    @property
+    def channels(self):
+        return self.lut.shape[1] if self.lut.ndim > 1 else 1
+
+    def __call__(self, raw):
+        index = np.asarray(raw).astype(np.intp) - self.lo
+        return np.take(self.lut, index, axis=0, mode='clip')
+
+
+# original BasicSim colours, more food is darker & agents are black
+MONOCHROME = Palette.from_levels({0: 255, 1: 200, 2: 150, 3: 100, 4: 50},
+                                 below=255, above=0)
+
+# RGBA layer palettes for compositing, transparent where there is nothing
+FOOD_RGBA = Palette.from_levels({0: (0, 0, 0, 0), 1: (199, 233, 192, 255),
+                                 2: (161, 217, 155, 255), 3: (116, 196, 118, 255),
+                                 4: (49, 163, 84, 255)},
+                                below=(0, 0, 0, 0), above=(0, 109, 44, 255))
+WATER_RGBA = Palette.from_levels({0: (0, 0, 0, 0), 1: (107, 174, 214, 160),
+                                  2: (33, 113, 181, 200)},
+                                 below=(0, 0, 0, 0), above=(8, 48, 107, 230))
+
+
+# heatmap colours, black through red & yellow to white
+HEAT = Palette(np.stack([np.clip(3 * np.arange(256) - off, 0, 255)
+                         for off in (0, 255, 510)], axis=1), lo=0)
+
+
+def heatmap(counts, palette=HEAT):
+    """Colour an array of counts on a log scale, returns an image array.
+    Zero counts take the first colour of the palette & the top count the last."""
+    counts = np.asarray(counts, dtype=np.float64)
+    top = counts.max(initial=0)
+    levels = len(palette.lut) - 1
+    scaled = np.log1p(counts) * (levels / np.log1p(top)) if top > 0 else counts
+    return palette(np.rint(scaled).astype(np.intp) + palette.lo)
+
+
+def bar_chart(counts, height=100, bar_width=1):
+    """Draw counts as black bars on white, scaled to fit height, returns a
+    greyscale image array."""
+    counts = np.asarray(counts, dtype=np.float64)
+    top = counts.max(initial=0)
+    bars = np.ceil(counts * (height / top)).astype(np.intp) if top > 0 else counts.astype(np.intp)
+    rows = np.arange(height, 0, -1)[:, np.newaxis]
+    data = np.where(rows <= bars, 0, 255).astype(np.uint8)
+    return np.repeat(data, bar_width, axis=1)
+
+
+def save_image(data, path, scale=1):
+    """Save an image array to path, upscaled by scale."""
+    final = upscale(data, scale) if scale > 1 else data
+    Image.fromarray(final).save(path)
+
+
 def monochrome_remap(raw, agents):
     """Quick & dirty function to map BasicSim world to 0-255 colour array."""
-    data = np.zeros(raw.shape, dtype=np.uint8)
-    data[raw <= 0] = 255
-    data[raw == 1] = 200
-    data[raw == 2] = 150
-    data[raw == 3] = 100
-    data[raw == 4] = 50
-
-    # represent agents as black dot
-    for a in agents:
-        data[a.coords] = 0
+    data = MONOCHROME(raw)
+    if agents:
+        draw_agents(data, *agent_coords(agents))
     return data
 
 
-def upscale(data, factor):
-    """Scale an array up in size."""
-    assert factor
-    ys, xs = [i*factor for i in data.shape]
-    output = np.zeros((ys, xs), dtype=data.dtype)
+def draw_agents(data, ys, xs, colour=0):
+    """Draw agents at coord arrays ys & xs as single pixels, in place."""
+    data[ys, xs] = colour
+
 
-    for y, x in itertools.product(*(range(i) for i in data.shape)):
-        value = data[y, x]
-        block = np.ones((factor, factor), dtype=data.dtype) * value
-        yoff = y * factor
-        xoff = x * factor
-        output[yoff:yoff+factor, xoff:xoff+factor] = block
+def composite(layers, background=(255, 255, 255)):
+    """Blend (raw array, RGBA palette) layers in order, returning an RGB array.
 
-    return output
+    Each layer is alpha blended over the layers below it.
+    """
+    output = None
+    for raw, palette in layers:
+        rgba = palette(raw)
+        if output is None:
+            output = np.empty(rgba.shape[:2] + (3,), dtype=np.float32)
+            output[:] = background
+
+        alpha = rgba[..., 3:] / np.float32(255)
+        output *= 1 - alpha
+        output += rgba[..., :3] * alpha
+
+    return np.rint(output).astype(np.uint8)
+
+
+def upscale(data, factor):
+    """Scale an array up in size, each cell becomes a factor x factor block."""
+    assert factor
+    return np.repeat(np.repeat(data, factor, axis=0), factor, axis=1)
@@ -0,0 +1,238 @@
+"""Benchmarks of the simulation hot paths over a matrix of world sizes.
+
+Worlds & agents are generated synthetically from a fixed seed. Results are
+saved as JSON, & can be compared against a saved baseline to flag slowdowns:
+
+    python benchmarks/run_benchmarks.py --quick --out baseline.json
+    python benchmarks/run_benchmarks.py --quick --compare baseline.json
+
+Per call benchmarks (view, harvest, adjacent_agents) time a batch of calls &
+report the time per call, the others time a single call. The best of
+--repeat runs is kept.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+from io import StringIO
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from agent import viz  # noqa: E402
+from agent.basicsim import BasicWorld, Simulation, generate_agents_random  # noqa: E402
+from agent.components import Grid  # noqa: E402
+
+
+SIZES = (50, 250, 1000, 4000)
+AGENTS = (25, 1000, 100000, 1000000)
+QUICK_SIZES = (50, 250)
+QUICK_AGENTS = (25, 1000)
+
+SEED = 1
+MAX_CALLS = 10000  # calls per batch for the per call benchmarks
+DEFAULT_THRESHOLD = 0.2  # fraction slower than the baseline to flag
+
+
+def make_values(size, rng):
+    # mostly empty cells, like the sample world
+    return rng.choice(np.array([0, 0, 0, 1, 2, 3, 4], dtype=np.int8), size=(size, size))
+
+
+class Case(object):
+    """Synthetic world & agents for one (size, agents) point of the matrix."""
+
+    def __init__(self, size, num_agents):
+        rng = np.random.default_rng(SEED)
+        self.size = size
+        self.num_agents = num_agents
+        self.values = make_values(size, rng)
+        self.grid = Grid.from_array(self.values)
+        self.rng = rng
+
+    def simulation(self, **config):
+        agents = generate_agents_random(self.grid, self.num_agents, seed=SEED, population=True)
+        return Simulation(self.grid, agents, dict(config, HISTORY='none'))
+
+    def coords(self, n):
+        return self.rng.integers(0, self.size, size=(2, n)).T.tolist()
+
+
+# each benchmark takes a Case & returns (timed function, number of calls)
+
+def bench_from_file(case):
+    text = '\n'.join(''.join(map(str, row)) for row in case.values.tolist()) + '\n'
+    return lambda: Grid.from_file(StringIO(text)), 1
+
+
+def bench_view(case):
+    coords = case.coords(min(case.num_agents, MAX_CALLS))
+    grid = case.grid
+
+    def run():
+        for y, x in coords:
+            grid.view(y, x, 1)
+    return run, len(coords)
+
+
+def bench_harvest(case):
+    coords = [tuple(c) for c in case.coords(min(case.num_agents, MAX_CALLS))]
+    world = BasicWorld(case.grid)
+
+    def run():
+        for c in coords:
+            world.harvest(c)
+    return run, len(coords)
+
+
+def bench_on_end_round(case):
+    world = BasicWorld(case.grid)
+    ys, xs = np.array(case.coords(case.num_agents)).T
+    world.food_grid.set_many(ys, xs, -1)
+    world.rescan()
+    return world.on_end_round, 1
+
+
+def bench_adjacent_agents(case):
+    sim = case.simulation()
+    agents = sim.agents[:min(case.num_agents, MAX_CALLS)]
+
+    def run():
+        for a in agents:
+            sim.adjacent_agents(a)
+    return run, len(agents)
+
+
+def bench_do_round(case):
+    sim = case.simulation()
+    return sim.do_round, 1
+
+
+def bench_do_round_synchronous(case):
+    sim = case.simulation(UPDATE='synchronous')
+    return sim.do_round, 1
+
+
+def bench_collect_stats(case):
+    sim = case.simulation()
+    return sim.collect_stats, 1
+
+
+def bench_image_dump(case):
+    sim = case.simulation()
+    agents = sim.live_agents
+    path = os.path.join(tempfile.gettempdir(), 'agentsim_benchmark.png')
+    return lambda: viz.image_dump(sim.world.food_grid, agents, path), 1
+
+
+# benchmarks which don't depend on the agent count only run once per size
+BENCHMARKS = {
+    'grid.from_file': (bench_from_file, False),
+    'grid.view': (bench_view, True),
+    'world.harvest': (bench_harvest, True),
+    'world.on_end_round': (bench_on_end_round, True),
+    'sim.adjacent_agents': (bench_adjacent_agents, True),
+    'sim.do_round': (bench_do_round, True),
+    'sim.do_round_synchronous': (bench_do_round_synchronous, True),
+    'sim.collect_stats': (bench_collect_stats, True),
+    'viz.image_dump': (bench_image_dump, True),
+}
+
+
+def run_benchmarks(sizes, agent_counts, names=None, repeat=3, log=None):
+    """Returns a list of result dicts for every benchmark & matrix point."""
+    results = []
+    names = names or list(BENCHMARKS)
+
+    for size in sizes:
+        for num_agents in agent_counts:
+            if num_agents > size * size // 2:
+                continue  # too crowded to place
+
+            case = Case(size, num_agents)
+            for name in names:
+                bench, uses_agents = BENCHMARKS[name]
+                if not uses_agents and num_agents != min(agent_counts):
+                    continue
+
+                best = None
+                for _ in range(repeat):
+                    func, calls = bench(case)  # fresh state for each repeat
+                    start = time.perf_counter()
+                    func()
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+
+                result = dict(name=name, size=size, agents=num_agents if uses_agents else None,
+                              seconds=best, calls=calls, per_call=best / calls)
+                results.append(result)
+                if log:
+                    print('{name:26} size={size:<6} agents={agents!s:<8} '
+                          '{per_call:.3e}s/call'.format(**result), file=log)
+    return results
+
+
+def _key(result):
+    return result['name'], result['size'], result['agents']
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Returns (key, baseline, new, ratio) for results slower than the baseline
+    per call time by more than threshold."""
+    base = {_key(r): r for r in baseline['results']}
+    slower = []
+    for r in results:
+        b = base.get(_key(r))
+        if b and b['per_call'] > 0:
+            ratio = r['per_call'] / b['per_call']
+            if ratio > 1 + threshold:
+                slower.append((_key(r), b['per_call'], r['per_call'], ratio))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the simulation hot paths')
+    parser.add_argument('--quick', action='store_true', help='small matrix only')
+    parser.add_argument('--sizes', type=int, nargs='+', help='grid sizes (cells per side)')
+    parser.add_argument('--agents', type=int, nargs='+', help='agent counts')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', help='save results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='flag results this fraction slower than the baseline')
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    agent_counts = args.agents or (QUICK_AGENTS if args.quick else AGENTS)
+    results = run_benchmarks(sizes, agent_counts, args.only, args.repeat, log=sys.stdout)
+
+    report = dict(meta=dict(created=datetime.now().isoformat(timespec='seconds'),
+                            python=platform.python_version(), numpy=np.__version__,
+                            machine=platform.machine(), processor=platform.processor()),
+                  results=results)
+    if args.out:
+        with open(args.out, 'w') as fd:
+            json.dump(report, fd, indent=1)
+        print(args.out, 'saved')
+
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+        slower = compare(results, baseline, args.threshold)
+        for (name, size, agents), before, after, ratio in slower:
+            print('SLOWER {} size={} agents={}: {:.3e}s -> {:.3e}s ({:.2f}x)'.format(
+                name, size, agents, before, after, ratio))
+        if slower:
+            return 1
+        print('No slowdowns over {:.0%}'.format(args.threshold))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
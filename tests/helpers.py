@@ -0,0 +1,10 @@
+"""Shared set up for the simulation tests."""
+from agent import basicsim
+from agent.components import Grid
+
+
+def make_simulation(config=None):
+    """The basic grid with the 25 built in agents."""
+    with open('data/basic_grid.txt') as fd:
+        food_grid = Grid.from_file(fd)
+    return basicsim.Simulation(food_grid, basicsim.generate_agents_deterministic(), config)
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+
+import numpy as np
+import numpy.testing as npt
+
+from agent import analytics
+from agent import basicsim
+
+from helpers import make_simulation
+
+
+def test_lifespan_histogram():
+    tracker = analytics.TrafficAnalytics((2, 2))
+    tracker.add_agents(0, 3)
+    tracker.add_agents(2, 1)
+    tracker.record_deaths(4, [0, 3])
+    tracker.record_deaths(9, [2])
+
+    npt.assert_array_equal(tracker.lifespans(), [4, 9, 2])
+    npt.assert_array_equal(tracker.lifespan_histogram(), [0, 0, 1, 0, 1, 0, 0, 0, 0, 1])
+    npt.assert_array_equal(tracker.ages(10), [10])
+    assert tracker.num_dead == 3
+
+
+def test_record_round():
+    tracker = analytics.TrafficAnalytics((2, 3))
+    tracker.record_round(np.array([0, 1, 0]), np.array([2, 0, 2]))
+    npt.assert_array_equal(tracker.visits, [[0, 0, 2], [1, 0, 0]])
+
+
+class SimulationAnalyticsTests(unittest.TestCase):
+
+    def test_disabled(self):
+        assert make_simulation().analytics is None
+
+    def test_matches_history(self):
+        sim = make_simulation({'ANALYTICS': '1'})
+        sim.run(60)
+
+        # the full move histories give the same counts, less the start cells
+        visits = Counter(c for a in sim.agents for c in a.move_history[1:])
+        expected = np.zeros(sim.world.food_grid.shape, dtype=int)
+        for (y, x), count in visits.items():
+            expected[y, x] = count
+        npt.assert_array_equal(sim.analytics.visits, expected)
+
+        died = {slot: r for r, slots in sim.dead_by_round.items() for slot in slots}
+        npt.assert_array_equal(sim.analytics.lifespans(), [died[s] for s in sorted(died)])
+        assert sim.analytics.num_dead == sim.num_dead
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sim = make_simulation({'ANALYTICS_DIR': tmp, 'ANALYTICS_STRIDE': '20'})
+            sim.run(45)
+            assert sorted(os.listdir(tmp)) == sorted(
+                name.format(r) + ext for r in (20, 40) for ext in ('.npy', '.png')
+                for name in (analytics.TRAFFIC_NAME, analytics.LIFESPANS_NAME))
+
+            path = os.path.join(tmp, analytics.TRAFFIC_NAME.format(40) + '.npy')
+            assert np.load(path).sum() <= sim.analytics.visits.sum()
+
+    def test_checkpoint(self):
+        ref = make_simulation({'ANALYTICS': '1'})
+        ref.run(50)
+
+        sim = make_simulation({'ANALYTICS': '1'})
+        sim.run(25)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'sim.npz')
+            sim.checkpoint(path)
+            sim = basicsim.Simulation.restore(path)
+        sim.run(25)
+
+        npt.assert_array_equal(sim.analytics.visits, ref.analytics.visits)
+        npt.assert_array_equal(sim.analytics.lifespan_histogram(),
+                               ref.analytics.lifespan_histogram())
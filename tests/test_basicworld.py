@@ -1,6 +1,8 @@
 import unittest
 from io import StringIO
 
+import numpy as np
+
 from agent import basicsim
 from agent import components
 
@@ -37,3 +39,87 @@ def test_basicworld_respawn():
     assert world.food_grid[crd] == 2
     world.on_end_round()
     assert world.food_grid[crd] == 2
+
+
+def test_recovery_rate_capped():
+    world = generate_basicworld()
+    world.recovery_rate = 2
+    crd = (0,1)
+    world.harvest(crd)
+    world.on_end_round()
+    assert world.food_grid[crd] == 1
+    world.on_end_round()
+    assert world.food_grid[crd] == 2  # capped at the original value
+    assert world.num_recovering == 0
+
+
+def test_recovery_delay():
+    world = generate_basicworld()
+    world.recovery_delay = 2
+    crd = (0,1)
+    world.harvest(crd)
+
+    for _ in range(2):
+        world.on_end_round()
+        assert world.food_grid[crd] == -1  # waiting to regrow
+
+    world.on_end_round()
+    assert world.food_grid[crd] == 0
+
+
+def test_per_cell_recovery_rate():
+    world = generate_basicworld()
+    world.recovery_rate = np.array([[1, 3], [1, 1]])
+    world.harvest((0,0))
+    world.harvest((0,1))
+    world.on_end_round()
+    assert world.food_grid[0,0] == 0
+    assert world.food_grid[0,1] == 2
+
+
+def test_only_harvested_cells_tracked():
+    world = generate_basicworld()
+    world.on_end_round()
+    assert world.num_recovering == 0
+
+    world.harvest((0,0))
+    assert world.num_recovering == 1
+    world.on_end_round()
+    world.on_end_round()
+    assert world.food_grid[0,0] == 1
+    assert world.num_recovering == 0
+
+
+def test_rescan_direct_edits():
+    world = generate_basicworld()
+    world.on_end_round()
+    world.food_grid[0,1] = 0  # edit outside of harvest()
+    world.rescan()
+    world.on_end_round()
+    assert world.food_grid[0,1] == 1
+
+
+def test_world_layers():
+    fd = StringIO('12\n00\n')
+    food_grid = components.Grid.from_file(fd)
+    world = basicsim.BasicWorld(food_grid, food_dtype=np.int16,
+                                layers=[('water', np.int16)])
+    assert world.layers.names == ('food', 'orig_food', 'water')
+    assert world.food_grid.dtype == np.int16
+
+    world.food_grid[1,1] = 500  # not capped at int8 values
+    assert world.food_grid[1,1] == 500
+    assert world.orig_food_grid[1,1] == 0
+
+
+def test_harvest_many():
+    world = generate_basicworld()
+    energy = world.harvest_many([0, 0, 1, 0], [1, 0, 0, 1])
+    assert energy.tolist() == [2, 1, 0, 0]  # the repeat of (0, 1) gets nothing
+    assert world.food_grid[:, :].tolist() == [[-1, -1], [0, 0]]
+    assert world.num_recovering == 2
+
+    world.on_end_round()
+    assert world.food_grid[:, :].tolist() == [[0, 0], [0, 0]]
+    world.on_end_round()
+    assert world.food_grid[:, :].tolist() == [[1, 1], [0, 0]]
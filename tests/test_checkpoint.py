@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from agent import basicsim
+from agent import checkpoint
+
+from helpers import make_simulation
+
+
+def summary(sim):
+    return (sim.round, sim.final_round, sim.world.food_grid[:, :].tolist(),
+            [str(a) for a in sim.agents], [a.move_history for a in sim.agents],
+            [a.harvest_history for a in sim.agents], sim.average_energy,
+            sim.num_dead_agents, sim.dead_by_round)
+
+
+class CheckpointTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'sim.npz')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resume(self):
+        ref = make_simulation()
+        ref.run(30)
+        ref.run(30)
+
+        sim = make_simulation()
+        sim.run(30)
+        sim.checkpoint(self.path)
+
+        for mmap in (False, True):
+            restored = basicsim.Simulation.restore(self.path, mmap=mmap)
+            restored.run(30)
+            assert summary(restored) == summary(ref)
+
+    def test_resume_random_conflicts(self):
+        config = {'UPDATE': 'synchronous', 'CONFLICT': 'random', 'CONFLICT_SEED': 3}
+        ref = make_simulation(config)
+        ref.run(20)
+        ref.run(20)
+
+        sim = make_simulation(config)
+        sim.run(20)
+        sim.checkpoint(self.path)
+        restored = basicsim.Simulation.restore(self.path)
+        restored.run(20)
+        assert summary(restored) == summary(ref)
+
+    def test_restore_state(self):
+        sim = make_simulation({'RECOVERY_DELAY': '2'})
+        sim.run(40)
+        sim.checkpoint(self.path)
+        restored = basicsim.Simulation.restore(self.path)
+
+        assert summary(restored) == summary(sim)
+        assert restored.config == {'RECOVERY_DELAY': '2'}
+        assert restored.world.num_recovering == sim.world.num_recovering
+        dead = sim.dead_agents[-1]
+        npt.assert_equal(restored.agents[sim.agents.index(dead)].last_view, dead.last_view)
+        assert restored.occupancy.occupied(restored.population.y[restored._live_slots],
+                                           restored.population.x[restored._live_slots]).all()
+
+    def test_mmap_copy_on_write(self):
+        sim = make_simulation()
+        sim.run(5)
+        sim.checkpoint(self.path)
+        before = open(self.path, 'rb').read()
+
+        restored = basicsim.Simulation.restore(self.path, mmap=True)
+        assert isinstance(restored.world.layers._cells, np.memmap)
+        assert isinstance(restored.population.energy.base, np.memmap)
+        restored.run(10)
+        assert open(self.path, 'rb').read() == before
+
+    def test_fork(self):
+        sim = make_simulation()
+        sim.run(10)
+        fork = sim.fork({'RECOVERY_RATE': 2})
+        assert summary(fork) == summary(sim)
+        ys = sim.population.history.positions()[0]
+
+        fork.run(10)
+        npt.assert_array_equal(sim.population.history.positions()[0], ys)
+        assert sim.round == 10
+        assert fork.round == 20
+        assert fork.world.recovery_rate == 1  # world settings are state
+        assert not np.shares_memory(fork.population.energy, sim.population.energy)
+
+        ref = make_simulation()
+        ref.run(10)
+        ref.run(10)
+        same = sim.fork()
+        same.run(10)
+        assert summary(same) == summary(ref)
+
+    def test_fork_checkpoint(self):
+        # branch from an earlier round, saved as a checkpoint
+        sim = make_simulation()
+        sim.run(10)
+        sim.checkpoint(self.path)
+        sim.run(10)
+
+        fork = sim.fork(checkpoint=self.path)
+        assert fork.round == 10
+        assert isinstance(fork.world.layers._cells, np.memmap)  # copy-on-write
+        fork.run(10)
+        assert summary(fork) == summary(sim)
+
+    def test_load_sections(self):
+        state = {'a': {'x': np.arange(5), 'scalar': np.array(3), 'empty': np.zeros(0)},
+                 'b': {'name': np.array('text')}}
+        checkpoint.save(self.path, state)
+        for mode in (None, 'r', 'c'):
+            loaded = checkpoint.load(self.path, mode)
+            npt.assert_equal(loaded['a']['x'], np.arange(5))
+            assert int(loaded['a']['scalar']) == 3
+            assert loaded['a']['empty'].shape == (0,)
+            assert str(loaded['b']['name']) == 'text'
@@ -0,0 +1,71 @@
+import os
+import sys
+import csv
+import subprocess
+import tempfile
+import unittest
+from io import StringIO
+
+from agent import cli
+
+
+class CliTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_run(self):
+        stats = os.path.join(self.tmp.name, 'stats.csv')
+        checkpoint = os.path.join(self.tmp.name, 'sim.npz')
+        args = cli.parse_args(['--rounds', '12', '--agents', '40', '--seed', '2', '--quiet',
+                               '--stats', stats, '--checkpoint', checkpoint,
+                               '--set', 'STATS_INTERVAL=4', '--config', os.devnull])
+        sim = cli.run(args)
+
+        assert sim.round == 12
+        assert len(sim.population) == 40
+        with open(stats) as fd:
+            assert [row['round'] for row in csv.DictReader(fd)] == ['4', '8', '12']
+        assert os.path.exists(checkpoint)
+
+    def test_settings(self):
+        args = cli.parse_args(['--config', os.devnull, '--set', 'UPDATE = synchronous',
+                               '--viz', self.tmp.name, '--no-viz'])
+        assert cli.read_config(args) == {'UPDATE': 'synchronous'}
+
+        with self.assertRaises(SystemExit):
+            cli.parse_args(['--set', 'UPDATE'])
+
+    def test_agent_options(self):
+        # random agent options are errors without --agents
+        for argv in (['--seed', '1'], ['--vision', '1', '3']):
+            with self.assertRaises(SystemExit):
+                cli.parse_args(argv)
+
+        args = cli.parse_args(['--agents', '30', '--seed', '1', '--metabolism', '2', '2',
+                               '--rounds', '1', '--config', os.devnull])
+        sim = cli.run(args, out=StringIO())
+        assert set(sim.population.vision.tolist()) <= {1, 2}
+        assert set(sim.population.metabolism.tolist()) == {2}
+
+    def test_report(self):
+        args = cli.parse_args(['--rounds', '5', '--report-dir', self.tmp.name,
+                               '--config', os.devnull, '--quiet'])
+        out = StringIO()
+        cli.run(args, out=out)
+        names = os.listdir(self.tmp.name)
+        assert {'.runlog', '.txt'} <= {os.path.splitext(n)[1] for n in names}
+        assert out.getvalue().endswith(' saved\n')
+
+    def test_headless_imports(self):
+        # a headless run doesn't load PIL or the process pool machinery
+        code = ('import sys; from agent import cli; '
+                'cli.main(["--rounds", "3", "--quiet", "--config", "{}"]); '
+                'print(sorted(m for m in ("PIL", "agent.viz", "agent.tiled", "multiprocessing") '
+                'if m in sys.modules))'.format(os.devnull))
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                             check=True).stdout
+        assert out.strip() == '[]'
@@ -1,9 +1,12 @@
+import os
 import copy
+import tempfile
 import unittest
-from io import StringIO
+from io import BytesIO, StringIO
 
 import numpy as np
 import numpy.testing as npt
+import pytest
 
 from agent import components
 from agent.components import NODATA
@@ -19,6 +22,55 @@ def generate_test_grid():
     return components.Grid.from_file(fd)
 
 
+def test_read_grid_bytes():
+    grid = components.Grid.from_file(BytesIO(b'12\r\n34\r\n'))
+    npt.assert_equal(grid[:, :], [[1,2], [3,4]])
+
+
+def test_read_grid_spaces():
+    # spaces are empty cells, including rows with trailing spaces stripped
+    grid = components.Grid.from_file(StringIO(' 12\n\n  3\n4\n'))
+    npt.assert_equal(grid[:, :], [[0,1,2], [0,0,3], [4,0,0]])
+
+
+def test_read_grid_invalid():
+    with pytest.raises(ValueError):
+        components.Grid.from_file(StringIO('12\n3x\n'))
+
+
+def test_read_csv_grid():
+    fd = StringIO('1,2,3\n7,8,9\n2,3,4\n8,9,0\n')
+    grid = components.Grid.from_csv_file(fd)
+    npt.assert_equal(grid[:, :], generate_test_grid()[:, :])
+
+
+def test_numpy_files():
+    grid = generate_test_grid()
+    with tempfile.TemporaryDirectory() as _dir:
+        for name in ('grid.npy', 'grid.npz'):
+            path = os.path.join(_dir, name)
+            grid.save(path)
+            res = components.Grid.load(path)
+            npt.assert_equal(res._grid, grid._grid)
+
+
+def test_from_array():
+    grid = components.Grid.from_array(np.arange(6).reshape(2,3))
+    assert grid.shape == (2,3)
+    assert grid[1,2] == 5
+    assert grid._grid[0,0] == NODATA
+
+
+def test_from_array_range():
+    with pytest.raises(ValueError):
+        components.Grid.from_array([[200, 5], [300, 1]])
+    with pytest.raises(ValueError):
+        components.Grid.from_csv_file(StringIO('1,-129\n'))
+
+    grid = components.Grid.from_array([[200, 5], [300, 1]], dtype=np.int16)
+    assert grid[1, 0] == 300
+
+
 def test_create_grid():
     ncols, nrows = 3, 9
     grid = components.Grid(nrows, ncols)
@@ -46,6 +98,27 @@ def test_write_grid():
     assert grid[0,0] == value
 
 
+def test_slices():
+    grid = generate_test_grid()
+    npt.assert_equal(grid[1:3, 0], [7,2])
+    npt.assert_equal(grid[2:, 1:], [[3,4], [9,0]])
+    npt.assert_equal(grid[:-1, 2], [3,9,4])
+    npt.assert_equal(grid[0, :2], [1,2])
+
+    grid[1:3, 0:2] = 5
+    npt.assert_equal(grid[:, :], [[1,2,3], [5,5,9], [5,5,4], [8,9,0]])
+
+
+def test_get_set_many():
+    grid = generate_test_grid()
+    ys, xs = np.array([0, 3, 1]), np.array([2, 0, 1])
+    npt.assert_equal(grid.get_many(ys, xs), [3,8,8])
+
+    grid.set_many(ys, xs, [4,5,6])
+    assert (grid[0,2], grid[3,0], grid[1,1]) == (4,5,6)
+    assert grid[np.int64(1), np.int32(1)] == 6
+
+
 def test_view():
     # for coords, get a view square
     grid = generate_test_grid()
@@ -60,6 +133,33 @@ def test_view():
     npt.assert_equal(exp, res)
 
 
+def test_views():
+    grid = generate_test_grid()
+    res = grid.views([1, 0], [1, 0], size=1)
+    assert res.shape == (2,3,3)
+    npt.assert_equal(res[0], grid.view(1,1,size=1))
+    npt.assert_equal(res[1], grid.view(0,0,size=1))
+
+    with pytest.raises(ValueError):
+        grid.views([0], [0], size=2)
+
+
+def test_wide_border():
+    grid = generate_test_grid().with_border(2)
+    assert grid.border_size == 2
+    assert grid.shape == (4,3)
+    npt.assert_equal(grid[:, :], generate_test_grid()[:, :])
+
+    view = grid.view(0,0,size=2)
+    assert view.shape == (5,5)
+    assert view[2,2] == 1
+    assert (view[:2] == NODATA).all()
+    npt.assert_equal(grid.views([0], [0], size=2)[0], view)
+
+    with pytest.raises(ValueError):
+        components.Grid(2, 2, border=0)
+
+
 def test_grid_iter():
     grid = generate_test_grid()
     exp = [[1,2,3], [7,8,9], [2,3,4], [8,9,0]]
@@ -87,3 +187,162 @@ def test_shape():
 def test_dtype():
     g = generate_test_grid()
     assert g.dtype == np.int8
+
+
+class OccupancyGridTests(unittest.TestCase):
+
+    def setUp(self):
+        self.occ = components.OccupancyGrid(4, 3)
+
+    def test_add_remove(self):
+        assert not self.occ.is_occupied((1,1))
+        self.occ.add(3, (1,1))
+        assert self.occ.is_occupied((1,1))
+        assert self.occ[1,1] == 3
+        self.occ.remove(3, (1,1))
+        assert self.occ[1,1] == components.EMPTY
+
+    def test_shared_cell(self):
+        for _id in (0, 1, 2):
+            self.occ.add(_id, (2,2))
+        assert sorted(self.occ.occupants((2,2))) == [0, 1, 2]
+
+        self.occ.remove(1, (2,2))
+        assert sorted(self.occ.occupants((2,2))) == [0, 2]
+
+    def test_move(self):
+        self.occ.add(0, (0,0))
+        self.occ.move(0, (0,0), (0,1))
+        assert not self.occ.is_occupied((0,0))
+        assert self.occ[0,1] == 0
+
+    def test_add_many(self):
+        grid = components.OccupancyGrid(3, 3)
+        grid.add(9, (0,0))
+        grid.add_many([1, 2, 3, 4], [0, 2, 0, 1], [0, 2, 0, 1])
+        assert sorted(grid.occupants((0,0))) == [1, 3, 9]
+        assert grid[2,2] == 2
+        grid.remove(3, (0,0))
+        assert sorted(grid.occupants((0,0))) == [1, 9]
+
+    def test_adjacent(self):
+        self.occ.add(0, (1,1))
+        self.occ.add(1, (0,1))  # N
+        self.occ.add(2, (2,0))  # SW
+        self.occ.add(3, (3,2))  # out of range
+        assert self.occ.adjacent((1,1)) == {0:1, 5:2}
+
+    def test_within(self):
+        self.occ.add(0, (0,0))
+        self.occ.add(1, (2,2))
+        self.occ.add(2, (3,2))
+        assert sorted(self.occ.within((0,0), radius=2)) == [0, 1]
+        assert sorted(self.occ.within((3,2), radius=1)) == [1, 2]
+
+
+def test_grid_dtype():
+    g = components.Grid(2, 2, dtype=np.int16)
+    g[0,0] = 1000
+    assert g[0,0] == 1000
+    assert g._grid[0,0] == NODATA
+
+
+class LayeredGridTests(unittest.TestCase):
+
+    def setUp(self):
+        layers = (('food', np.int8), ('topo', np.int16), ('flow', np.float32))
+        self.grid = components.LayeredGrid(3, 4, layers)
+
+    def test_layers(self):
+        assert self.grid.names == ('food', 'topo', 'flow')
+        assert self.grid.shape == (3,4)
+        assert self.grid['food'].dtype == np.int8
+        assert self.grid['topo'].dtype == np.int16
+        assert self.grid.layer('flow').dtype == np.float32
+        assert self.grid['topo'].shape == (3,4)
+        assert 'topo' in self.grid
+
+    def test_zero_copy_views(self):
+        topo = self.grid['topo']
+        topo[1,2] = 2000
+        assert self.grid._cells['topo'][2,3] == 2000
+        assert np.shares_memory(topo._grid, self.grid._cells)
+
+    def test_borders(self):
+        for name in self.grid.names:
+            assert self.grid[name]._grid[0,0] == NODATA
+
+    def test_cells(self):
+        self.grid['food'][0,1] = 3
+        self.grid['topo'][0,1] = 300
+        rec = self.grid.cells([0], [1])
+        assert rec['food'][0] == 3
+        assert rec['topo'][0] == 300
+
+        view = self.grid.view(0, 1, size=1)
+        assert view.shape == (3,3)
+        assert view['topo'][1,1] == 300
+
+    def test_with_border(self):
+        self.grid['topo'][2,3] = 42
+        grid = self.grid.with_border(3)
+        assert grid.border_size == 3
+        assert grid.shape == (3,4)
+        assert grid['topo'][2,3] == 42
+        assert grid['food'].border_size == 3
+
+
+def test_wedge_rects():
+    # the wedges split the view into 8 parts, less the centre cell
+    for radius in range(1, 9):
+        cover = np.zeros((2 * radius + 1,) * 2, dtype=int)
+        for rects in components.wedge_rects(radius):
+            for y0, x0, y1, x1 in rects:
+                cover[radius + y0:radius + y1 + 1, radius + x0:radius + x1 + 1] += 1
+        expected = np.ones_like(cover)
+        expected[radius, radius] = 0
+        npt.assert_array_equal(cover, expected)
+
+    assert components.wedge_rects(6).shape == (8, 2, 4)  # 16 rectangles
+
+
+class SummedAreaTableTests(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.rng = rng
+        self.grid = components.Grid.from_array(rng.choice([0, 1, 4, -1, NODATA], size=(23, 31)),
+                                               border=4)
+        self.sums = components.SummedAreaTable(self.grid, tile_size=8)
+
+    def check_sums(self):
+        ys, xs = self.rng.integers(0, 23, 40), self.rng.integers(0, 31, 40)
+        rects = self.rng.integers(-4, 5, size=(10, 4))
+        got = self.sums.rect_sums(ys, xs, rects)
+
+        values = np.maximum(self.grid._grid, 0)
+        for i, (y, x) in enumerate(zip(ys + 4, xs + 4)):
+            for k, (y0, x0, y1, x1) in enumerate(rects):
+                assert got[i, k] == values[y + y0:y + y1 + 1, x + x0:x + x1 + 1].sum()
+
+    def test_rect_sums(self):
+        self.check_sums()
+        with self.assertRaises(ValueError):
+            self.sums.rect_sums([0], [0], [(-5, 0, 0, 0)])
+
+    def test_mark(self):
+        ys, xs = self.rng.integers(0, 23, 12), self.rng.integers(0, 31, 12)
+        self.grid.set_many(ys, xs, self.rng.integers(-1, 9, 12))
+        self.sums.mark(ys, xs)
+        assert 0 < self.sums.num_dirty < self.sums.tiles[0] * self.sums.tiles[1]
+        self.sums.refresh()
+        assert self.sums.num_dirty == 0
+        self.check_sums()
+
+    def test_wedge_sums(self):
+        ys, xs = self.rng.integers(0, 23, 30), self.rng.integers(0, 31, 30)
+        for radius in (1, 2, 4):
+            sums = self.sums.wedge_sums(ys, xs, radius)
+            for i, (y, x) in enumerate(zip(ys, xs)):
+                view = self.grid.view(y, x, size=radius)
+                npt.assert_array_equal(sums[i], components.view_wedge_sums(view))
@@ -0,0 +1,60 @@
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from agent import history
+from agent.history import TrajectoryStore
+
+
+def test_parse_level():
+    assert history.parse_level('full') == history.FULL
+    assert history.parse_level('none') == history.NONE
+    assert history.parse_level('5') == 5
+    assert history.parse_level(1) == history.FULL
+
+    with pytest.raises(ValueError):
+        history.parse_level(0)
+
+
+def test_record_single():
+    store = TrajectoryStore()
+    store.record_move(2, (1,1))
+    store.record_move(2, (1,2))
+    store.record_harvest(2, 3)
+    assert store.moves(2) == [(1,1), (1,2)]
+    assert store.harvests(2) == [3]
+    assert store.moves(0) == []
+    assert store.moves(10) == []
+
+
+def test_chunk_growth():
+    store = TrajectoryStore(chunk_rows=4)
+    slots = np.arange(3)
+
+    for i in range(10):
+        store.record_moves(slots, slots + i, slots)
+        store.record_harvests(slots, -slots)
+
+    assert store.moves(1) == [(i + 1, 1) for i in range(10)]
+    assert store.harvests(2) == [-2] * 10
+
+    ys, xs = store.positions()
+    assert ys.shape == (10, 3)
+    npt.assert_equal(ys[:, 0], np.arange(10))
+    assert store.energy_deltas().shape == (10, 3)
+
+
+def test_level_none():
+    store = TrajectoryStore(level=history.NONE)
+    store.record_move(0, (1,1))
+    store.load(0, [(2,2)], [4])
+    assert store.moves(0) == []
+    assert store.harvests(0) == []
+
+
+def test_level_interval():
+    store = TrajectoryStore(level=3)
+    for r in range(7):
+        store.round = r
+        store.record_harvest(0, r)
+    assert store.harvests(0) == [0, 3, 6]
@@ -0,0 +1,212 @@
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from agent import basicsim
+from agent.components import Grid, NODATA
+from agent.navigation import FlowField, UNREACHABLE
+
+
+def test_distances():
+    grid = Grid.from_array([[0, 0, 0, 0],
+                            [0, NODATA, NODATA, 0],
+                            [3, NODATA, 0, 0]])
+    field = FlowField()
+    field.update(grid)
+
+    assert field.distance((2, 0)) == 0
+    assert field.distance((0, 1)) == 2
+    assert field.distance((0, 3)) == 4
+    assert field.distance((2, 2)) == 5  # around the NODATA cells
+    assert field.distance((1, 1)) == UNREACHABLE
+    assert field.distances[0, 0] == UNREACHABLE  # border
+
+
+def test_no_food():
+    field = FlowField()
+    field.update(Grid.from_array(np.zeros((3, 3), dtype=int)))
+    found, _ = field.directions(np.array([1]), np.array([1]))
+    assert not found[0]
+    assert field.direction((1, 1)) is None
+
+
+def test_directions():
+    grid = Grid.from_array([[0, 0, 0, 0, 2]] + [[0] * 5] * 4)
+    field = FlowField()
+    field.update(grid)
+
+    found, direction = field.directions(np.array([4, 2]), np.array([0, 4]))
+    assert found.all()
+    assert direction.tolist() == [1, 0]  # NE, N
+    assert field.direction((4, 0)) == 1
+
+    occupied = np.zeros((1, 8), dtype=bool)
+    occupied[0, 1] = True
+    found, direction = field.directions(np.array([4]), np.array([0]), occupied)
+    assert direction[0] == 0  # N is as near once NE is taken
+    assert field.direction((4, 0), blocked=[1]) == 0
+
+
+class IncrementalTests(unittest.TestCase):
+
+    def test_matches_full_update(self):
+        rng = np.random.default_rng(5)
+        for _ in range(50):
+            values = rng.choice([0] * 6 + [1, 2, NODATA], size=(20, 25))
+            grid = Grid.from_array(values, border=2)
+            field = FlowField()
+            field.update(grid)
+
+            for _ in range(4):
+                ys, xs = rng.integers(0, 20, 6), rng.integers(0, 25, 6)
+                keep = grid.get_many(ys, xs) != NODATA
+                grid.set_many(ys[keep], xs[keep], rng.choice([-1, 0, 3], keep.sum()))
+                field.update(grid)
+
+                ref = FlowField()
+                ref.update(grid)
+                npt.assert_equal(field.distances, ref.distances)
+
+        assert field.num_incremental > 0
+
+    def test_nodata_edit(self):
+        grid = Grid.from_array([[3, 0, 0, 0]])
+        field = FlowField()
+        field.update(grid)
+        grid[0, 1] = NODATA
+        field.update(grid)
+        assert field.distance((0, 3)) == UNREACHABLE
+        assert field.num_full == 2
+
+
+def make_agents(values, num_agents, seed, max_vision=2):
+    rng = np.random.default_rng(seed)
+    cells = rng.choice(np.flatnonzero(values != NODATA), size=num_agents, replace=False)
+    return [basicsim.BasicAgent(i, 1 + i % max_vision, 1, 8, (int(c) // values.shape[1],
+                                                               int(c) % values.shape[1]))
+            for i, c in enumerate(cells)]
+
+
+class FlowNavigationTests(unittest.TestCase):
+
+    def test_matches_next_move(self):
+        rng = np.random.default_rng(2)
+        values = rng.choice([0] * 30 + [2, NODATA], size=(18, 18))
+        sim = basicsim.Simulation(Grid.from_array(values), make_agents(values, 40, 2),
+                                  {'NAVIGATION': 'flow'})
+        grid = sim.world.food_grid
+        sim.flow.update(grid)
+        ys, xs = sim.population.next_moves(grid, sim.occupancy, flow=sim.flow)
+
+        for a, exp in zip(sim.agents, zip(ys.tolist(), xs.tolist())):
+            view = grid.view(*a.coords, size=a.vision)
+            assert a.next_move(view, sim.adjacent_agents(a), sim.flow) == exp
+
+    def test_heads_for_distant_food(self):
+        values = np.zeros((9, 9), dtype=int)
+        values[8, 8] = 4
+        agent = basicsim.BasicAgent(0, 1, 1, 20, (0, 0))
+        sim = basicsim.Simulation(Grid.from_array(values), [agent], {'NAVIGATION': 'flow'})
+        sim.run(8)
+        assert agent.coords == (8, 8)
+        assert agent.move_history == [(i, i) for i in range(9)]
+
+    def test_boxed_in_agent_waits(self):
+        values = np.full((3, 3), NODATA)
+        values[1, 1] = 0
+        agent = basicsim.BasicAgent(0, 1, 1, 5, (1, 1))
+        for update in ('sequential', 'synchronous'):
+            sim = basicsim.Simulation(Grid.from_array(values), [agent],
+                                      {'NAVIGATION': 'flow', 'UPDATE': update})
+            sim.do_round()
+            assert sim.agents[0].coords == (1, 1)
+
+        sim = basicsim.Simulation(Grid.from_array(values), [agent])
+        with self.assertRaises(NotImplementedError):
+            sim.do_round()
+
+    def test_sequential_matches_synchronous_alone(self):
+        # a lone agent sees the same world either way
+        rng = np.random.default_rng(4)
+        values = rng.choice([0] * 40 + [3], size=(20, 20))
+        runs = []
+        for update in ('sequential', 'synchronous'):
+            agents = make_agents(values, 1, 4)
+            sim = basicsim.Simulation(Grid.from_array(values), agents,
+                                      {'NAVIGATION': 'flow', 'UPDATE': update})
+            sim.run(30)
+            runs.append(agents[0].move_history)
+        assert runs[0] == runs[1]
+
+    def test_tiled(self):
+        rng = np.random.default_rng(6)
+        values = rng.choice([0] * 20 + [2, 3, NODATA], size=(30, 30))
+        results = []
+        for tiles in ('1', '3x2'):
+            agents = make_agents(values, 60, 6)
+            sim = basicsim.Simulation(Grid.from_array(values), agents,
+                                      {'NAVIGATION': 'flow', 'TILES': tiles, 'TILE_WORKERS': 0})
+            sim.run(20)
+            results.append([str(a) for a in agents])
+        assert results[0] == results[1]
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            basicsim.Simulation(Grid(3, 3), [], {'NAVIGATION': 'astar'})
+
+
+class WedgeNavigationTests(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(8)
+        self.values = rng.choice([0] * 30 + [1, 2, 4, NODATA], size=(30, 30))
+
+    def test_matches_next_move(self):
+        sim = basicsim.Simulation(Grid.from_array(self.values),
+                                  make_agents(self.values, 60, 8, max_vision=6),
+                                  {'NAVIGATION': 'wedge'})
+        grid = sim.world.food_grid
+        ys, xs = sim.population.next_moves(grid, sim.occupancy, sums=sim.world.food_sums)
+
+        for a, exp in zip(sim.agents, zip(ys.tolist(), xs.tolist())):
+            view = grid.view(*a.coords, size=a.vision)
+            assert a.next_move(view, sim.adjacent_agents(a), wedges=True) == exp
+
+    def test_heads_for_most_food(self):
+        # one big cell to the north east, more food in small cells to the south
+        values = np.zeros((9, 9), dtype=int)
+        values[0, 8] = 9
+        values[7:, 3:6] = 2
+        agent = basicsim.BasicAgent(0, 4, 1, 20, (4, 4))
+        sim = basicsim.Simulation(Grid.from_array(values), [agent], {'NAVIGATION': 'wedge'})
+        sim.do_round()
+        assert agent.coords == (5, 4)
+
+        agent = basicsim.BasicAgent(0, 4, 1, 20, (4, 4))
+        sim = basicsim.Simulation(Grid.from_array(values), [agent])
+        sim.do_round()
+        assert agent.coords == (3, 5)
+
+    def test_sums_follow_harvests_and_regrowth(self):
+        agents = make_agents(self.values, 80, 9, max_vision=4)
+        sim = basicsim.Simulation(Grid.from_array(self.values), agents,
+                                  {'NAVIGATION': 'wedge', 'RECOVERY_RATE': 1})
+        world = sim.world
+        sim.run(10)
+        world.refresh_sums()
+        ys, xs = np.divmod(np.arange(30 * 30), 30)
+        sums = world.food_sums.wedge_sums(ys, xs, 4)
+        world.food_sums.rebuild()
+        npt.assert_array_equal(sums, world.food_sums.wedge_sums(ys, xs, 4))
+
+    def test_tiled(self):
+        results = []
+        for tiles in (None, '1', '3x2'):
+            agents = make_agents(self.values, 60, 10, max_vision=5)
+            sim = basicsim.Simulation(Grid.from_array(self.values), agents,
+                                      {'NAVIGATION': 'wedge', 'UPDATE': 'synchronous',
+                                       'TILES': tiles, 'TILE_WORKERS': 0})
+            sim.run(20)
+            results.append([str(a) for a in agents])
+        assert results[0] == results[1] == results[2]
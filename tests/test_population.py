@@ -0,0 +1,172 @@
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from agent import basicsim
+from agent import components
+from agent.population import AgentPopulation, NOWHERE, resolve_conflicts
+
+
+def make_population():
+    population = AgentPopulation()
+    population.append(0, vision=1, metabolism=2, energy=10, coords=(1,1))
+    population.append(1, vision=2, metabolism=1, energy=0, coords=(2,3))
+    population.append(2, vision=1, metabolism=1, energy=5)
+    return population
+
+
+def test_fields():
+    population = make_population()
+    assert len(population) == 3
+    npt.assert_equal(population.energy, [10, 0, 5])
+    npt.assert_equal(population.y, [1, 2, NOWHERE])
+    assert population.coords(0) == (1,1)
+    assert population.coords(2) is None
+
+
+def test_field_views():
+    # fields are views, writes go straight to the population
+    population = make_population()
+    population.energy[0] += 100
+    assert population.get('energy', 0) == 110
+    assert population.init_energy[0] == 10
+
+
+def test_live_slots():
+    population = make_population()
+    npt.assert_equal(population.live_slots(), [0, 2])
+
+
+def test_agent_view():
+    agent = basicsim.BasicAgent(_id=3, vision=1, metabolism=1, energy=5, coords=(0,0))
+    population = agent._population
+    agent.energy = 200  # not capped by grid dtypes
+    assert population.energy[agent._slot] == 200
+    agent.coords = (0,1)
+    assert population.coords(agent._slot) == (0,1)
+
+
+class NextMovesTests(unittest.TestCase):
+    """Batched decisions should match BasicAgent.next_move() for every agent."""
+
+    def test_matches_next_move(self):
+        rng = np.random.default_rng(42)
+        values = rng.choice([0, 0, 0, 1, 2, 3], size=(12, 12))
+        grid = components.Grid(12, 12)
+        grid[:, :] = values
+
+        coords = rng.choice(144, size=40, replace=False)
+        agents = [basicsim.BasicAgent(i, 1, 1, 10, (int(c) // 12, int(c) % 12))
+                  for i, c in enumerate(coords)]
+
+        sim = basicsim.Simulation(grid, agents)
+        ys, xs = sim.population.next_moves(grid, sim.occupancy)
+
+        for a, exp in zip(agents, zip(ys.tolist(), xs.tolist())):
+            view = grid.view(*a.coords, size=1)
+            assert a.next_move(view, sim.adjacent_agents(a)) == exp
+
+    def test_vision_matches_next_move(self):
+        rng = np.random.default_rng(7)
+        values = rng.choice([0] * 12 + [1, 2, 3], size=(16, 16))
+        grid = components.Grid(16, 16)
+        grid[:, :] = values
+
+        coords = rng.choice(256, size=40, replace=False)
+        agents = [basicsim.BasicAgent(i, 1 + i % 3, 1, 10, (int(c) // 16, int(c) % 16))
+                  for i, c in enumerate(coords)]
+
+        sim = basicsim.Simulation(grid, agents)
+        grid = sim.world.food_grid
+        assert grid.border_size == 3
+        ys, xs = sim.population.next_moves(grid, sim.occupancy)
+
+        for a, exp in zip(agents, zip(ys.tolist(), xs.tolist())):
+            view = grid.view(*a.coords, size=a.vision)
+            assert a.next_move(view, sim.adjacent_agents(a)) == exp
+
+    def test_step_towards_food(self):
+        population = AgentPopulation()
+        population.append(0, 2, 1, 10, (2,2))
+        grid = components.Grid(5, 5, border=2)
+        grid[4, 0] = 2
+        grid[0, 4] = 3  # best visible cell wins
+
+        ys, xs = population.next_moves(grid)
+        assert (ys[0], xs[0]) == (1,3)
+
+    def test_no_occupancy(self):
+        population = AgentPopulation()
+        population.append(0, 1, 1, 10, (1,1))
+        population.append(5, 1, 1, 10, (2,0))
+        grid = components.Grid(3, 3)
+        grid[0, 2] = 4
+
+        ys, xs = population.next_moves(grid)
+        npt.assert_equal(ys, [0, 1])
+        npt.assert_equal(xs, [2, 0])  # food NE, search SW for id=5 avoids NODATA
+
+
+class RandomAgentsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = components.Grid(20, 30)
+        self.grid[:, :] = 1
+        self.grid[5, :] = components.NODATA
+
+    def test_seeded(self):
+        a = basicsim.generate_agents_random(self.grid, 50, seed=3)
+        b = basicsim.generate_agents_random(self.grid, 50, seed=3)
+        assert [str(x) for x in a] == [str(x) for x in b]
+        assert len(a) == 50
+
+    def test_placement(self):
+        occupied = np.zeros(self.grid.shape, dtype=bool)
+        occupied[:, :10] = True
+        pop = basicsim.generate_agents_random(self.grid, 380, seed=0, occupied=occupied,
+                                              population=True)
+        cells = set(zip(pop.y.tolist(), pop.x.tolist()))
+        assert len(cells) == 380  # every free cell, once
+        assert not (pop.y == 5).any()
+        assert (pop.x >= 10).all()
+
+        with self.assertRaises(ValueError):
+            basicsim.generate_agents_random(self.grid, 381, occupied=occupied)
+
+    def test_distributions(self):
+        pop = basicsim.generate_agents_random(
+            self.grid, 100, seed=1, vision=3, metabolism=(2, 4),
+            energy=lambda rng, size: rng.poisson(20, size) + 1, population=True)
+        assert (pop.vision == 3).all()
+        assert pop.metabolism.min() >= 2 and pop.metabolism.max() <= 4
+        assert (pop.energy > 0).all()
+        npt.assert_equal(pop.init_energy, pop.energy)
+        assert pop.history.moves(7) == [pop.coords(7)]
+
+    def test_population_matches_agents(self):
+        agents = basicsim.generate_agents_random(self.grid, 40, seed=5)
+        pop = basicsim.generate_agents_random(self.grid, 40, seed=5, population=True)
+        npt.assert_equal(pop.energy, [a.energy for a in agents])
+        assert [pop.coords(i) for i in range(40)] == [a.coords for a in agents]
+
+    def test_simulation_from_population(self):
+        agents = basicsim.generate_agents_random(self.grid, 40, seed=5)
+        pop = basicsim.generate_agents_random(self.grid, 40, seed=5, population=True)
+        sim = basicsim.Simulation(self.grid, agents)
+        psim = basicsim.Simulation(self.grid, pop)
+        assert psim.population is pop
+        sim.run(15)
+        psim.run(15)
+
+        assert [str(a) for a in psim.agents] == [str(a) for a in sim.agents]
+        assert psim.agents[3] is psim.agents[3]
+        assert psim.agents[3].move_history == sim.agents[3].move_history
+        assert psim.dead_by_round == sim.dead_by_round
+
+
+def test_resolve_conflicts():
+    ys = np.array([0, 1, 0, 2, 0])
+    xs = np.array([0, 1, 0, 2, 0])
+    wins = resolve_conflicts(ys, xs, ncols=3, priority=np.array([5, 0, 2, 1, 2]))
+    assert wins.tolist() == [False, True, True, True, False]
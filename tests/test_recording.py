@@ -0,0 +1,87 @@
+import os
+import tempfile
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+from PIL import Image
+
+from agent import recording
+from agent import runlog
+
+from helpers import make_simulation
+
+
+@pytest.fixture
+def tmp_dir():
+    with tempfile.TemporaryDirectory() as _dir:
+        yield _dir
+
+
+def test_frames_match_simulation(tmp_dir):
+    path = os.path.join(tmp_dir, 'run.npz')
+    sim = make_simulation({'VIZ_RECORDING': path})
+    ref = make_simulation()
+
+    states = [(ref.world.food_grid[:, :].copy(), ref.population.y.copy(), ref.population.x.copy())]
+    for _ in range(30):
+        ref.do_round()
+        alive = ref.population.energy > 0
+        states.append((ref.world.food_grid[:, :].copy(), ref.population.y[alive],
+                       ref.population.x[alive]))
+
+    sim.run(30)
+    replay = recording.Replay(path)
+    assert len(replay) == 31
+
+    for r in (0, 1, 17, 30):
+        grid, ys, xs = replay.frame(r)
+        npt.assert_equal(grid, states[r][0])
+        npt.assert_equal(ys, states[r][1])
+        npt.assert_equal(xs, states[r][2])
+
+    for r, grid, ys, xs in replay.frames(stride=10):
+        npt.assert_equal(grid, states[r][0])
+        npt.assert_equal(xs, states[r][2])
+
+    with pytest.raises(IndexError):
+        replay.frame(31)
+
+
+def test_sparse_deltas(tmp_dir):
+    path = os.path.join(tmp_dir, 'run.npz')
+    sim = make_simulation({'VIZ_RECORDING': path})
+    sim.run(10)
+
+    with np.load(path) as data:
+        assert data['keyframe'].shape == sim.world.food_grid.shape
+        assert len(data['move_slot']) <= 10 * len(sim.agents)
+        assert len(data['cell_round']) < 10 * sim.world.food_grid.ncols
+
+
+def test_with_run_log(tmp_dir):
+    # the run log & recorder share each round's changed cells
+    path = os.path.join(tmp_dir, 'run.npz')
+    log_path = os.path.join(tmp_dir, 'run.runlog')
+    sim = make_simulation({'VIZ_RECORDING': path})
+    with runlog.RunLogWriter(log_path) as log:
+        sim.run(15, log)
+
+    grid, _, _ = recording.Replay(path).frame(15)
+    npt.assert_equal(grid, runlog.RunLogReader(log_path).grid_at(15))
+    npt.assert_equal(grid, sim.world.food_grid[:, :])
+
+
+def test_export(tmp_dir):
+    path = os.path.join(tmp_dir, 'run.npz')
+    make_simulation({'VIZ_RECORDING': path}).run(5)
+    replay = recording.Replay(path)
+
+    paths = replay.export_pngs(tmp_dir, scale=2, stride=2)
+    assert [os.path.basename(p) for p in paths] == ['000000.png', '000002.png', '000004.png']
+    image = np.array(Image.open(paths[0]))
+    assert image.shape == tuple(2 * i for i in replay.keyframe.shape)
+
+    gif = os.path.join(tmp_dir, 'run.gif')
+    recording.main([path, '--gif', gif, '--scale', '1'])
+    assert Image.open(gif).n_frames == 6
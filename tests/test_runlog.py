@@ -0,0 +1,76 @@
+import os
+import tempfile
+from io import StringIO
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from agent import runlog
+
+from helpers import make_simulation
+
+
+def run_logged_simulation(path, rounds=40):
+    sim = make_simulation()
+    with runlog.RunLogWriter(path) as log:
+        sim.run(rounds, log)
+    return sim
+
+
+@pytest.fixture
+def log_path():
+    with tempfile.TemporaryDirectory() as _dir:
+        yield os.path.join(_dir, 'test.runlog')
+
+
+def test_rounds(log_path):
+    sim = run_logged_simulation(log_path)
+    reader = runlog.RunLogReader(log_path)
+
+    assert reader.nagents == 25
+    assert reader.final_round == sim.final_round
+    assert len(reader.rounds) == sim.final_round + 1  # includes start state
+    assert isinstance(reader.rounds, np.memmap)
+    npt.assert_equal(reader.rounds['energy'][-1], sim.population.energy)
+    npt.assert_equal(reader.rounds['y'][-1], sim.population.y)
+
+
+def test_grid_at(log_path):
+    sim = run_logged_simulation(log_path)
+    reader = runlog.RunLogReader(log_path)
+    npt.assert_equal(reader.grid_at(reader.final_round), sim.world.food_grid[:, :])
+    npt.assert_equal(reader.grid_at(0), sim.world.orig_food_grid[:, :])
+    assert (reader.cells_for(3)['round'] == 3).all()
+
+
+def test_render_report(log_path):
+    sim = run_logged_simulation(log_path)
+    out = StringIO()
+    runlog.render_report(runlog.RunLogReader(log_path), out)
+    exp = StringIO()
+    sim.report(exp)
+
+    # same per turn stats & agent histories as the in memory report
+    text = out.getvalue()
+    assert text.split('\nLive')[0] == exp.getvalue().split('\nLive')[0]
+
+    for a in sim.agents:
+        assert 'Energy harvests: {}'.format(a.harvest_history) in text
+        assert 'Moves: {}'.format(a.move_history) in text
+
+
+def test_not_a_log(log_path):
+    with open(log_path, 'wb') as fd:
+        fd.write(b'garbage' * 10)
+
+    with pytest.raises(IOError):
+        runlog.RunLogReader(log_path)
+
+
+def test_close_stops_tracking(log_path):
+    # later runs without a log don't queue changes of the food grid
+    sim = run_logged_simulation(log_path, rounds=5)
+    assert not sim.world.track_changes
+    sim.run(20)
+    assert sim.world._changes == []
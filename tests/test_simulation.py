@@ -1,9 +1,14 @@
 import unittest
+import tracemalloc
 from io import StringIO
 
+import numpy as np
+
 from agent import components
 from agent.basicsim import BasicAgent, Simulation
 
+from helpers import make_simulation
+
 
 def generate_basic_simulation():
     food_grid = components.Grid.from_file(StringIO(DATA))
@@ -51,6 +56,103 @@ def test_adjacent_agents():
     assert res == {5:agent2, 7: agent3}
 
 
+def test_adjacent_agents_follow_moves():
+    sim = generate_basic_simulation()
+    agent2 = BasicAgent(_id=1, vision=1, metabolism=2, energy=33, coords=(3,1))
+    sim.agents += [agent2]
+    agent2.coords = (3,3)
+    assert sim.adjacent_agents(sim.agents[0]) == {3:agent2}
+    assert sim.occupancy[3,3] == 1
+    assert not sim.occupancy.is_occupied((3,1))
+
+
+def test_deaths_by_round():
+    sim = generate_basic_simulation()
+    starving = BasicAgent(_id=1, vision=1, metabolism=3, energy=5, coords=(3,4))
+    dead = BasicAgent(_id=2, vision=1, metabolism=1, energy=0, coords=(3,0))
+    sim.agents += [starving, dead]
+    assert sim.num_live == 2
+    assert sim.dead_by_round == {0: [2]}
+
+    sim.do_round()
+    assert sim.num_live == 2
+    sim.do_round()
+    assert sim.num_live == 1
+    assert sim.live_agents == [sim.agents[0]]
+    assert sim.dead_by_round == {0: [2], 2: [1]}
+    assert sim.dead_agents == [dead, starving]
+    assert sim.num_dead_agents == [1, 2]
+
+
+def test_energy_set_dead():
+    # agents run down through the agent API leave the live agents at once
+    sim = generate_basic_simulation()
+    starving = BasicAgent(_id=1, vision=1, metabolism=3, energy=5, coords=(3,4))
+    sim.agents += [starving]
+    sim.do_round()
+    coords = starving.coords
+
+    starving.energy = 0
+    assert sim.num_live == 1
+    assert sim.live_agents == [sim.agents[0]]
+    assert sim.dead_by_round == {1: [1]}
+    assert not sim.occupancy.is_occupied(coords)
+
+    sim.do_round()
+    assert starving.coords == coords
+    assert sim.num_dead == 1
+
+    sim.agents[0].on_end_turn()  # via the end of turn callback too
+    sim.agents[0].energy = 1
+    sim.agents[0].on_end_turn()
+    assert sim.num_live == 0
+    assert sim.dead_by_round == {1: [1], 2: [0]}
+
+
+def test_history_levels():
+    sim = generate_basic_simulation()
+    sim.run(3)
+    agent = sim.agents[0]
+    assert len(agent.move_history) == 4  # start + 3 moves
+    assert len(agent.harvest_history) == 3
+
+    food_grid = components.Grid.from_file(StringIO(DATA))
+    agent = BasicAgent(_id=0, vision=2, metabolism=1, energy=21, coords=(2,2))
+    sim = Simulation(food_grid, [agent], config={'HISTORY': 'none'})
+    sim.run(3)
+    assert agent.move_history == []
+    assert agent.harvest_history == []
+
+
+def test_vision_round_sequential():
+    # batched decisions must give the same round as agents moving one by one
+    rng = np.random.default_rng(3)
+    values = rng.choice([0] * 10 + [1, 2, 3], size=(14, 14))
+    coords = rng.choice(196, size=50, replace=False)
+
+    def make_sim():
+        agents = [BasicAgent(i, 1 + i % 3, 1, 6, (int(c) // 14, int(c) % 14))
+                  for i, c in enumerate(coords)]
+        return Simulation(components.Grid.from_array(values), agents)
+
+    sim, ref = make_sim(), make_sim()
+    for _ in range(5):
+        sim.do_round()
+
+        for a in ref.live_agents:
+            view = ref.world.food_grid.view(*a.coords, size=a.vision)
+            a.coords = a.next_move(view, ref.adjacent_agents(a))
+            a.energy += ref.world.harvest(a.coords)
+            a.on_end_turn()
+            if a.energy <= 0:
+                ref.occupancy.remove(a._slot, a.coords)
+        ref._live_slots = ref.population.live_slots()
+        ref.world.on_end_round()
+
+        assert [a.coords for a in sim.agents] == [a.coords for a in ref.agents]
+        assert [a.energy for a in sim.agents] == [a.energy for a in ref.agents]
+
+
 class HarvestTests(unittest.TestCase):
 
     def setUp(self):
@@ -78,3 +180,90 @@ DATA = '''21000
 00000
 00000
 '''
+
+
+class ProfilingTests(unittest.TestCase):
+
+    def test_disabled(self):
+        sim = Simulation(components.Grid.from_file(StringIO(DATA)), [])
+        assert not sim.profiler.enabled
+
+    def test_phases(self):
+        sim = make_simulation({'PROFILE': '1'})
+        sim.run(10)
+        prof = sim.profiler
+
+        assert len(prof.rounds) == 10
+        for phase in ('decide', 'move', 'harvest', 'history', 'stats', 'regrowth'):
+            assert prof.totals[phase] > 0
+        assert prof.counts['harvest'] == sum(len(a.harvest_history) for a in sim.agents)
+        assert len(prof.per_round('decide')) == 10
+
+        out = StringIO()
+        prof.report(out)
+        assert 'decide' in out.getvalue()
+        assert set(prof.as_dict()) == {'totals', 'counts', 'rounds', 'memory_growth'}
+
+    def test_memory(self):
+        sim = make_simulation({'PROFILE': 'memory'})
+        try:
+            sim.run(20)
+            growth = sim.profiler.memory_growth()
+            assert growth and all(isinstance(size, int) for _, size in growth)
+        finally:
+            sim.close()
+        assert not tracemalloc.is_tracing()
+
+
+class SynchronousTests(unittest.TestCase):
+
+    def make_simulation(self, config):
+        # two agents next to the only food cell, the second with more energy
+        food_grid = components.Grid.from_array([[0, 0, 0], [0, 4, 0], [0, 0, 0]])
+        agents = [BasicAgent(_id=0, vision=1, metabolism=1, energy=5, coords=(0, 1)),
+                  BasicAgent(_id=1, vision=1, metabolism=1, energy=20, coords=(2, 1))]
+        return Simulation(food_grid, agents, dict(config, UPDATE='synchronous'))
+
+    def test_order(self):
+        sim = self.make_simulation({})
+        sim.do_round()
+        a, b = sim.agents
+        assert a.coords == (1, 1) and a.energy == 8
+        assert b.coords == (2, 1) and b.energy == 19  # lost the cell & waited
+        assert b.move_history == [(2, 1), (2, 1)]
+
+    def test_energy(self):
+        sim = self.make_simulation({'CONFLICT': 'energy'})
+        sim.do_round()
+        a, b = sim.agents
+        assert a.coords == (0, 1) and a.energy == 4
+        assert b.coords == (1, 1) and b.energy == 23
+
+    def test_random_is_seeded(self):
+        winners = set()
+        for seed in range(8):
+            results = []
+            for _ in range(2):
+                sim = self.make_simulation({'CONFLICT': 'random', 'CONFLICT_SEED': seed})
+                sim.do_round()
+                results.append([a.coords for a in sim.agents])
+            assert results[0] == results[1]
+            winners.add(results[0][0] == (1, 1))
+        assert winners == {True, False}
+
+    def test_unknown_settings(self):
+        with self.assertRaises(ValueError):
+            self.make_simulation({'CONFLICT': 'oldest'})
+        with self.assertRaises(ValueError):
+            Simulation(components.Grid.from_file(StringIO(DATA)), [], {'UPDATE': 'async'})
+        with self.assertRaises(ValueError):
+            Simulation(components.Grid.from_file(StringIO(DATA)), [],
+                       {'UPDATE': 'sequential', 'TILES': '2x2', 'TILE_WORKERS': 0})
+
+    def test_full_run(self):
+        sim = make_simulation({'UPDATE': 'synchronous'})
+        sim.run(50)
+        tiled = make_simulation({'TILES': '2x2', 'TILE_WORKERS': 0})
+        tiled.run(50)
+        assert [str(a) for a in sim.agents] == [str(a) for a in tiled.agents]
+        assert sim.dead_by_round == tiled.dead_by_round
@@ -0,0 +1,163 @@
+import os
+import csv
+import json
+import tempfile
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from agent import basicsim
+from agent import stats
+
+from helpers import make_simulation
+
+
+def test_streaming_histogram():
+    rng = np.random.default_rng(1)
+    hist = stats.StreamingHistogram()
+    values = []
+    for size in (10, 200, 3):
+        batch = rng.integers(0, 50 * size, size)
+        hist.add(batch)
+        values.extend(batch)
+
+    assert hist.total == len(values)
+    npt.assert_array_equal(hist.counts, np.bincount(values))
+    for q in (0, 10, 50, 90, 100):
+        assert hist.percentile(q) == np.percentile(values, q, method='lower')
+
+
+def test_histogram_bins():
+    hist = stats.StreamingHistogram(bin_width=10)
+    hist.add([0, 9, 10, 35])
+    npt.assert_array_equal(hist.counts, [2, 1, 0, 1])
+    npt.assert_array_equal(hist.edges, [0, 10, 20, 30])
+    assert hist.percentile(50) == 0
+    assert hist.percentile(100) == 30
+
+
+class StatsEngineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_defaults(self):
+        sim = make_simulation()
+        sim.run(5)
+        assert list(sim.stats.series) == ['round', 'average_energy', 'average_metabolism',
+                                          'num_dead_agents']
+        assert sim.stats.series['round'] == [1, 2, 3, 4, 5]
+        live = sim._live_slots
+        assert sim.average_energy[-1] == round(float(sim.population.energy[live].mean()), 2)
+
+    def test_register(self):
+        sim = make_simulation({'STATS_METRICS': 'num_live, energy'})
+        sim.stats.register('max_vision', lambda sample: int(sample.vision.max()))
+        sim.run(3)
+        row = sim.stats.last
+        energy = sim.population.energy[sim._live_slots]
+        assert row['num_live'] == sim.num_live
+        assert row['energy_p50'] == np.percentile(energy, 50)
+        assert row['max_vision'] == 2
+        assert sim.average_energy == []
+
+        with self.assertRaises(ValueError):
+            sim.stats.register('num_live', stats.num_live)
+        with self.assertRaises(ValueError):
+            make_simulation({'STATS_METRICS': 'nope'})
+
+    def test_interval(self):
+        sim = make_simulation({'STATS_INTERVAL': '4'})
+        sim.run(10)
+        assert sim.stats.series['round'] == [4, 8]
+
+    def test_csv_sink(self):
+        path = os.path.join(self.tmp.name, 'stats.csv')
+        sim = make_simulation({'STATS_SINK': path, 'STATS_INTERVAL': '2'})
+        sim.run(6)
+        assert sim.stats.series == {}  # not kept in memory
+
+        with open(path) as fd:
+            rows = list(csv.DictReader(fd))
+        assert [int(r['round']) for r in rows] == [2, 4, 6]
+        assert float(rows[-1]['average_energy']) == sim.stats.last['average_energy']
+        sim.close()
+
+    def test_sink_truncated(self):
+        path = os.path.join(self.tmp.name, 'stats.csv')
+        with open(path, 'w') as fd:
+            fd.write('old,columns\n1,2\n')
+        sim = make_simulation({'STATS_SINK': path})
+        sim.run(2)
+        sim.close()
+
+        with open(path) as fd:
+            rows = list(csv.DictReader(fd))
+        assert [int(r['round']) for r in rows] == [1, 2]
+
+    def test_sink_append(self):
+        for name in ('stats.csv', 'stats.ndjson'):
+            path = os.path.join(self.tmp.name, name)
+            sink = stats.open_sink(path)
+            sink.write({'round': 1, 'a': 2})
+            sink.close()
+
+            sink = stats.open_sink(path, append=True)
+            sink.write({'round': 2, 'a': 3})
+            sink.close()
+            with open(path) as fd:
+                assert len(fd.read().splitlines()) == (3 if name.endswith('.csv') else 2)
+
+            sink = stats.open_sink(path, append=True)
+            with self.assertRaises(ValueError):
+                sink.write({'round': 3, 'b': 3})
+            sink.close()
+
+    def test_ndjson_sink(self):
+        path = os.path.join(self.tmp.name, 'stats.ndjson')
+        sim = make_simulation({'STATS_SINK': path, 'STATS_KEEP': '1',
+                               'STATS_METRICS': 'energy_histogram'})
+        sim.run(3)
+        sim.close()
+
+        with open(path) as fd:
+            rows = [json.loads(line) for line in fd]
+        assert len(rows) == 3
+        assert rows == [dict(zip(sim.stats.series, values))
+                        for values in zip(*sim.stats.series.values())]
+
+    def test_checkpoint(self):
+        config = {'STATS_METRICS': 'energy_histogram,num_live'}
+        ref = make_simulation(config)
+        ref.run(20)
+
+        sim = make_simulation(config)
+        sim.run(10)
+        path = os.path.join(self.tmp.name, 'sim.npz')
+        sim.checkpoint(path)
+        sim = basicsim.Simulation.restore(path)
+        sim.run(10)
+
+        assert sim.stats.series == ref.stats.series
+        npt.assert_array_equal(sim.stats.metrics['energy_histogram'].histogram.counts,
+                               ref.stats.metrics['energy_histogram'].histogram.counts)
+
+    def test_checkpoint_sink(self):
+        # a restored run carries on the file of the checkpointed run
+        path = os.path.join(self.tmp.name, 'stats.csv')
+        sim = make_simulation({'STATS_SINK': path})
+        sim.run(3)
+        checkpoint = os.path.join(self.tmp.name, 'sim.npz')
+        sim.checkpoint(checkpoint)
+        sim.close()
+
+        sim = basicsim.Simulation.restore(checkpoint)
+        sim.run(2)
+        sim.close()
+        with open(path) as fd:
+            rows = list(csv.DictReader(fd))
+        assert [int(r['round']) for r in rows] == [1, 2, 3, 4, 5]
@@ -0,0 +1,52 @@
+import csv
+from io import StringIO
+
+from agent import sweep
+from agent.components import NODATA, Grid
+
+
+GRID = 'data/basic_grid.txt'
+
+
+def test_parameter_grid():
+    params = sweep.parameter_grid(num_agents=[10, 20], RECOVERY_RATE=[1, 2], grid=[GRID])
+    assert len(params) == 4
+    assert params[0] == {'RECOVERY_RATE': 1, 'grid': GRID, 'num_agents': 10}
+
+
+def test_shared_grid():
+    grid = Grid.load(GRID)
+    shared = sweep.SharedGrid(grid)
+    try:
+        view, shm = sweep.SharedGrid.attach(shared.spec)
+        assert (view[:, :] == grid[:, :]).all()
+        assert view.border_size == grid.border_size
+        assert not view._grid.flags.writeable
+        shm.close()
+    finally:
+        shared.close()
+
+
+def test_run_sweep():
+    params = sweep.parameter_grid(grid=[GRID], num_agents=[5, 15], RECOVERY_RATE=[1])
+    out = StringIO()
+    rows = sweep.run_sweep(params, seeds=[0, 1], num_rounds=20, out=out, processes=2)
+
+    assert [r['run'] for r in rows] == [0, 1, 2, 3]
+    assert rows[2]['num_agents'] == 15 and rows[2]['seed'] == 0
+    assert all(r['num_live'] + r['num_dead'] == r['num_agents'] for r in rows)
+
+    table = list(csv.DictReader(StringIO(out.getvalue())))
+    assert len(table) == 4
+    assert set(sweep.SUMMARY_FIELDS) <= set(table[0])
+
+    # same seed, same run when run in process
+    row = sweep.run_one(1, params[0], 1, 20, grid=Grid.load(GRID))
+    assert row == rows[1]
+
+
+def test_run_one_nodata():
+    # more agents than cells with data are capped at the cells with data
+    grid = Grid.from_array([[1, NODATA, 2], [NODATA, 3, NODATA]])
+    row = sweep.run_one(0, {'grid': GRID, 'num_agents': 6}, 0, 2, grid=grid)
+    assert row['num_agents'] == row['num_live'] + row['num_dead'] == 3
@@ -0,0 +1,93 @@
+import unittest
+
+import numpy as np
+import numpy.testing as npt
+
+from agent import basicsim
+from agent import tiled
+from agent.components import Grid
+from agent.population import Y_OFFS, X_OFFS
+
+
+def test_parse_tiles():
+    assert tiled.parse_tiles('4') == (2, 2)
+    assert tiled.parse_tiles(6) == (2, 3)
+    assert tiled.parse_tiles(7) == (1, 7)
+    assert tiled.parse_tiles('3x1') == (3, 1)
+
+
+def test_tile_index():
+    stepper = tiled.TiledStepper((2, 3), processes=0)
+    rows, cols = stepper.edges((5, 7))
+    assert rows.tolist() == [0, 2, 5]
+    assert cols.tolist() == [0, 2, 4, 7]
+
+    tiles = stepper.tile_index(np.array([0, 1, 2, 4, 4]), np.array([0, 2, 3, 4, 6]), (5, 7))
+    assert tiles.tolist() == [0, 1, 4, 5, 5]
+
+
+class TiledSimulationTests(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.grid = Grid.from_array(rng.choice([0, 0, 0, 1, 2, 3, 4], size=(40, 60)))
+
+    def run_sim(self, tiles, workers=0, num_rounds=25):
+        agents = basicsim.generate_agents_random(self.grid, 300, seed=2, vision=(1, 3),
+                                                 population=True)
+        sim = basicsim.Simulation(self.grid, agents, {'TILES': tiles, 'TILE_WORKERS': workers})
+        try:
+            sim.run(num_rounds)
+        finally:
+            sim.close()
+        return sim
+
+    def assert_same(self, sim, other):
+        npt.assert_equal(sim.world.food_grid[:, :], other.world.food_grid[:, :])
+        for name in ('y', 'x', 'energy'):
+            npt.assert_equal(getattr(sim.population, name), getattr(other.population, name))
+        assert sim.dead_by_round == other.dead_by_round
+        assert sim.average_energy == other.average_energy
+
+    def test_decisions_match_untiled(self):
+        sim = self.run_sim('1', num_rounds=0)
+        pop = sim.population
+        slots = sim._live_slots
+        direction = tiled.TiledStepper((3, 4), processes=0).directions(
+            sim.world.food_grid, sim.occupancy, pop.y[slots], pop.x[slots],
+            pop.vision[slots], pop.id[slots])
+
+        ys, xs = pop.next_moves(sim.world.food_grid, sim.occupancy, slots)
+        npt.assert_equal(pop.y[slots] + Y_OFFS[direction], ys)
+        npt.assert_equal(pop.x[slots] + X_OFFS[direction], xs)
+
+    def test_same_for_any_tiling(self):
+        sim = self.run_sim('1')
+        assert sim.round == 25 and sim.num_live
+        self.assert_same(sim, self.run_sim('2x3'))
+        self.assert_same(sim, self.run_sim('4', workers=2))
+
+    def test_one_agent_moves_to_each_cell(self):
+        sim = self.run_sim('4', num_rounds=1)
+        pop = sim.population
+        live = sim._live_slots
+        cells = pop.y[live] * self.grid.ncols + pop.x[live]
+        moved = np.array([pop.history.moves(s)[0] != pop.coords(s) for s in live.tolist()])
+        assert len(np.unique(cells[moved])) == moved.sum()
+
+    def test_state_stays_shared(self):
+        sim = self.run_sim('2x2', num_rounds=0)
+        sim.run(2)
+        arrays = sim.stepper._shared.arrays
+        cells, head = sim.world.layers._cells, sim.occupancy._head
+        energy = sim.population._data['energy']
+        assert cells is arrays['cells'] and head is arrays['head'] and energy is arrays['energy']
+
+        sim.run(2)
+        assert sim.world.layers._cells is cells and sim.population._data['energy'] is energy
+
+        food, cells = sim.world.food_grid, cells.copy()
+        sim.close()
+        assert sim.stepper._shared is None and sim.world.food_grid is food
+        assert sim.world.num_recovering
+        npt.assert_equal(sim.world.layers._cells, cells)
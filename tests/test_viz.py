@@ -1,7 +1,14 @@
+import os
+import tempfile
+import unittest
+
 import numpy as np
 import numpy.testing as npt
+from PIL import Image
 
+from agent import components
 from agent import viz
+from agent.basicsim import BasicAgent, Simulation
 
 
 def test_monochrome_remap():
@@ -23,3 +30,94 @@ def test_upscale():
 
     res = viz.upscale(data, 3)
     npt.assert_equal(exp, res)
+
+
+def test_monochrome_agents():
+    raw = np.array([[1, 2], [3, 9]], dtype=np.int16)
+    agents = [BasicAgent(0, 1, 1, 5, (0,1))]
+    res = viz.monochrome_remap(raw, agents)
+    npt.assert_equal(res, [[200, 0], [100, 0]])  # large values clip to black
+
+
+def test_palette_rgb():
+    palette = viz.Palette.from_levels({1: (10, 20, 30), 2: (40, 50, 60)},
+                                      below=(0, 0, 0), above=(255, 255, 255))
+    assert palette.channels == 3
+    res = palette(np.array([[-128, 1], [2, 3]], dtype=np.int8))
+    assert res.shape == (2, 2, 3)
+    npt.assert_equal(res[0, 1], (10, 20, 30))
+    npt.assert_equal(res[1, 1], (255, 255, 255))
+    npt.assert_equal(res[0, 0], (0, 0, 0))
+
+
+def test_composite():
+    food = np.array([[0, 4]])
+    water = np.array([[2, 0]])
+    res = viz.composite([(food, viz.FOOD_RGBA), (water, viz.WATER_RGBA)])
+    assert res.shape == (1, 2, 3)
+    assert res.dtype == np.uint8
+    npt.assert_equal(res[0, 1], (49, 163, 84))  # water layer transparent
+    assert res[0, 0, 2] > res[0, 0, 0]  # blue water over white
+
+
+def test_upscale_rgb():
+    data = np.arange(12, dtype=np.uint8).reshape(2, 2, 3)
+    res = viz.upscale(data, 2)
+    assert res.shape == (4, 4, 3)
+    npt.assert_equal(res[3, 0], data[1, 0])
+
+
+class SnapshotWriterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.grid = components.Grid(4, 5)
+        self.grid[1, 2] = 3
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_stride(self):
+        with viz.SnapshotWriter(self.tmp.name, stride=2, max_in_flight=1) as writer:
+            for _ in range(5):
+                writer.submit(self.grid, ([0], [0]))
+
+        assert sorted(os.listdir(self.tmp.name)) == ['000001.png', '000003.png', '000005.png']
+
+    def test_frame_copied(self):
+        writer = viz.SnapshotWriter(self.tmp.name, scale=2)
+        writer.submit(self.grid, ([0], [1]))
+        self.grid[1, 2] = 0  # later changes are not in the frame
+        writer.close()
+
+        image = np.array(Image.open(os.path.join(self.tmp.name, '000001.png')))
+        assert image.shape == (8, 10)
+        assert image[0, 2] == 0  # agent
+        assert image[2, 4] == 100
+
+    def test_error(self):
+        _dir = os.path.join(self.tmp.name, 'frames')
+        os.mkdir(_dir)
+        writer = viz.SnapshotWriter(_dir)
+        os.rmdir(_dir)
+        writer.submit(self.grid, ([0], [0]))
+        with self.assertRaises(OSError):
+            writer.flush()
+        writer.close()  # the error is only raised once
+
+    def test_coroutine_flush(self):
+        agents = [BasicAgent(0, 1, 1, 5, (2,2))]
+        snapshots = viz.snapshot_image(self.grid, self.tmp.name)
+        next(snapshots)
+        snapshots.send(agents)
+        snapshots.close()
+        assert os.listdir(self.tmp.name) == ['000001.png']
+
+    def test_simulation(self):
+        agents = [BasicAgent(0, 1, 1, 5, (2,2))]
+        config = {'VIZ_OUTPUT_DIR': self.tmp.name, 'VIZ_STRIDE': '2'}
+        sim = Simulation(self.grid, agents, config)
+        sim.run(4)
+        assert len(os.listdir(self.tmp.name)) == 2
+        sim.close()
+        assert sim.snapshots._pool._shutdown